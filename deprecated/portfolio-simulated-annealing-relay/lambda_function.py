@@ -1,7 +1,6 @@
 
 import json
 import logging
-from datetime import datetime
 
 import numpy as np
 import boto3
@@ -9,6 +8,7 @@ from finsim.data.preader import get_yahoofinance_data
 from finsim.estimate.fit import fit_BlackScholesMerton_model
 from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk, estimate_beta
 from finsim.portfolio import DynamicPortfolioWithDividends
+from finportutils import asof_align
 
 
 def lambda_handler(event, context):
@@ -52,16 +52,13 @@ def lambda_handler(event, context):
         # call wrapper
         df = optimized_dynport.get_portfolio_values_overtime(startdate, enddate, cacheddir=cacheddir)
         indexdf = get_yahoofinance_data(indexsymbol, startdate, enddate, cacheddir=cacheddir)
-        indexdf['TimeStamp'] = indexdf['TimeStamp'].map(lambda item: datetime.strftime(item, '%Y-%m-%d'))
-        indexdf.index = list(indexdf['TimeStamp'])
-        df = df.join(indexdf, on='TimeStamp', how='left', rsuffix='2')
-        df['Close'] = df['Close'].ffill()
         timestamps = np.array(df['TimeStamp'], dtype='datetime64[s]')
+        indexprices = asof_align(timestamps, indexdf['TimeStamp'].to_numpy(), indexdf['Close'].to_numpy())
         prices = np.array(df['value'])
         r, sigma = fit_BlackScholesMerton_model(timestamps, prices)
         downside_risk = estimate_downside_risk(timestamps, prices, 0.)
         upside_risk = estimate_upside_risk(timestamps, prices, 0.)
-        beta = estimate_beta(timestamps, prices, np.array(df['Close']))
+        beta = estimate_beta(timestamps, prices, indexprices)
 
         result = {
             'r': float(r),
@@ -1,7 +1,6 @@
 
 import logging
 import argparse
-from datetime import datetime
 from functools import partial
 
 import numpy as np
@@ -10,6 +9,7 @@ from finsim.estimate.fit import fit_BlackScholesMerton_model
 from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk, estimate_beta
 from finsim.data.preader import get_symbol_closing_price, get_yahoofinance_data
 import pulp
+from finportutils import asof_align
 
 
 logging.basicConfig(level=logging.INFO)
@@ -263,11 +263,8 @@ if __name__ == '__main__':
     df = optimized_dynport.get_portfolio_values_overtime(startdate, enddate, cacheddir=cacheddir)
     # df['TimeStamp'] = df['TimeStamp'].map(lambda item: datetime.strftime(item, '%Y-%m-%d'))
     indexdf = get_yahoofinance_data(indexsymbol, startdate, enddate, cacheddir=cacheddir)
-    indexdf['TimeStamp'] = indexdf['TimeStamp'].map(lambda item: datetime.strftime(item, '%Y-%m-%d'))
-    indexdf.index = list(indexdf['TimeStamp'])
-    df = df.join(indexdf, on='TimeStamp', how='left', rsuffix='2')
-    df['Close'] = df['Close'].ffill()
     timestamps = np.array(df['TimeStamp'], dtype='datetime64[s]')
+    indexprices = asof_align(timestamps, indexdf['TimeStamp'].to_numpy(), indexdf['Close'].to_numpy())
     prices = np.array(df['value'])
     r, sigma = fit_BlackScholesMerton_model(timestamps, prices)
     print('Yield: {}'.format(r))
@@ -276,5 +273,5 @@ if __name__ == '__main__':
     print('Downside risk: {}'.format(downside_risk))
     upside_risk = estimate_upside_risk(timestamps, prices, 0.)
     print('Upside risk: {}'.format(upside_risk))
-    beta = estimate_beta(timestamps, prices, np.array(df['Close']))
+    beta = estimate_beta(timestamps, prices, indexprices)
     print('Beta (relative to {}): {}'.format(indexsymbol, beta))
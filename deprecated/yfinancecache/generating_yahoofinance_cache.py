@@ -6,7 +6,8 @@ import time
 import logging
 
 import pandas as pd
-import finsim.data
+from tqdm import tqdm
+from finportutils import PriceStore, RetryingFetcher, UpstreamUnavailableError
 
 logginglevel_dict = {
     'debug': logging.DEBUG,
@@ -22,9 +23,10 @@ def get_argparser():
     argparser.add_argument('startdate', type=str, help='start date')
     argparser.add_argument('enddate', type=str, help='end data')
     argparser.add_argument('cacheddir', type=str, help='cached directory')
-    argparser.add_argument('--slicebatch', type=int, default=50, help='batch size for each online retrieval')
+    argparser.add_argument('--slicebatch', type=int, default=50,
+                           help='batch size for each online retrieval (unused by the price store)')
     argparser.add_argument('--localsymdf', default=os.path.dirname(__file__), help='location of allsymdf.h5')
-    argparser.add_argument('--waittime', default=5, type=int, help='wait time when connection fails')
+    argparser.add_argument('--waittime', default=5, type=int, help='base wait time of the backoff when connection fails')
     argparser.add_argument('--logginglevel', default='info', help='Logging level (default: info, options: {})'.format(
         ', '.join(logginglevel_dict.keys())))
     return argparser
@@ -51,16 +53,13 @@ if __name__ == '__main__':
     allsymdf = pd.read_hdf(symdfloc, 'fintable')
     concernedsymdf = allsymdf[allsymdf['type'] != '']
 
-    # Generating cache
+    # Generating cache (only the dates not cached yet are downloaded)
     starttime = time.time()
-    finsim.data.preader.generating_cached_yahoofinance_data(
-        list(concernedsymdf['symbol']),
-        startdate,
-        enddate,
-        cacheddir,
-        slicebatch=slicebatch,
-        waittime=waittime,
-        threads=False
-    )
+    pricestore = PriceStore(cacheddir, fetcher=RetryingFetcher(waittime=waittime))
+    for symbol in tqdm(list(concernedsymdf['symbol'])):
+        try:
+            pricestore.get_symbol_data(symbol, startdate, enddate)
+        except UpstreamUnavailableError as error:
+            logging.error('Symbol {} not cached: {}'.format(symbol, error))
     endtime = time.time()
     print('Time elapsed: {} sec'.format(endtime - starttime))
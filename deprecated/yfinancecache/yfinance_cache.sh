@@ -8,4 +8,7 @@ STARTDATE=$1
 ENDDATE=$2
 CACHEDDIR=$3
 
+# finportutils is at the repository root
+export PYTHONPATH=$(dirname $0)/../..:$PYTHONPATH
+
 python generating_yahoofinance_cache.py $STARTDATE $ENDDATE $CACHEDDIR
\ No newline at end of file
@@ -1,23 +1,10 @@
 
 import logging
+import io
 import json
-import os
 
-import boto3
 import pandas as pd
-
-
-lambda_client = boto3.client('lambda')
-
-
-def generate_filename():
-    response = lambda_client.invoke(
-        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:generate_filename',
-        InvocationType='RequestResponse',
-        Payload=json.dumps("")
-    )
-    response_payload = json.load(response['Payload'])
-    return response_payload['body']
+from finportutils import generate_filename, export_extension, write_dataframe, get_artifact_sink
 
 
 def lambda_handler(event, context):
@@ -30,22 +17,24 @@ def lambda_handler(event, context):
     event = json.loads(event['body'])
     dfdict = event['dataframe']
     filebasename = event.get('filebasename')
+    extension = export_extension(event.get('format', 'xlsx'))
 
     df = pd.DataFrame(dfdict)
 
-    # generate Excel file
+    # generate Excel file (or CSV, Parquet or JSON, if asked), written row by row
     filename = generate_filename() if filebasename is None else filebasename
-    filename = filename+'.xlsx'
-    filepath = os.path.join('/', 'tmp', filename)
-    df.to_excel(filepath, index=False)
+    filename = filename+extension
+    buffer = io.BytesIO()
+    write_dataframe(buffer, df, index=False, extension=extension)
 
-    # copy to S3
+    # copy to S3 (from memory)
     s3_bucket = config['bucket']
-    s3_client = boto3.client('s3')
-    response = s3_client.upload_file(filepath, s3_bucket, filename)
+    with get_artifact_sink(s3_bucket) as sink:
+        sink.put(filename, buffer)
+        response = sink.wait()[filename]
 
     event['filename'] = filename
-    event['url'] = 'https://{}.s3.amazonaws.com/{}'.format(s3_bucket, filename)
+    event['url'] = sink.url(filename)
     event['response'] = response
 
     # reference of a lambda output to API gateway: https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html#api-gateway-simple-proxy-for-lambda-output-format
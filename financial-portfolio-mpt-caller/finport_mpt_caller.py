@@ -1,22 +1,21 @@
-
 import json
-import boto3
+from finportutils import generate_filename
 
 
-lambda_client = boto3.client('lambda')
+_lambda_client = None
 
 
-def generate_filename():
-    response = lambda_client.invoke(
-        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:generate_filename',
-        InvocationType='RequestResponse',
-        Payload=json.dumps("")
-    )
-    response_payload = json.load(response['Payload'])
-    return response_payload['body']
+def get_lambda_client():
+    # created on first use, so that prepare_mpt_query can be used without boto3
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+        _lambda_client = boto3.client('lambda')
+    return _lambda_client
 
 
 def call_mpt(query, call_wrapper):
+    lambda_client = get_lambda_client()
     if not call_wrapper:
         response = lambda_client.invoke(
             FunctionName='arn:aws:lambda:us-east-1:409029738116:function:finport',
@@ -24,18 +23,19 @@ def call_mpt(query, call_wrapper):
             Payload=json.dumps({'body': query})
         )
         response_payload = json.load(response['Payload'])
-        return response_payload['body']
+        return response_payload
     else:
         lambda_client.invoke(
             FunctionName='arn:aws:lambda:us-east-1:409029738116:function:finport',
             InvocationType='Event',
             Payload=json.dumps({'body': query})
         )
-        return json.dumps(query)
+        return {'isBase64Encoded': False, 'body': json.dumps(query)}
 
 
-def lambda_handler(event, context):
-    query = json.loads(event['body'])
+def prepare_mpt_query(query):
+    # query of the optimization (defaults filled in), and whether the result is e-mailed
+    # (through the wrapper)
     call_wrapper = False
     query['estimating_startdate'] = query['startdate']
     query['estimating_enddate'] = query['enddate']
@@ -52,13 +52,21 @@ def lambda_handler(event, context):
 
     if call_wrapper and 'filebasename' not in query:
         query['filebasename'] = generate_filename()
+    return query, call_wrapper
+
+
+def lambda_handler(event, context):
+    query, call_wrapper = prepare_mpt_query(json.loads(event['body']))
 
     response = call_mpt(query, call_wrapper)
 
+    # the encoding of the body (response_format in the query) is passed on
     req_res = {
-        'isBase64Encoded': False,
+        'isBase64Encoded': response.get('isBase64Encoded', False),
         'statusCode': 200,
         # 'headers': {'Content-Type': 'application/json'},
-        'body': response
+        'body': response['body']
     }
+    if 'headers' in response:
+        req_res['headers'] = response['headers']
     return req_res
@@ -1,19 +1,34 @@
 
+import os
 import json
 import logging
-import asyncio
 from math import exp
 from operator import itemgetter
-import os
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from finportutils import get_artifact_sink
+
 
-import boto3
+# files of this function, found from this module rather than from the working directory
+thisdir = os.path.dirname(os.path.abspath(__file__))
+CONFIGPATH = os.path.join(thisdir, 'config.json')
+EMAILTEMPLATEPATH = os.path.join(thisdir, 'notification_email.html')
 
+_lambda_client = None
 
-lambda_client = boto3.client('lambda')
+
+def get_lambda_client():
+    # created on first use, so that report_portfolio can be used without boto3
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+        _lambda_client = boto3.client('lambda')
+    return _lambda_client
 
 
 def send_email(sender_email, recipient_email, subject, html):
-    lambda_client.invoke(
+    get_lambda_client().invoke(
         FunctionName='arn:aws:lambda:us-east-1:409029738116:function:send_finport_email',
         InvocationType='Event',
         Payload=json.dumps({
@@ -29,40 +44,53 @@ def convert_expreturn_to_annualreturn(r):  # in the units of year
     return exp(r)-1
 
 
-async def extract_symbol_info(symbol, startdate, enddate):
-    response = lambda_client.invoke(
+def extract_symbols_chunk_info(client, symbols, startdate, enddate):
+    response = client.invoke(
         FunctionName='arn:aws:lambda:us-east-1:409029738116:function:fininfoestimate',
         InvocationType='RequestResponse',
         Payload=json.dumps({
             'body': json.dumps({
-                'symbol': symbol,
+                'symbols': symbols,
                 'startdate': startdate,
                 'enddate': enddate
             })
         })
     )
     response_payload = json.load(response['Payload'])
-    return json.loads(response_payload['body'])
+    if response_payload.get('statusCode') != 200:
+        raise RuntimeError(response_payload.get('body'))
+    body = json.loads(response_payload['body'])
+    for symbol, reason in body['failed'].items():
+        logging.warning('No estimates for {}: {}'.format(symbol, reason))
+    return body['estimations']
 
 
-async def extract_symbols_info(symbols, startdate, enddate):
-    symbols_info = await asyncio.gather(*[
-            extract_symbol_info(symbol, startdate, enddate)
-            for symbol in symbols
-        ])
-    print(symbols_info)
-    symbols_info_dict = {info['symbol']: info for info in symbols_info}
+def extract_symbols_info(symbols, startdate, enddate, chunksize=10, concurrency=8, timeout=60.):
+    # symbols are sent in chunks, the chunks being invoked concurrently; a chunk failing
+    # or timing out (timeout: per invocation) only leaves its symbols without estimates
+    import boto3
+    from botocore.config import Config
+    client = boto3.client(
+        'lambda',
+        config=Config(read_timeout=timeout, retries={'max_attempts': 1}, max_pool_connections=concurrency)
+    )
+    symbols = list(symbols)
+    chunks = [symbols[i:i+chunksize] for i in range(0, len(symbols), chunksize)]
+    symbols_info_dict = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            (chunk, executor.submit(extract_symbols_chunk_info, client, chunk, startdate, enddate))
+            for chunk in chunks
+        ]
+        for chunk, future in futures:
+            try:
+                symbols_info_dict.update(future.result())
+            except Exception as error:
+                logging.error('Estimates of {} failed: {}'.format(', '.join(chunk), error))
     return symbols_info_dict
 
 
-def convert_portfolio_to_table(portfolio_dict, startdate, enddate):
-    symbols_info_dict = asyncio.run(extract_symbols_info(
-        portfolio_dict['timeseries'][0]['portfolio'].keys(),
-        startdate,
-        enddate
-    ))
-    print(symbols_info_dict)
-
+def convert_portfolio_to_table(portfolio_dict, symbols_info_dict):
     html_string = '<table style="width:100%">'
     html_string += '<tr><th>Symbol</th>' + \
                    '<th>Number of Shares</th>' + \
@@ -85,11 +113,18 @@ def convert_portfolio_to_table(portfolio_dict, startdate, enddate):
                         "<th>{rec_enddate:}</th>" + \
                         "<th>{nbrecs:}</th>" + \
                         "</tr>"
+    unavailable_row_html_template = "<tr><th><a href='https://finance.yahoo.com/quote/{symbol:}/'>{symbol:}</a></th>" + \
+                                    "<th>{nbshares:.2f}</th>" + \
+                                    "<th colspan='7'>Estimates unavailable</th>" + \
+                                    "</tr>"
 
     for symbol, nbshares in sorted(
         portfolio_dict['timeseries'][0]['portfolio'].items(),
         key=itemgetter(0)
     ):
+        if symbol not in symbols_info_dict:
+            html_string += unavailable_row_html_template.format(symbol=symbol, nbshares=nbshares)
+            continue
         html_string += row_html_template.format(
             symbol=symbol,
             nbshares=nbshares,
@@ -107,13 +142,33 @@ def convert_portfolio_to_table(portfolio_dict, startdate, enddate):
     return html_string
 
 
-def lambda_handler(event, context):
-    # getting config
-    config = json.load(open('config.json', 'r'))
+def plot_portfolio_with_lambda(plot_query):
+    response = get_lambda_client().invoke(
+        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:finportplot',
+        InvocationType='RequestResponse',
+        Payload=json.dumps({'body': json.dumps(plot_query)})
+    )
+    finportplot_response_payload = json.load(response['Payload'])
+    logging.info(finportplot_response_payload)
+    return json.loads(finportplot_response_payload['body'])
+
+
+def report_portfolio(eventbody, config, plot=None, get_symbols_info=None, send=None):
+    # eventbody: query, result and estimates of the optimization, as Python objects; the stages
+    # (plot, estimates of the symbols, e-mail) are the Lambda functions unless given as functions
+    if plot is None:
+        plot = plot_portfolio_with_lambda
+    if get_symbols_info is None:
+        get_symbols_info = partial(
+            extract_symbols_info,
+            chunksize=config.get('symbolinfo_chunksize', 10),
+            concurrency=config.get('symbolinfo_concurrency', 8),
+            timeout=config.get('symbolinfo_timeout', 60.)
+        )
+    if send is None:
+        send = send_email
 
     # parsing argument
-    eventbody = json.loads(event['body'])
-    print(eventbody)
     query = eventbody['query']
     result = eventbody['result']
     rf = query['rf']
@@ -155,21 +210,26 @@ def lambda_handler(event, context):
         }
     }
 
-    # plot
-    response = lambda_client.invoke(
-        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:finportplot',
-        InvocationType='RequestResponse',
-        Payload=json.dumps({'body': json.dumps(portfolio_dict)})
-    )
-    finportplot_response_payload = json.load(response['Payload'])
-    logging.info(finportplot_response_payload)
-    finportplot_body = json.loads(finportplot_response_payload['body'])
+    # plot (of the values over time computed by the optimization, if given, only the rows
+    # needed for the chart are sent, their spreadsheet being already uploaded)
+    plot_query = dict(portfolio_dict)
+    if result.get('portfolio_values_plotted') is not None:
+        plot_query['data'] = result['portfolio_values_plotted']
+        plot_query['export'] = False
+    elif query.get('resolution') is not None:
+        plot_query['resolution'] = query['resolution']
+    finportplot_body = plot(plot_query)
     image_url = finportplot_body['plot']['url']
-    xlsx_url = finportplot_body['spreadsheet']['url']
+    if result.get('spreadsheet') is not None:
+        xlsx_url = result['spreadsheet']['url']
+    else:
+        xlsx_url = finportplot_body['spreadsheet']['url']
 
     # sending e-mail
-    string_components_portfolio = convert_portfolio_to_table(portfolio_dict['components'], startdate, enddate)
-    notification_email_body = open('notification_email.html', 'r').read().format(
+    symbols_info_dict = get_symbols_info(symbols_nbshares.keys(), startdate, enddate)
+    logging.info(symbols_info_dict)
+    string_components_portfolio = convert_portfolio_to_table(portfolio_dict['components'], symbols_info_dict)
+    notification_email_body = open(EMAILTEMPLATEPATH, 'r').read().format(
         symbols=', '.join(sorted(symbols)),
         runtime_minutes=runtime_minutes,
         runtime_seconds=runtime_seconds,
@@ -198,17 +258,28 @@ def lambda_handler(event, context):
         timeweightedstr='None' if timeweighted_scheme is None else 'exponential with yearscale = {:.4f}'.format(yearscale)
     )
 
-    send_email(sender_email, user_email, "Portfolio Optimization - Computation Result", notification_email_body)
+    send(sender_email, user_email, "Portfolio Optimization - Computation Result", notification_email_body)
 
     # making json to S3
     eventbody['email_body'] = notification_email_body
-    eventbody['portfolio_values_over_time'] = finportplot_body['data']
+    if result.get('portfolio_values_over_time') is not None:
+        eventbody['portfolio_values_over_time'] = result['portfolio_values_over_time']
+    else:
+        eventbody['portfolio_values_over_time'] = finportplot_body['data']
     jsonname = '{}.json'.format(filebasename)
-    jsonpath = os.path.join('/', 'tmp', jsonname)
-    json.dump(eventbody, open(jsonpath, 'w'))
     s3_bucket = config['bucket']
-    s3_client = boto3.client('s3')
-    jsonresponse = s3_client.upload_file(jsonpath, s3_bucket, jsonname)
+    with get_artifact_sink(s3_bucket) as sink:
+        sink.put(jsonname, json.dumps(eventbody))
+        sink.wait()
+
+    return eventbody
+
+
+def lambda_handler(event, context):
+    # getting config
+    config = json.load(open(CONFIGPATH, 'r'))
+
+    eventbody = report_portfolio(json.loads(event['body']), config)
 
     return {
         'statusCode': 200,
@@ -1,24 +1,225 @@
 
 import logging
 import json
+import os
+import io
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import boto3
-from finsim.portfolio.create import get_optimized_portfolio_on_mpt_entropy_costfunction, get_optimized_exponential_timeweighted_portfolio_on_mpt_entropy_costfunction
-from finsim.portfolio.dynamic import DynamicPortfolioWithDividends
-from finsim.estimate.fit import fit_BlackScholesMerton_model
+import pandas as pd
+from finsim.portfolio.portfolio import OptimizedPortfolio
+from finsim.estimate.fit import fit_BlackScholesMerton_model, fit_multivariate_BlackScholesMerton_model
 from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk, estimate_beta
-from finsim.data.preader import get_yahoofinance_data
+from finportutils import get_symbol_data, ResultCache, make_cache_key, normalize_date, normalize_float, \
+    make_initialguess, solve_mpt_entropy_sweep, WarmStartedOptimizedWeightingPolicyUsingMPTEntropyCostFunction, \
+    get_exponential_timeweighted_estimation, build_price_matrix, forward_fill, get_symbols_dividends, \
+    compute_effective_prices, compute_portfolio_values_overtime, asof_align, to_columns, encode_table, make_response, \
+    downsample_records, resample_records, export_extension, write_dataframe, get_artifact_sink, CHART_WIDTH_PIXELS
 
 
-def portfolio_handler(event, context):
-    # getting query
-    query = event['body']
-    print(query)
+def canonicalize_mpt_query(query):
+    # parameters determining the result, normalized, so that resubmissions share a key
+    timeweighted_scheme = query.get('timeweighted_scheme')
+    return {
+        'rf': normalize_float(query['rf']),
+        'symbols': sorted(set(query['symbols'])),
+        'totalworth': normalize_float(query['totalworth']),
+        'presetdate': normalize_date(query['presetdate']),
+        'estimating_startdate': normalize_date(query['estimating_startdate']),
+        'estimating_enddate': normalize_date(query['estimating_enddate']),
+        'riskcoef': normalize_float(query.get('riskcoef', 0.3)),
+        'homogencoef': normalize_float(query.get('homogencoef', 0.1)),
+        'V': normalize_float(query.get('V', 10.0)),
+        'index': query.get('index', '^GSPC'),
+        'timeweighted_scheme': timeweighted_scheme,
+        'yearscale': normalize_float(query.get('yearscale', 1000000.)) if timeweighted_scheme == 'exponential' else None,
+        'include_dividends': bool(query['include_dividends'])
+    }
 
-    # getting parameter
+
+def load_symbols_prices(symbols, estimating_startdate, estimating_enddate, index=None, maxworkers=10):
+    # closing prices of the symbols, fetched once, on the dates any symbol is traded,
+    # forward-filled, with the index as of these dates in the last column; and the
+    # dividends of the symbols
+    allsymbols = symbols + [index] if index is not None else symbols
+    with ThreadPoolExecutor(max_workers=maxworkers) as executor:
+        symdfs = list(executor.map(
+            lambda symbol: get_symbol_data(symbol, estimating_startdate, estimating_enddate),
+            allsymbols
+        ))
+        dividends = executor.submit(get_symbols_dividends, symbols)
+    timestamps, pricematrix = build_price_matrix(symdfs[:len(symbols)])
+    pricematrix = forward_fill(pricematrix)
+    if index is not None:
+        indexprices = asof_align(timestamps, symdfs[-1]['TimeStamp'].to_numpy(), symdfs[-1]['Close'].to_numpy())
+        pricematrix = np.hstack([pricematrix, indexprices[:, None]])
+    return timestamps, pricematrix, dividends.result()
+
+
+def estimate_mpt_inputs(
+        symbols,
+        timestamps,
+        pricematrix,
+        dividends,
+        estimating_startdate,
+        estimating_enddate,
+        timeweighted_scheme,
+        yearscale,
+        include_dividends
+):
+    if timeweighted_scheme == 'exponential':
+        # weighted moments maintained incrementally from the previous runs on the same symbols
+        return get_exponential_timeweighted_estimation(
+            symbols,
+            estimating_startdate,
+            estimating_enddate,
+            yearscale,
+            dividends=dividends if include_dividends else None
+        )
+    else:
+        # as finsim's get_BlackScholesMerton_stocks_estimation, from the dates all symbols have prices
+        symbolprices = pricematrix[:, :len(symbols)]
+        if include_dividends:
+            symbolprices = compute_effective_prices(timestamps, symbolprices, symbols, dividends)
+        firstidx = np.argmax(np.all(~np.isnan(symbolprices), axis=1))
+        return fit_multivariate_BlackScholesMerton_model(timestamps[firstidx:], symbolprices[firstidx:, :].T)
+
+
+def compute_efficient_frontier(
+        rf,
+        symbols,
+        estimating_startdate,
+        estimating_enddate,
+        riskcoefs,
+        homogencoefs,
+        V,
+        timeweighted_scheme,
+        yearscale,
+        include_dividends,
+        nbprocesses=1
+):
+    # inputs estimated once; all (riskcoef, homogencoef) points solved on them
+    starttime = time.time()
+    timestamps, pricematrix, dividends = load_symbols_prices(symbols, estimating_startdate, estimating_enddate)
+    rarray, covmat = estimate_mpt_inputs(
+        symbols,
+        timestamps,
+        pricematrix,
+        dividends,
+        estimating_startdate,
+        estimating_enddate,
+        timeweighted_scheme,
+        yearscale,
+        include_dividends
+    )
+    points, solutions = solve_mpt_entropy_sweep(
+        rarray,
+        covmat,
+        rf,
+        [(riskcoef, homogencoef) for riskcoef in riskcoefs for homogencoef in homogencoefs],
+        V=V,
+        nbprocesses=nbprocesses
+    )
+    frontier = []
+    for (riskcoef, homogencoef), sol in zip(points, solutions):
+        weights = sol.x[:-1] / np.sum(sol.x[:-1])
+        frontier.append({
+            'riskcoef': riskcoef,
+            'homogencoef': homogencoef,
+            'yield': float(np.sum(weights * rarray)),
+            'volatility': float(np.sqrt(weights @ covmat @ weights)),
+            'mpt_entropy_costfunction': float(-sol.fun),
+            'weights': {symbol: float(weight) for symbol, weight in zip(symbols, weights)}
+        })
+    endtime = time.time()
+    return {
+        'symbols': symbols,
+        'r': [float(r) for r in rarray],
+        'frontier': frontier,
+        'runtime': endtime - starttime
+    }
+
+
+def compute_optimized_portfolio(
+        rf,
+        symbols,
+        totalworth,
+        presetdate,
+        estimating_startdate,
+        estimating_enddate,
+        riskcoef,
+        homogencoef,
+        V,
+        index,
+        timeweighted_scheme,
+        yearscale,
+        include_dividends,
+        init_weights=None,
+        prior_solution=None
+):
+    starttime = time.time()
+    timestamps, pricematrix, dividends = load_symbols_prices(
+        symbols,
+        estimating_startdate,
+        estimating_enddate,
+        index=index
+    )
+    rarray, covmat = estimate_mpt_inputs(
+        symbols,
+        timestamps,
+        pricematrix,
+        dividends,
+        estimating_startdate,
+        estimating_enddate,
+        timeweighted_scheme,
+        yearscale,
+        include_dividends
+    )
+    # the optimizer starts from the given weights, or the solution of a prior run, if any
+    initialguess = make_initialguess(symbols, V=V, init_weights=init_weights, prior_solution=prior_solution)
+    optimized_weighting_policy = WarmStartedOptimizedWeightingPolicyUsingMPTEntropyCostFunction(
+        rf, rarray, covmat, symbols, riskcoef, homogencoef, V=V, initialguess=initialguess
+    )
+    optimized_portfolio = OptimizedPortfolio(optimized_weighting_policy, totalworth, presetdate)
+    endtime = time.time()
+
+    portfolio_summary = optimized_portfolio.portfolio_summary
+    portfolio_summary['correlation'] = portfolio_summary['correlation'].tolist()
+
+    # value over time, from the prices used in the estimation
+    worthdf = compute_portfolio_values_overtime(
+        timestamps,
+        pricematrix[:, :-1],
+        symbols,
+        optimized_portfolio.symbols_nbshares,
+        dividends,
+        estimating_startdate
+    )
+    prices = worthdf['value'].to_numpy()
+    r, sigma = fit_BlackScholesMerton_model(timestamps, prices)
+    downside_risk = estimate_downside_risk(timestamps, prices, 0.)
+    upside_risk = estimate_upside_risk(timestamps, prices, 0.)
+    beta = estimate_beta(timestamps, prices, pricematrix[:, -1])
+    return {
+        'portfolio': portfolio_summary,
+        'symbols_nbshares': optimized_portfolio.symbols_nbshares,
+        'runtime': endtime - starttime,
+        'solution': optimized_weighting_policy.solution,
+        'values_over_time': to_columns(worthdf),
+        'estimates': {
+            'r': float(r),
+            'sigma': float(sigma),
+            'downside_risk': float(downside_risk),
+            'upside_risk': float(upside_risk),
+            'beta': float(beta) if beta is not None else None
+        }
+    }
+
+
+def run_portfolio_query(query):
+    # the query (defaults filled in) as Python objects; returns the frontier (sweep mode), or the
+    # optimized portfolio, its estimates and values over time (columns)
     rf = query['rf']
     symbols = query['symbols']
     totalworth = query['totalworth']
@@ -32,12 +233,6 @@ def portfolio_handler(event, context):
     timeweighted_scheme = query.get('timeweighted_scheme')
     yearscale = query.get('yearscale', 1000000.)
     include_dividends = query['include_dividends']
-    call_wrapper = False
-    if 'email' in query:
-        assert 'sender_email' in query
-        assert 'filebasename' in query
-        call_wrapper = True
-    print('call wrapper? {}'.format(call_wrapper))
     query['riskcoef'] = riskcoef
     query['homogencoef'] = homogencoef
     print('Including Dividends: {}'.format(include_dividends))
@@ -56,24 +251,39 @@ def portfolio_handler(event, context):
         logging.info('\tYear scale = {:.4f}'.format(yearscale))
     logging.info('Including Dividends: {}'.format(include_dividends))
 
-    # Optimization
-    starttime = time.time()
-    if timeweighted_scheme == 'exponential':
-        optimized_portfolio = get_optimized_exponential_timeweighted_portfolio_on_mpt_entropy_costfunction(
-            rf,
-            symbols,
-            totalworth,
-            presetdate,
-            estimating_startdate,
-            estimating_enddate,
-            yearscale,
-            riskcoef,
-            homogencoef,
-            V=V,
-            include_dividends=include_dividends
-        )
+    # sweep mode: efficient frontier over lists of riskcoef (and homogencoef) values
+    if 'riskcoefs' in query:
+        return {
+            'frontier': compute_efficient_frontier(
+                rf,
+                symbols,
+                estimating_startdate,
+                estimating_enddate,
+                query['riskcoefs'],
+                query.get('homogencoefs', [homogencoef]),
+                V,
+                timeweighted_scheme,
+                yearscale,
+                include_dividends,
+                nbprocesses=query.get('nbprocesses', 1)
+            )
+        }
+
+    # Optimization (results of the same query served from the cache)
+    canonical_query = canonicalize_mpt_query(query)
+    cache_key = make_cache_key(canonical_query)
+    # latest solution for the same symbols, to warm-start the optimizer
+    warmstart_key = make_cache_key({'warmstart': canonical_query['symbols']})
+    resultcache = ResultCache(
+        ttl=float(os.getenv('RESULTCACHE_TTL', 86400.)),
+        maxentries=int(os.getenv('RESULTCACHE_MAXENTRIES', 1000))
+    )
+    cached_result = resultcache.get(cache_key) if query.get('use_cache', True) else None
+    if cached_result is not None:
+        logging.info('Result cache hit: {}'.format(cache_key))
+        result = cached_result
     else:
-        optimized_portfolio = get_optimized_portfolio_on_mpt_entropy_costfunction(
+        result = compute_optimized_portfolio(
             rf,
             symbols,
             totalworth,
@@ -82,76 +292,105 @@ def portfolio_handler(event, context):
             estimating_enddate,
             riskcoef,
             homogencoef,
-            V=V,
-            include_dividends=include_dividends
+            V,
+            index,
+            timeweighted_scheme,
+            yearscale,
+            include_dividends,
+            init_weights=query.get('init_weights'),
+            prior_solution=resultcache.get(warmstart_key) if query.get('warm_start', True) else None
         )
-    endtime = time.time()
+        resultcache.put(cache_key, result)
+        resultcache.put(warmstart_key, result['solution'])
+    return {
+        'portfolio': result['portfolio'],
+        'symbols_nbshares': result['symbols_nbshares'],
+        'runtime': result['runtime'],
+        'estimates': result['estimates'],
+        'values_over_time': result.get('values_over_time'),
+        'cached': cached_result is not None
+    }
 
-    portfolio_summary = optimized_portfolio.portfolio_summary
-    corr = portfolio_summary['correlation']
-    portfolio_summary['correlation'] = [
-        [
-            corr[i, j] for j in range(corr.shape[1])
-        ]
-        for i in range(corr.shape[0])
-    ]
-    event['portfolio'] = portfolio_summary
-    event['symbols_nbshares'] = optimized_portfolio.symbols_nbshares
-    event['runtime'] = endtime - starttime
-
-    # calculate dynamic portfolio
-    dynport = DynamicPortfolioWithDividends(optimized_portfolio.symbols_nbshares, estimating_startdate)
-    df = dynport.get_portfolio_values_overtime(estimating_startdate, estimating_enddate)
-    indexdf = get_yahoofinance_data(index, estimating_startdate, estimating_enddate)
-    indexdf['TimeStamp'] = indexdf['TimeStamp'].map(lambda item: datetime.strftime(item, '%Y-%m-%d'))
-    indexdf.index = list(indexdf['TimeStamp'])
-    df = df.join(indexdf, on='TimeStamp', how='left', rsuffix='2')
-    df['Close'] = df['Close'].ffill()
-    timestamps = np.array(df['TimeStamp'], dtype='datetime64[s]')
-    prices = np.array(df['value'])
-    r, sigma = fit_BlackScholesMerton_model(timestamps, prices)
-    downside_risk = estimate_downside_risk(timestamps, prices, 0.)
-    upside_risk = estimate_upside_risk(timestamps, prices, 0.)
-    beta = estimate_beta(timestamps, prices, np.array(df['Close']))
-    event['estimates'] = {
-        'r': float(r),
-        'sigma': float(sigma),
-        'downside_risk': float(downside_risk),
-        'upside_risk': float(upside_risk),
-        'beta': float(beta) if beta is not None else None
+
+def export_values_over_time(query, values_over_time):
+    # spreadsheet of all the values over time, uploaded here, as the wrapper and the plot
+    # only get them aggregated and downsampled
+    extension = export_extension(query.get('format', 'xlsx'))
+    filename = query['filebasename'] + extension
+    with get_artifact_sink(os.getenv('S3BUCKET')) as sink:
+        buffer = io.BytesIO()
+        write_dataframe(buffer, pd.DataFrame(values_over_time), index=True, extension=extension)
+        sink.put(filename, buffer)
+        responses = sink.wait()
+    return {'filename': filename, 'url': sink.url(filename), 'response': responses[filename]}
+
+
+def make_wrapper_query(query, output, spreadsheet=None):
+    # what the wrapper (e-mail, plot and report) needs of the query and its result: the values
+    # over time at the resolution asked (for the result JSON), and only the rows needed
+    # for the chart (for the plot)
+    result = {
+        'portfolio': output['portfolio'],
+        'symbols_nbshares': output['symbols_nbshares'],
+        'runtime': output['runtime'],
+        'portfolio_values_over_time': None,
+        'portfolio_values_plotted': None,
+        'spreadsheet': spreadsheet
+    }
+    if output['values_over_time'] is not None:
+        worthdf = pd.DataFrame(output['values_over_time'])
+        result['portfolio_values_over_time'] = to_columns(
+            resample_records(worthdf, query.get('resolution', 'daily'), how={'dividend': 'sum'})
+        )
+        result['portfolio_values_plotted'] = to_columns(
+            downsample_records(worthdf, ['stock_value', 'value'], CHART_WIDTH_PIXELS)
+        )
+    return {
+        'query': query,
+        'result': result,
+        'estimates': output['estimates']
     }
 
 
+def portfolio_handler(event, context):
+    # getting query
+    query = event['body']
+    print(query)
+    response_format = query.get('response_format', 'json')
+    call_wrapper = False
+    if 'email' in query:
+        assert 'sender_email' in query
+        assert 'filebasename' in query
+        call_wrapper = True
+    print('call wrapper? {}'.format(call_wrapper))
+
+    output = run_portfolio_query(query)
+    if 'frontier' in output:
+        event['frontier'] = output['frontier']
+        return make_response(event, response_format)
+
+    event['portfolio'] = output['portfolio']
+    event['symbols_nbshares'] = output['symbols_nbshares']
+    event['runtime'] = output['runtime']
+    event['estimates'] = output['estimates']
+    if output['values_over_time'] is not None:
+        event['portfolio_values_over_time'] = encode_table(output['values_over_time'], response_format)
+    else:
+        event['portfolio_values_over_time'] = None
+    event['cached'] = output['cached']
+
     if call_wrapper:
         print('Sending e-mail')
+        spreadsheet = None
+        if output['values_over_time'] is not None:
+            spreadsheet = export_values_over_time(query, output['values_over_time'])
+        import boto3
         lambda_client = boto3.client('lambda')
         lambda_client.invoke(
             FunctionName='arn:aws:lambda:us-east-1:409029738116:function:financial-portfolio-mpt-wrapper',
             InvocationType='Event',
-            Payload=json.dumps({
-                'body': json.dumps({
-                    'query': query,
-                    'result': {
-                        'portfolio': event['portfolio'],
-                        'symbols_nbshares': event['symbols_nbshares'],
-                        'runtime': event['runtime']
-                    },
-                    'estimates': {
-                        'r': float(r),
-                        'sigma': float(sigma),
-                        'downside_risk': float(downside_risk),
-                        'upside_risk': float(upside_risk),
-                        'beta': float(beta) if beta is not None else None
-                    }
-                })
-            })
+            Payload=json.dumps({'body': json.dumps(make_wrapper_query(query, output, spreadsheet=spreadsheet))})
         )
 
     # reference of a lambda output to API gateway: https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html#api-gateway-simple-proxy-for-lambda-output-format
-    req_res = {
-        'isBase64Encoded': False,
-        'statusCode': 200,
-        # 'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps(event)
-    }
-    return req_res
+    return make_response(event, response_format)
@@ -0,0 +1,76 @@
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+from localservices import LocalMailbox, load_module
+
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_argparser():
+    argparser = argparse.ArgumentParser(description='Run the portfolio optimization pipeline in-process.')
+    argparser.add_argument('queryfile', help='path of the query (JSON), as sent to the API')
+    argparser.add_argument('outputdir', help='directory of the uploaded files and the e-mails sent')
+    return argparser
+
+
+def load_stages():
+    # modules of the Lambda functions, their stage functions called directly
+    sys.path.insert(0, repodir)   # for finportutils
+    return {
+        'caller': load_module(os.path.join(repodir, 'financial-portfolio-mpt-caller'), 'finport_mpt_caller'),
+        'finport': load_module(os.path.join(repodir, 'financial-portfolio-mpt'), 'finport_mpt'),
+        'wrapper': load_module(os.path.join(repodir, 'financial-portfolio-mpt-wrapper'), 'finport_mpt_wrapper'),
+        'finportplot': load_module(os.path.join(repodir, 'financial-portfolio-plot'), 'finportplot'),
+        'symbolinfo': load_module(os.path.join(repodir, 'symbol-info-estimation'), 'symbolinfo')
+    }
+
+
+def plot_locally(finportplot, plot_query):
+    # as finportplot's response body: the values over time as columns
+    from finportutils import to_columns
+    output = finportplot.plot_portfolio(plot_query)
+    output['data'] = to_columns(output['data'])
+    return output
+
+
+def run_pipeline(query, outputdir):
+    # the stages of a request, as Python objects from one to the next; files uploaded to S3 are
+    # written into outputdir (through ARTIFACTDIR), and e-mails there as JSON
+    os.environ.setdefault('S3BUCKET', 'local')
+    os.environ['ARTIFACTDIR'] = outputdir   # artifacts written by finportutils' sinks
+    stages = load_stages()
+    mailbox = LocalMailbox(outputdir)
+
+    query, call_wrapper = stages['caller'].prepare_mpt_query(query)
+    output = stages['finport'].run_portfolio_query(query)
+    if call_wrapper and 'frontier' not in output:
+        finport, wrapper = stages['finport'], stages['wrapper']
+        spreadsheet = None
+        if output['values_over_time'] is not None:
+            spreadsheet = finport.export_values_over_time(query, output['values_over_time'])
+        config = json.load(open(wrapper.CONFIGPATH, 'r'))
+        output['report'] = wrapper.report_portfolio(
+            finport.make_wrapper_query(query, output, spreadsheet=spreadsheet),
+            config,
+            plot=lambda plot_query: plot_locally(stages['finportplot'], plot_query),
+            get_symbols_info=lambda symbols, startdate, enddate:
+                stages['symbolinfo'].estimate_symbols_info(list(symbols), startdate, enddate)[0],
+            send=mailbox.send_email
+        )
+    return output
+
+
+if __name__ == '__main__':
+    argparser = get_argparser()
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    query = json.load(open(args.queryfile, 'r'))
+    output = run_pipeline(query, args.outputdir)
+    from finportutils import encode_default   # importable once the stages are loaded
+    print(json.dumps(output, indent=2, default=encode_default))
@@ -0,0 +1,40 @@
+
+import os
+import json
+import random
+import logging
+import importlib.util
+
+
+def load_module(directory, modulename):
+    # module of a Lambda function, loaded from its file (its files are found from its own
+    # __file__, so that the working directory is left as it is)
+    spec = importlib.util.spec_from_file_location(
+        '{}.{}'.format(os.path.basename(directory).replace('-', '_'), modulename),
+        os.path.join(directory, modulename + '.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class LocalMailbox:
+    # stands in for send_finport_email: e-mails are written under outputdir/emails as JSON
+    def __init__(self, outputdir):
+        self.emaildir = os.path.join(outputdir, 'emails')
+
+    def send_email(self, sender_email, recipient_email, subject, html):
+        messageid = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=20))
+        os.makedirs(self.emaildir, exist_ok=True)
+        json.dump(
+            {
+                'MessageId': messageid,
+                'sender': sender_email,
+                'recipient': recipient_email,
+                'subject': subject,
+                'html': html
+            },
+            open(os.path.join(self.emaildir, messageid + '.json'), 'w')
+        )
+        logging.info('E-mail from {} to {} written as {}'.format(sender_email, recipient_email, messageid))
+        return messageid
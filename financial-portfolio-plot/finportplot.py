@@ -1,33 +1,21 @@
 
 import logging
 import os
+import io
 import json
 from datetime import datetime
 
-import boto3
 import pandas as pd
 from finsim.portfolio import DynamicPortfolioWithDividends
-from plotnine import ggplot, aes, geom_line, theme, element_text, scale_x_datetime, labs, ggtitle
-from mizani.breaks import date_breaks
 from dotenv import load_dotenv
+from finportutils import generate_filename, export_extension, write_dataframe, \
+    get_artifact_sink, render_line_chart, RENDERERS, IMAGE_EXTENSIONS, CHART_WIDTH_PIXELS, downsample_series, \
+    resample_records, encode_table, make_response
 
 
 load_dotenv()
 
 
-lambda_client = boto3.client('lambda')
-
-
-def generate_filename():
-    response = lambda_client.invoke(
-        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:generate_filename',
-        InvocationType='RequestResponse',
-        Payload=json.dumps("")
-    )
-    response_payload = json.load(response['Payload'])
-    return response_payload['body']
-
-
 def construct_portfolio(portdict, startdate, enddate):
     if portdict.get('name', '') == 'DynamicPortfolio':
         return DynamicPortfolioWithDividends.load_from_dict(portdict)
@@ -50,52 +38,17 @@ def get_optimal_daybreaks(startdate, enddate):
         return '1 day'
 
 
-def plot_handler(event, context):
-    # getting config
-    s3_bucket = os.getenv('S3BUCKET')
-
-    # getting query
-    logging.info(event)
-    logging.info(context)
-    if isinstance(event['body'], dict):
-        query = event['body']
-    else:
-        query = json.loads(event['body'])
-    startdate = query['startdate']
-    logging.info('start date: {}'.format(startdate))
-    enddate = query['enddate']
-    logging.info('end date: {}'.format(enddate))
-    filebasename = query.get('filebasename')
-    title = query.get('title')
-    filename = generate_filename() if filebasename is None else filebasename
-    imgfilename = filename + '.png'
-    imgfilepath = os.path.join('/', 'tmp', imgfilename)
-    xlsxfilename = filename + '.xlsx'
-    xlsxfilepath = os.path.join('/', 'tmp', xlsxfilename)
-
-    # generate pandas dataframe
-    logging.info('Calculating worth over time')
-    portfolio = construct_portfolio(query['components'], startdate, enddate)
-    print(portfolio.symbols_nbshares)
-    print(portfolio)
-    worthdf = portfolio.get_portfolio_values_overtime(startdate, enddate)
+def plot_with_ggplot(buffer, series, plot_date_interval, title=None):
+    # plotnine imported only for this renderer (seconds at cold start)
+    from plotnine import ggplot, aes, geom_line, theme, element_text, scale_x_datetime, labs, ggtitle
+    from mizani.breaks import date_breaks
 
     # convert dataframe for plotting using plotnine
     plotdf = pd.concat([
-        pd.DataFrame({
-            'TimeStamp': worthdf['TimeStamp'],
-            'value': worthdf['stock_value'],
-            'plot': 'stock price'}),
-        pd.DataFrame({
-            'TimeStamp': worthdf['TimeStamp'],
-            'value': worthdf['value'],
-            'plot': 'stock price+dividend'
-        })
+        pd.DataFrame({'TimeStamp': timestamps, 'value': values, 'plot': label})
+        for label, timestamps, values in series
     ])
 
-    # plot
-    logging.info('plot')
-    plot_date_interval = get_optimal_daybreaks(startdate, enddate)
     plt = (ggplot(plotdf)
            + geom_line(aes('TimeStamp', 'value', color='plot', group=1))
            + theme(axis_text_x=element_text(rotation=90, hjust=1))
@@ -104,36 +57,107 @@ def plot_handler(event, context):
            )
     if title is not None:
         plt += ggtitle(title)
-    plt.save(imgfilepath)
+    plt.save(buffer, format='png')
 
-    # making spreadsheet
-    worthdf.to_excel(xlsxfilepath)
 
-    # copy to S3
-    logging.info('copying to S3')
-    s3_client = boto3.client('s3')
-    imgresponse = s3_client.upload_file(imgfilepath, s3_bucket, imgfilename)
-    xlsxresponse = s3_client.upload_file(xlsxfilepath, s3_bucket, xlsxfilename)
+def plot_portfolio(query):
+    # the query as Python objects; returns the references of the chart and the spreadsheet,
+    # and the values over time (dataframe, at the resolution asked)
+    s3_bucket = os.getenv('S3BUCKET')
+    startdate = query['startdate']
+    logging.info('start date: {}'.format(startdate))
+    enddate = query['enddate']
+    logging.info('end date: {}'.format(enddate))
+    filebasename = query.get('filebasename')
+    title = query.get('title')
+    renderer = query.get('renderer', os.getenv('PLOTRENDERER', 'ggplot'))
+    if renderer not in RENDERERS:
+        raise ValueError('Unknown renderer: {} (options: {})'.format(renderer, ', '.join(RENDERERS)))
+    downsampling = query.get('downsample', 'lttb')    # points plotted, as many as the pixels of the width
+    resolution = query.get('resolution', 'daily')     # returned data: daily, weekly or monthly
+    export = query.get('export', True)               # spreadsheet of the values
+    spreadsheet_extension = export_extension(query.get('format', 'xlsx'))
+    filename = generate_filename() if filebasename is None else filebasename
+    imgfilename = filename + IMAGE_EXTENSIONS[renderer]
+    spreadsheetfilename = filename + spreadsheet_extension
 
-    event['plot'] = {
-        'filename': imgfilename,
-        'url': 'https://{}.s3.amazonaws.com/{}'.format(s3_bucket, imgfilename),
-        'response': imgresponse
-    }
-    event['spreadsheet'] = {
-        'filename': xlsxfilename,
-        'url': 'https://{}.s3.amazonaws.com/{}'.format(s3_bucket, xlsxfilename),
-        'response': xlsxresponse
+    # generate pandas dataframe (unless the values over time are given)
+    if query.get('data') is not None:
+        logging.info('Using given worth over time')
+        worthdf = pd.DataFrame(query['data'])   # records, or columns
+    else:
+        logging.info('Calculating worth over time')
+        portfolio = construct_portfolio(query['components'], startdate, enddate)
+        print(portfolio.symbols_nbshares)
+        print(portfolio)
+        worthdf = portfolio.get_portfolio_values_overtime(startdate, enddate)
+
+    # series to plot (given values over time have their dates as strings)
+    timestamps = pd.to_datetime(worthdf['TimeStamp'])
+    series = [
+        ('stock price', timestamps, worthdf['stock_value']),
+        ('stock price+dividend', timestamps, worthdf['value'])
+    ]
+    # (downsampled to about as many points as the pixels of the width of the chart)
+    series = [
+        (label,) + downsample_series(timestamps, values, CHART_WIDTH_PIXELS, method=downsampling)
+        for label, timestamps, values in series
+    ]
+
+    # plot; the artifacts are rendered in memory, each uploaded as soon as it is ready
+    logging.info('plot ({})'.format(renderer))
+    plot_date_interval = get_optimal_daybreaks(startdate, enddate)
+    with get_artifact_sink(s3_bucket) as sink:
+        imgbuffer = io.BytesIO()
+        if renderer == 'ggplot':
+            plot_with_ggplot(imgbuffer, series, plot_date_interval, title=title)
+        else:
+            render_line_chart(imgbuffer, series, plot_date_interval, title=title, renderer=renderer)
+        sink.put(imgfilename, imgbuffer)
+
+        # making spreadsheet (streamed, in the format asked)
+        if export:
+            spreadsheetbuffer = io.BytesIO()
+            write_dataframe(spreadsheetbuffer, worthdf, index=True, extension=spreadsheet_extension)
+            sink.put(spreadsheetfilename, spreadsheetbuffer)
+
+        # waiting for the uploads to S3
+        logging.info('copying to S3')
+        responses = sink.wait()
+
+    output = {
+        'plot': {
+            'filename': imgfilename,
+            'url': sink.url(imgfilename),
+            'response': responses[imgfilename]
+        },
+        'data': resample_records(worthdf, resolution, how={'dividend': 'sum'})
     }
-    event['data'] = worthdf.to_dict(orient='records')
+    if export:
+        output['spreadsheet'] = {
+            'filename': spreadsheetfilename,
+            'url': sink.url(spreadsheetfilename),
+            'response': responses[spreadsheetfilename]
+        }
+    return output
+
+
+def plot_handler(event, context):
+    # getting query
+    logging.info(event)
+    logging.info(context)
+    if isinstance(event['body'], dict):
+        query = event['body']
+    else:
+        query = json.loads(event['body'])
+    response_format = query.get('response_format', 'json')
+
+    # the input (possibly long values over time) is not sent back
+    output = plot_portfolio(query)
+    output['data'] = encode_table(output['data'], response_format)
 
     # reference of a lambda output to API gateway: https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html#api-gateway-simple-proxy-for-lambda-output-format
-    req_res = {
-        'isBase64Encoded': False,
-        'statusCode': 200,
-        'body': json.dumps(event)
-    }
-    return req_res
+    return make_response(output, response_format)
 
 
 # References:
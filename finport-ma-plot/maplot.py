@@ -2,32 +2,26 @@
 from datetime import datetime
 import json
 import os
+import io
 import logging
 
 from dotenv import load_dotenv
-import boto3
 import pandas as pd
-from finsim.data.preader import get_yahoofinance_data
-from finsim.tech.ma import get_movingaverage_price_data
-from plotnine import ggplot, aes, geom_line, theme, element_text, scale_x_datetime, labs, ggtitle
-from mizani.breaks import date_breaks
+from finportutils import get_movingaverage_prices, generate_filename, export_extension, write_dataframe, \
+    get_artifact_sink, render_line_chart, RENDERERS, IMAGE_EXTENSIONS, CHART_WIDTH_PIXELS, downsample_series, \
+    resample_records, encode_table, make_response
 
 
 logging.basicConfig(level=logging.INFO)
 
-load_dotenv()
-
-lambda_client = boto3.client('lambda')
+# kind of moving average: (label on the plot, column name in the spreadsheet)
+ma_labels = {
+    'simple': ('MA', 'Moving Average'),
+    'exponential': ('EMA', 'Exponential Moving Average'),
+    'weighted': ('WMA', 'Weighted Moving Average')
+}
 
-
-def generate_filename():
-    response = lambda_client.invoke(
-        FunctionName='arn:aws:lambda:us-east-1:409029738116:function:generate_filename',
-        InvocationType='RequestResponse',
-        Payload=json.dumps("")
-    )
-    response_payload = json.load(response['Payload'])
-    return response_payload['body']
+load_dotenv()
 
 
 def get_optimal_daybreaks(startdate, enddate):
@@ -43,6 +37,27 @@ def get_optimal_daybreaks(startdate, enddate):
         return '1 day'
 
 
+def plot_with_ggplot(buffer, series, plot_date_interval, title):
+    # plotnine imported only for this renderer (seconds at cold start)
+    from plotnine import ggplot, aes, geom_line, theme, element_text, scale_x_datetime, labs, ggtitle
+    from mizani.breaks import date_breaks
+
+    # convert dataframe for plotting using plotnine
+    plotdf = pd.concat([
+        pd.DataFrame({'TimeStamp': timestamps, 'value': values, 'plot': label})
+        for label, timestamps, values in series
+    ])
+
+    plt = (ggplot(plotdf)
+           + geom_line(aes('TimeStamp', 'value', color='plot'))
+           + theme(axis_text_x=element_text(rotation=90, hjust=1))
+           + scale_x_datetime(breaks=date_breaks(plot_date_interval))
+           + labs(x='Date', y='value')
+           + ggtitle(title)
+           )
+    plt.save(buffer, format='png')
+
+
 def plot_handler(event, context):
     # getting query
     s3_bucket = os.getenv('S3BUCKET')
@@ -62,81 +77,80 @@ def plot_handler(event, context):
     logging.info('days window: {}'.format(dayswindow))
     if not isinstance(dayswindow, list):
         dayswindow = [dayswindow]
+    dayswindow = sorted(set(dayswindow))
+    ma_type = query.get('ma_type', 'simple')
+    logging.info('moving average: {}'.format(ma_type))
+    plotlabel, columnlabel = ma_labels[ma_type]
+    renderer = query.get('renderer', os.getenv('PLOTRENDERER', 'ggplot'))
+    if renderer not in RENDERERS:
+        raise ValueError('Unknown renderer: {} (options: {})'.format(renderer, ', '.join(RENDERERS)))
+    downsampling = query.get('downsample', 'lttb')    # points plotted, as many as the pixels of the width
+    resolution = query.get('resolution', 'daily')     # returned data: daily, weekly or monthly
+    response_format = query.get('response_format', 'json')
     filebasename = query.get('filebasename')
+    spreadsheet_extension = export_extension(query.get('format', 'xlsx'))
     filename = generate_filename() if filebasename is None else filebasename
-    imgfilename = filename + '.png'
-    imgfilepath = os.path.join('/', 'tmp', imgfilename)
-    xlsxfilename = filename + '.xlsx'
-    xlsxfilepath = os.path.join('/', 'tmp', xlsxfilename)
+    imgfilename = filename + IMAGE_EXTENSIONS[renderer]
+    spreadsheetfilename = filename + spreadsheet_extension
     title = query.get('title', symbol)
 
-    # get data
-    df = get_yahoofinance_data(symbol, startdate, enddate)
-    madfs = {
-        daywindow: get_movingaverage_price_data(symbol, startdate, enddate, daywindow)
-        for daywindow in dayswindow
-    }
-
-    # convert dataframe for plotting using plotnine
-    plotdf = pd.DataFrame({
-        'TimeStamp': df['TimeStamp'],
-        'value': df['Close'],
-        'plot': 'price'
-    })
-    for daywindow, madf in madfs.items():
-        plotdf = pd.concat([
-            plotdf,
-            pd.DataFrame({
-                'TimeStamp': madf['TimeStamp'],
-                'value': madf['MA'],
-                'plot': '{}-day MA'.format(daywindow)
-            })
-        ])
-
-    # plot
-    logging.info('plot')
+    # get data (one download; all the windows computed together)
+    madf = get_movingaverage_prices(symbol, startdate, enddate, dayswindow, kind=ma_type)
+
+    # series to plot (each moving average on the dates it is available)
+    series = [('price', madf['TimeStamp'], madf['Close'])]
+    for daywindow in dayswindow:
+        available = madf[daywindow].notna()
+        series.append((
+            '{}-day {}'.format(daywindow, plotlabel),
+            madf.loc[available, 'TimeStamp'],
+            madf.loc[available, daywindow]
+        ))
+    # (downsampled to about as many points as the pixels of the width of the chart)
+    series = [
+        (label,) + downsample_series(timestamps, values, CHART_WIDTH_PIXELS, method=downsampling)
+        for label, timestamps, values in series
+    ]
+
+    # plot; the artifacts are rendered in memory, each uploaded as soon as it is ready
+    logging.info('plot ({})'.format(renderer))
     plot_date_interval = get_optimal_daybreaks(startdate, enddate)
-    plt = (ggplot(plotdf)
-           + geom_line(aes('TimeStamp', 'value', color='plot'))
-           + theme(axis_text_x=element_text(rotation=90, hjust=1))
-           + scale_x_datetime(breaks=date_breaks(plot_date_interval))
-           + labs(x='Date', y='value')
-           + ggtitle(title)
-           )
-    plt.save(imgfilepath)
-
-    # making spreadsheet
-    outputdf = df[['TimeStamp', 'Close']]
-    outputdf = outputdf.rename(columns={'Close': 'Price'})
-    for daywindow, madf in madfs.items():
-        outputdf = pd.merge(outputdf, madf, on='TimeStamp')
-        outputdf = outputdf.rename(columns={'MA': '{}-day Moving Average'.format(daywindow)})
-    outputdf['TimeStamp'] = outputdf['TimeStamp'].map(lambda ts: ts.date().strftime('%Y-%m-%d'))
-    outputdf = outputdf.rename(columns={'TimeStamp': 'Date'})
-    outputdf.to_excel(xlsxfilepath, engine='openpyxl')
-
-    # copy to S3
-    logging.info('copying to S3')
-    s3_client = boto3.client('s3')
-    imgresponse = s3_client.upload_file(imgfilepath, s3_bucket, imgfilename)
-    xlsxresponse = s3_client.upload_file(xlsxfilepath, s3_bucket, xlsxfilename)
+    with get_artifact_sink(s3_bucket) as sink:
+        imgbuffer = io.BytesIO()
+        if renderer == 'ggplot':
+            plot_with_ggplot(imgbuffer, series, plot_date_interval, title)
+        else:
+            render_line_chart(imgbuffer, series, plot_date_interval, title=title, renderer=renderer)
+        sink.put(imgfilename, imgbuffer)
+
+        # making spreadsheet (on the dates all the moving averages are available)
+        outputdf = madf.dropna(subset=dayswindow).reset_index(drop=True)
+        outputdf = outputdf.rename(columns={'Close': 'Price'})
+        outputdf = outputdf.rename(columns={
+            daywindow: '{}-day {}'.format(daywindow, columnlabel)
+            for daywindow in dayswindow
+        })
+        outputdf['TimeStamp'] = outputdf['TimeStamp'].map(lambda ts: ts.date().strftime('%Y-%m-%d'))
+        outputdf = outputdf.rename(columns={'TimeStamp': 'Date'})
+        spreadsheetbuffer = io.BytesIO()
+        write_dataframe(spreadsheetbuffer, outputdf, index=True, extension=spreadsheet_extension)
+        sink.put(spreadsheetfilename, spreadsheetbuffer)
+
+        # waiting for the uploads to S3
+        logging.info('copying to S3')
+        responses = sink.wait()
 
     event['plot'] = {
         'filename': imgfilename,
-        'url': 'https://{}.s3.amazonaws.com/{}'.format(s3_bucket, imgfilename),
-        'response': imgresponse
+        'url': sink.url(imgfilename),
+        'response': responses[imgfilename]
     }
     event['spreadsheet'] = {
-        'filename': xlsxfilename,
-        'url': 'https://{}.s3.amazonaws.com/{}'.format(s3_bucket, xlsxfilename),
-        'response': xlsxresponse
+        'filename': spreadsheetfilename,
+        'url': sink.url(spreadsheetfilename),
+        'response': responses[spreadsheetfilename]
     }
-    event['data'] = outputdf.to_dict(orient='records')
+    event['data'] = encode_table(resample_records(outputdf, resolution, timecolumn='Date'), response_format)
 
     # reference of a lambda output to API gateway: https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html#api-gateway-simple-proxy-for-lambda-output-format
-    req_res = {
-        'isBase64Encoded': False,
-        'statusCode': 200,
-        'body': json.dumps(event)
-    }
-    return req_res
+    return make_response(event, response_format)
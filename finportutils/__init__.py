@@ -0,0 +1,48 @@
+
+from importlib import import_module
+
+
+# the modules are imported on first use, so that a function needing only the light
+# ones (e.g., filenames) does not have to ship finsim, pandas or scipy
+_exported_names = {
+    'pricestore': ['PriceStore', 'get_symbol_data'],
+    'fetch': ['RetryingFetcher', 'RetryBudget', 'CircuitBreaker', 'UpstreamUnavailableError',
+              'get_yahoofinance_data_with_retry'],
+    'estimate': ['SECONDS_PER_YEAR', 'build_price_matrix', 'estimate_symbols_statistics', 'ledoit_wolf_shrinkage',
+                 'shrink_covariance', 'RollingCovariance', 'rolling_correlations'],
+    'resultcache': ['ResultCache', 'make_cache_key', 'normalize_date', 'normalize_float'],
+    'optimize': ['make_initialguess', 'optimized_portfolio_mpt_entropy_costfunction', 'solve_mpt_entropy_sweep',
+                 'WarmStartedOptimizedWeightingPolicyUsingMPTEntropyCostFunction'],
+    'moments': ['forward_fill', 'ExponentialMomentEngine', 'get_exponential_timeweighted_estimation'],
+    'valuation': ['get_symbols_dividends', 'compute_effective_prices', 'compute_portfolio_values_overtime'],
+    'align': ['asof_indices', 'asof_align', 'asof_align_dataframes'],
+    'filenames': ['ULIDGenerator', 'generate_ulid', 'ulid_timestamp', 'generate_filename'],
+    'export': ['export_extension', 'get_row_writer', 'write_rows', 'write_records', 'write_dataframe'],
+    'movingaverage': ['MA_KINDS', 'moving_averages', 'get_movingaverage_prices'],
+    'charts': ['RENDERERS', 'IMAGE_EXTENSIONS', 'CHART_WIDTH_PIXELS', 'date_locator', 'render_line_chart'],
+    'downsample': ['DOWNSAMPLING_METHODS', 'RESOLUTIONS', 'lttb_indices', 'minmax_indices', 'downsample_series',
+                   'downsample_records', 'resample_records'],
+    'encoding': ['RESPONSE_FORMATS', 'column_to_list', 'to_columns', 'encode_default', 'encode_table',
+                 'make_response', 'decode_response_body'],
+    'artifacts': ['ArtifactSink', 'S3ArtifactSink', 'FileSystemArtifactSink', 'get_artifact_sink'],
+    'parallel': ['process_map'],
+}
+_modules_by_name = {
+    name: modulename
+    for modulename, names in _exported_names.items()
+    for name in names
+}
+
+__all__ = list(_modules_by_name.keys())
+
+
+def __getattr__(name):
+    if name not in _modules_by_name:
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+    value = getattr(import_module('.' + _modules_by_name[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -0,0 +1,39 @@
+
+import numpy as np
+
+
+def to_datetime64(timestamps):
+    # datetime64 (or date strings) as datetime64[s], without going through Python objects
+    return np.array(timestamps, dtype='datetime64[s]')
+
+
+def asof_indices(target_timestamps, source_timestamps, maxlag=None):
+    # for every target timestamp, index of the last source timestamp at or before it
+    # (-1 if none, or if it is older than maxlag); source timestamps are sorted
+    target_timestamps = to_datetime64(target_timestamps)
+    source_timestamps = to_datetime64(source_timestamps)
+    indices = np.searchsorted(source_timestamps, target_timestamps, side='right') - 1
+    if maxlag is not None:
+        lags = target_timestamps - source_timestamps[np.maximum(indices, 0)]
+        indices[lags > maxlag] = -1
+    return indices
+
+
+def asof_align(target_timestamps, source_timestamps, values, maxlag=None):
+    # values (rows along the source timestamps; 1D, or 2D for many series at once) as of
+    # every target timestamp, forward-filled; NaN before the first source timestamp
+    values = np.asarray(values, dtype=np.float64)
+    indices = asof_indices(target_timestamps, source_timestamps, maxlag=maxlag)
+    if len(values) == 0:
+        return np.full((len(indices),) + values.shape[1:], np.nan)
+    aligned = values[np.maximum(indices, 0)]
+    aligned[indices < 0] = np.nan
+    return aligned
+
+
+def asof_align_dataframes(target_timestamps, dfs, column='Close', maxlag=None):
+    # (target dates x dataframes) matrix of the column of every dataframe, as of the target dates
+    aligned = np.full((len(target_timestamps), len(dfs)), np.nan)
+    for j, df in enumerate(dfs):
+        aligned[:, j] = asof_align(target_timestamps, df['TimeStamp'].to_numpy(), df[column].to_numpy(), maxlag=maxlag)
+    return aligned
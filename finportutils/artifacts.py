@@ -0,0 +1,130 @@
+
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+MULTIPART_THRESHOLD = 8*1024*1024
+MULTIPART_CHUNKSIZE = 8*1024*1024
+
+CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.svg': 'image/svg+xml',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.csv': 'text/csv',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.json': 'application/json'
+}
+
+
+def guess_content_type(key):
+    return CONTENT_TYPES.get(os.path.splitext(key)[-1], 'application/octet-stream')
+
+
+class ArtifactSink:
+    # artifacts are rendered into in-memory buffers and handed to the sink, which stores
+    # them in the background (concurrently); wait() returns the responses by key
+    def __init__(self, bucket, maxworkers=4):
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=maxworkers)
+        self.futures = {}
+
+    def store(self, key, buffer):
+        raise NotImplementedError()
+
+    def url(self, key):
+        raise NotImplementedError()
+
+    def put(self, key, data):
+        # data: bytes, str, or a binary buffer (read from its start)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        buffer = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+        buffer.seek(0)
+        self.futures[key] = self.executor.submit(self.store, key, buffer)
+        return self.futures[key]
+
+    def wait(self):
+        responses = {key: future.result() for key, future in self.futures.items()}
+        self.futures = {}
+        return responses
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class S3ArtifactSink(ArtifactSink):
+    # objects above the threshold are uploaded in parts, themselves uploaded concurrently
+    def __init__(
+            self,
+            bucket,
+            s3_client=None,
+            maxworkers=4,
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=4
+    ):
+        super().__init__(bucket, maxworkers=maxworkers)
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        self.s3_client = s3_client
+        from boto3.s3.transfer import TransferConfig
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency
+        )
+
+    def store(self, key, buffer):
+        response = self.s3_client.upload_fileobj(
+            buffer,
+            self.bucket,
+            key,
+            ExtraArgs={'ContentType': guess_content_type(key)},
+            Config=self.transfer_config
+        )
+        logging.info('Uploaded {} to s3://{}'.format(key, self.bucket))
+        return response
+
+    def url(self, key):
+        return 'https://{}.s3.amazonaws.com/{}'.format(self.bucket, key)
+
+
+class FileSystemArtifactSink(ArtifactSink):
+    # for local runs and tests: objects are written under outputdir/<bucket>/<key>
+    def __init__(self, outputdir, bucket=None, maxworkers=4):
+        super().__init__(bucket, maxworkers=maxworkers)
+        self.outputdir = outputdir
+
+    def path(self, key):
+        return os.path.join(self.outputdir, self.bucket if self.bucket is not None else 'local', key)
+
+    def store(self, key, buffer):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            while True:
+                chunk = buffer.read(MULTIPART_CHUNKSIZE)
+                if len(chunk) == 0:
+                    break
+                f.write(chunk)
+        logging.info('Wrote {} to {}'.format(key, path))
+
+    def url(self, key):
+        return 'file://{}'.format(os.path.abspath(self.path(key)))
+
+
+def get_artifact_sink(bucket, **kwargs):
+    # S3, unless a local directory is given by the environment variable ARTIFACTDIR
+    artifactdir = os.getenv('ARTIFACTDIR')
+    if artifactdir is not None:
+        return FileSystemArtifactSink(artifactdir, bucket=bucket, maxworkers=kwargs.get('maxworkers', 4))
+    return S3ArtifactSink(bucket, **kwargs)
@@ -0,0 +1,70 @@
+
+import threading
+
+import numpy as np
+
+
+RENDERERS = ['ggplot', 'matplotlib', 'svg']
+IMAGE_EXTENSIONS = {'ggplot': '.png', 'matplotlib': '.png', 'svg': '.svg'}
+
+# same size as plotnine's default figure
+FIGURE_SIZE = (6.4, 4.8)
+DPI = 100
+CHART_WIDTH_PIXELS = int(FIGURE_SIZE[0] * DPI)
+
+_figure = None
+_figure_lock = threading.Lock()
+
+
+def date_locator(interval):
+    # date breaks given as by get_optimal_daybreaks ('1 year', '3 months', '1 month', '1 day')
+    from matplotlib.dates import YearLocator, MonthLocator, DayLocator
+    number, unit = interval.split(' ')
+    number = int(number)
+    if unit.startswith('year'):
+        return YearLocator(number)
+    elif unit.startswith('month'):
+        return MonthLocator(interval=number)
+    elif unit.startswith('day'):
+        return DayLocator(interval=number)
+    else:
+        raise ValueError('Unknown date break: {}'.format(interval))
+
+
+def _get_figure():
+    # one figure per process, cleared between charts (no pyplot, no global state)
+    global _figure
+    if _figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        _figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        FigureCanvasAgg(_figure)
+    return _figure
+
+
+def render_line_chart(buffer, series, daybreaks, title=None, xlabel='Date', ylabel='value', renderer='matplotlib'):
+    # series: list of (label, timestamps, values), drawn from the arrays as they are;
+    # the image (PNG, or SVG with renderer 'svg') is written into buffer
+    from matplotlib.dates import DateFormatter
+    with _figure_lock:
+        figure = _get_figure()
+        figure.clear()
+        ax = figure.add_subplot(1, 1, 1)
+        for label, timestamps, values in series:
+            ax.plot(
+                np.array(timestamps, dtype='datetime64[s]'),
+                np.asarray(values, dtype=np.float64),
+                label=label
+            )
+        ax.xaxis.set_major_locator(date_locator(daybreaks))
+        ax.xaxis.set_major_formatter(DateFormatter('%Y-%m-%d' if daybreaks.endswith('day') else '%Y-%m'))
+        for ticklabel in ax.get_xticklabels():
+            ticklabel.set_rotation(90)
+            ticklabel.set_horizontalalignment('right')
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        if title is not None:
+            ax.set_title(title)
+        ax.grid(True, alpha=0.3)
+        ax.legend(title='plot', loc='center left', bbox_to_anchor=(1.02, 0.5), frameon=False)
+        figure.savefig(buffer, format='svg' if renderer == 'svg' else 'png', bbox_inches='tight')
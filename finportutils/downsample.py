@@ -0,0 +1,103 @@
+
+import numpy as np
+import pandas as pd
+
+
+DOWNSAMPLING_METHODS = ['lttb', 'minmax', 'none']
+RESOLUTIONS = {'daily': None, 'weekly': 'W', 'monthly': 'M'}
+
+
+def lttb_indices(x, y, nbpoints):
+    # Largest-Triangle-Three-Buckets (Steinarsson, 2013): the first and last points, and in
+    # each of nbpoints-2 buckets the point making the largest triangle with the point kept in
+    # the previous bucket and the average of the next one, so that the shape is preserved
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    nbdata = len(x)
+    if nbpoints >= nbdata or nbpoints < 3:
+        return np.arange(nbdata)
+    edges = (np.arange(nbpoints - 1) * (nbdata - 2) / (nbpoints - 2)).astype(np.int64) + 1
+    edges[-1] = nbdata - 1
+    indices = np.zeros(nbpoints, dtype=np.int64)
+    indices[-1] = nbdata - 1
+    previdx = 0
+    for i in range(nbpoints - 2):
+        start, end = edges[i], edges[i+1]
+        nextstart, nextend = edges[i+1], (edges[i+2] if i+2 < len(edges) else nbdata)
+        nextx = np.mean(x[nextstart:nextend])
+        nexty = np.mean(y[nextstart:nextend])
+        areas = np.abs(
+            (x[previdx] - nextx) * (y[start:end] - y[previdx])
+            - (x[previdx] - x[start:end]) * (nexty - y[previdx])
+        )
+        previdx = start + np.argmax(areas)
+        indices[i+1] = previdx
+    return indices
+
+
+def minmax_indices(y, nbpoints):
+    # the first and last points, and the minimum and the maximum of each of nbpoints/2 buckets
+    y = np.asarray(y, dtype=np.float64)
+    nbdata = len(y)
+    if nbpoints >= nbdata or nbpoints < 4:
+        return np.arange(nbdata)
+    edges = np.linspace(0, nbdata, nbpoints // 2 + 1).astype(np.int64)
+    indices = [0, nbdata - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            indices += [start + np.argmin(y[start:end]), start + np.argmax(y[start:end])]
+    return np.unique(indices)
+
+
+def downsample_series(timestamps, values, nbpoints, method='lttb'):
+    # at most about nbpoints points of the series (e.g., the width of the chart in pixels);
+    # missing values are left out
+    timestamps = np.array(timestamps, dtype='datetime64[s]')
+    values = np.asarray(values, dtype=np.float64)
+    available = ~np.isnan(values)
+    timestamps, values = timestamps[available], values[available]
+    if method == 'lttb':
+        indices = lttb_indices(timestamps.astype(np.float64), values, nbpoints)
+    elif method == 'minmax':
+        indices = minmax_indices(values, nbpoints)
+    elif method == 'none' or method is None:
+        return timestamps, values
+    else:
+        raise ValueError('Unknown downsampling method: {} (options: {})'.format(
+            method, ', '.join(DOWNSAMPLING_METHODS)))
+    return timestamps[indices], values[indices]
+
+
+def downsample_records(df, valuecolumns, nbpoints, timecolumn='TimeStamp', method='lttb'):
+    # rows kept to plot each of the value columns with about nbpoints points (the union of the
+    # points kept for every column), with all their columns
+    timestamps = pd.to_datetime(df[timecolumn]).to_numpy().astype('datetime64[s]').astype(np.float64)
+    kept = np.zeros(len(df), dtype=bool)
+    for column in valuecolumns:
+        values = np.asarray(df[column], dtype=np.float64)
+        available = np.flatnonzero(~np.isnan(values))
+        if method == 'lttb':
+            indices = lttb_indices(timestamps[available], values[available], nbpoints)
+        elif method == 'minmax':
+            indices = minmax_indices(values[available], nbpoints)
+        elif method == 'none' or method is None:
+            indices = np.arange(len(available))
+        else:
+            raise ValueError('Unknown downsampling method: {} (options: {})'.format(
+                method, ', '.join(DOWNSAMPLING_METHODS)))
+        kept[available[indices]] = True
+    return df.iloc[np.flatnonzero(kept)].reset_index(drop=True)
+
+
+def resample_records(df, resolution, timecolumn='TimeStamp', how=None):
+    # one row per week or month (the last date of the period), with the last value of every
+    # column unless another aggregation (e.g., 'sum' for flows) is given in how
+    if resolution is None or RESOLUTIONS.get(resolution, 0) is None:
+        return df
+    if resolution not in RESOLUTIONS:
+        raise ValueError('Unknown resolution: {} (options: {})'.format(resolution, ', '.join(RESOLUTIONS.keys())))
+    how = how if how is not None else {}
+    periods = pd.to_datetime(df[timecolumn]).dt.to_period(RESOLUTIONS[resolution])
+    return df.groupby(periods.to_numpy(), sort=True) \
+        .agg({column: how.get(column, 'last') for column in df.columns}) \
+        .reset_index(drop=True)
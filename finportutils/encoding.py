@@ -0,0 +1,92 @@
+
+import io
+import json
+import gzip
+import base64
+
+import numpy as np
+import pandas as pd
+
+
+# response formats, negotiated by the field `response_format` of the query:
+#   json: tables as lists of records (as before);
+#   columnar: tables as dicts of arrays (one list per column);
+#   columnar-gzip: the same, the body gzipped and base64-encoded;
+#   arrow: tables as base64-encoded Arrow IPC streams (needs pyarrow)
+RESPONSE_FORMATS = ['json', 'columnar', 'columnar-gzip', 'arrow']
+
+
+def column_to_list(values):
+    # one conversion per column (NumPy's tolist), without a Python loop over the elements
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        strings = np.datetime_as_string(values, unit='D' if values.dtype == np.dtype('datetime64[D]') else 's')
+        return np.where(np.isnat(values), None, strings).tolist()
+    if np.issubdtype(values.dtype, np.floating) and np.isnan(values).any():
+        # NaN as null (valid JSON)
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def to_columns(df):
+    return {str(column): column_to_list(df[column].to_numpy()) for column in df.columns}
+
+
+def to_arrow_ipc(df):
+    import pyarrow
+    import pyarrow.ipc
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue()).decode('ascii')
+
+
+def encode_table(df, response_format='json'):
+    # a table (dataframe, or dict of columns) in the response format asked
+    df = df if isinstance(df, pd.DataFrame) else pd.DataFrame(df)
+    if response_format == 'json':
+        return df.to_dict(orient='records')
+    elif response_format == 'columnar' or response_format == 'columnar-gzip':
+        return to_columns(df)
+    elif response_format == 'arrow':
+        return to_arrow_ipc(df)
+    else:
+        raise ValueError('Unknown response format: {} (options: {})'.format(
+            response_format, ', '.join(RESPONSE_FORMATS)))
+
+
+def encode_default(obj):
+    # NumPy values left in the response
+    if isinstance(obj, np.ndarray):
+        return column_to_list(obj) if obj.ndim == 1 else obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.DataFrame):
+        return to_columns(obj)
+    raise TypeError('Object of type {} is not JSON serializable'.format(obj.__class__.__name__))
+
+
+def make_response(body, response_format='json', statusCode=200):
+    # API Gateway (Lambda proxy) response; gzipped bodies are base64-encoded
+    bodystr = json.dumps(body, default=encode_default)
+    if response_format == 'columnar-gzip':
+        return {
+            'isBase64Encoded': True,
+            'statusCode': statusCode,
+            'headers': {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            'body': base64.b64encode(gzip.compress(bodystr.encode('utf-8'), compresslevel=5)).decode('ascii')
+        }
+    return {
+        'isBase64Encoded': False,
+        'statusCode': statusCode,
+        'body': bodystr
+    }
+
+
+def decode_response_body(response):
+    # body of a response made by make_response, as a Python object
+    body = response['body']
+    if response.get('isBase64Encoded', False):
+        body = gzip.decompress(base64.b64decode(body)).decode('utf-8')
+    return json.loads(body)
@@ -0,0 +1,175 @@
+
+import numpy as np
+
+
+SECONDS_PER_YEAR = 60.0*60.0*24.0*365.0
+
+
+def build_price_matrix(symdfs, column='Close'):
+    # aligned (dates x symbols) matrix over the union of the dates, NaN where a symbol has no price
+    timestamps = np.unique(np.concatenate([
+        np.array(symdf['TimeStamp'], dtype='datetime64[s]') for symdf in symdfs
+    ] + [np.zeros(0, dtype='datetime64[s]')]))
+    pricematrix = np.full((len(timestamps), len(symdfs)), np.nan)
+    for j, symdf in enumerate(symdfs):
+        rowidx = np.searchsorted(timestamps, np.array(symdf['TimeStamp'], dtype='datetime64[s]'))
+        pricematrix[rowidx, j] = np.array(symdf[column], dtype=np.float64)
+    return timestamps, pricematrix
+
+
+def _increments(ts, logprices, mask):
+    # for every row with a valid price, the change since the previous valid row of the same column
+    nbrows = logprices.shape[0]
+    rowidx = np.broadcast_to(np.arange(nbrows)[:, None], mask.shape)
+    lastvalididx = np.maximum.accumulate(np.where(mask, rowidx, -1), axis=0)
+    previdx = np.vstack([np.full((1, mask.shape[1]), -1), lastvalididx[:-1, :]])
+    hasincrement = mask & (previdx >= 0)
+    safe_previdx = np.maximum(previdx, 0)
+    dlogS = np.where(hasincrement, logprices - np.take_along_axis(logprices, safe_previdx, axis=0), 0.)
+    dt = np.where(hasincrement, ts[:, None] - ts[safe_previdx], 1.)
+    return dlogS, dt, hasincrement
+
+
+def _masked_mean(values, mask, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sum(np.where(mask, values, 0.), axis=0) / counts
+
+
+def estimate_symbols_statistics(timestamps, pricematrix, index_prices=None, target_return=0.):
+    # vectorized counterpart of finsim's fit_BlackScholesMerton_model, estimate_downside_risk,
+    # estimate_upside_risk and estimate_beta (unit: year), applied to every column at once;
+    # missing prices (NaN) are skipped as the handlers do with their non-null rows
+    ts = np.array(timestamps, dtype='datetime64[s]').astype(np.float64) / SECONDS_PER_YEAR
+    pricematrix = np.asarray(pricematrix, dtype=np.float64)
+    mask = ~np.isnan(pricematrix)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        logprices = np.log(pricematrix)
+
+    dlogS, dt, hasincrement = _increments(ts, logprices, mask)
+    nbincrements = np.sum(hasincrement, axis=0)
+    rates = dlogS / dt
+    rms_returns = dlogS / np.sqrt(dt)
+
+    r = _masked_mean(rates, hasincrement, nbincrements)
+    mean_rms_return = _masked_mean(rms_returns, hasincrement, nbincrements)
+    sigma = np.sqrt(_masked_mean(np.square(rms_returns - mean_rms_return), hasincrement, nbincrements))
+    downside_risk = np.sqrt(_masked_mean(np.square(np.maximum(target_return - rms_returns, 0.)), hasincrement, nbincrements))
+    upside_risk = np.sqrt(_masked_mean(np.square(np.maximum(rms_returns - target_return, 0.)), hasincrement, nbincrements))
+
+    statistics = {
+        'r': r,
+        'vol': sigma,
+        'downside_risk': downside_risk,
+        'upside_risk': upside_risk,
+        'nbrecs': np.sum(mask, axis=0),
+        # no argmax over no dates (nothing to estimate)
+        'startidx': np.argmax(mask, axis=0) if mask.shape[0] > 0 else np.zeros(mask.shape[1], dtype=np.int64),
+        'endidx': mask.shape[0] - 1 - np.argmax(mask[::-1, :], axis=0) if mask.shape[0] > 0
+        else np.zeros(mask.shape[1], dtype=np.int64)
+    }
+
+    if index_prices is not None:
+        # beta: regression slope of the symbol's yields against the index's, on the dates both have prices
+        index_prices = np.asarray(index_prices, dtype=np.float64)
+        jointmask = mask & ~np.isnan(index_prices)[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            logindexprices = np.broadcast_to(np.log(index_prices)[:, None], pricematrix.shape)
+        dlogS, dt, hasincrement = _increments(ts, logprices, jointmask)
+        dlogM, _, _ = _increments(ts, logindexprices, jointmask)
+        nbincrements = np.sum(hasincrement, axis=0)
+        stockyields = dlogS / dt
+        marketyields = dlogM / dt
+        dx = marketyields - _masked_mean(marketyields, hasincrement, nbincrements)
+        dy = stockyields - _masked_mean(stockyields, hasincrement, nbincrements)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            statistics['beta'] = np.sum(np.where(hasincrement, dx * dy, 0.), axis=0) \
+                / np.sum(np.where(hasincrement, dx * dx, 0.), axis=0)
+
+    return statistics
+
+
+def ledoit_wolf_shrinkage(increments):
+    # optimal intensity of the shrinkage of the sample covariance of the (samples x symbols)
+    # increments toward the scaled identity (Ledoit & Wolf, 2004)
+    nbsamples, nbsymbols = increments.shape
+    X = increments - np.mean(increments, axis=0)
+    X2 = np.square(X)
+    emp_cov_trace = np.sum(X2, axis=0) / nbsamples
+    mu = np.sum(emp_cov_trace) / nbsymbols
+    beta_ = np.sum(X2.T @ X2)
+    delta_ = np.sum(np.square(X.T @ X)) / nbsamples ** 2
+    beta = (beta_ / nbsamples - delta_) / (nbsymbols * nbsamples)
+    delta = (delta_ - 2. * mu * np.sum(emp_cov_trace) + nbsymbols * mu ** 2) / nbsymbols
+    beta = min(beta, delta)
+    return 0. if beta == 0 else beta / delta
+
+
+def shrink_covariance(covmat, shrinkage):
+    # convex combination of the covariance and the identity scaled by its mean variance
+    nbsymbols = covmat.shape[0]
+    mu = np.trace(covmat) / nbsymbols
+    return (1. - shrinkage) * covmat + shrinkage * mu * np.identity(nbsymbols)
+
+
+class RollingCovariance:
+    # covariances of the given pairs of columns over the last `window` increments,
+    # updated in O(1) per new row (running sums; the row leaving the window is subtracted)
+    def __init__(self, nbsymbols, window, pairs=None):
+        self.window = window
+        if pairs is None:
+            pairs = [(i, j) for i in range(nbsymbols) for j in range(i+1, nbsymbols)]
+        self.pairidx1 = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        self.pairidx2 = np.array([pair[1] for pair in pairs], dtype=np.int64)
+        self.buffer = np.zeros((window, nbsymbols))
+        self.nbrows = 0
+        self.sums = np.zeros(nbsymbols)
+        self.sqsums = np.zeros(nbsymbols)
+        self.crosssums = np.zeros(len(pairs))
+
+    def update(self, row):
+        pos = self.nbrows % self.window
+        if self.nbrows >= self.window:
+            old = self.buffer[pos, :]
+            self.sums -= old
+            self.sqsums -= np.square(old)
+            self.crosssums -= old[self.pairidx1] * old[self.pairidx2]
+        self.buffer[pos, :] = row
+        self.sums += row
+        self.sqsums += np.square(row)
+        self.crosssums += row[self.pairidx1] * row[self.pairidx2]
+        self.nbrows += 1
+
+    @property
+    def ready(self):
+        return self.nbrows >= self.window
+
+    def variances(self):
+        n = min(self.nbrows, self.window)
+        return np.maximum(self.sqsums / n - np.square(self.sums / n), 0.)
+
+    def covariances(self):
+        n = min(self.nbrows, self.window)
+        means = self.sums / n
+        return self.crosssums / n - means[self.pairidx1] * means[self.pairidx2]
+
+    def correlations(self):
+        variances = self.variances()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.covariances() / np.sqrt(variances[self.pairidx1] * variances[self.pairidx2])
+
+
+def rolling_correlations(timestamps, pricematrix, window, pairs=None):
+    # rolling covariances and correlations (unit: year) of the pairs, for every date
+    # at which the window of increments is full; prices are aligned without NaN
+    ts = np.array(timestamps, dtype='datetime64[s]').astype(np.float64) / SECONDS_PER_YEAR
+    increments = np.diff(np.log(pricematrix), axis=0) / np.sqrt(np.diff(ts))[:, None]
+    engine = RollingCovariance(pricematrix.shape[1], window, pairs=pairs)
+    nbdates = max(len(increments) - window + 1, 0)
+    covariances = np.zeros((nbdates, len(engine.pairidx1)))
+    correlations = np.zeros((nbdates, len(engine.pairidx1)))
+    for i, row in enumerate(increments):
+        engine.update(row)
+        if engine.ready:
+            covariances[i-window+1, :] = engine.covariances()
+            correlations[i-window+1, :] = engine.correlations()
+    return timestamps[window:], covariances, correlations
@@ -0,0 +1,200 @@
+
+import os
+import io
+import csv
+import json
+from math import isnan
+from datetime import date, datetime
+
+import numpy as np
+
+
+EXPORT_EXTENSIONS = ['.xlsx', '.csv', '.parquet', '.json']
+
+
+def export_extension(fileformat):
+    # format given in a query (e.g., 'xlsx', '.csv') to the extension of the file
+    extension = fileformat if fileformat.startswith('.') else '.' + fileformat
+    if extension not in EXPORT_EXTENSIONS:
+        raise IOError('Extension {} not recognized.'.format(extension))
+    return extension
+
+
+def _cleaned_value(value):
+    # missing values as empty cells; NumPy scalars as Python's
+    if value is None:
+        return None
+    if isinstance(value, np.datetime64):
+        return None if np.isnat(value) else value.astype('datetime64[us]').item()
+    if hasattr(value, 'item') and not isinstance(value, (date, datetime)):
+        value = value.item()
+    if isinstance(value, float) and isnan(value):
+        return None
+    if value.__class__.__name__ == 'NaTType':
+        return None
+    return value
+
+
+class _TextFile:
+    # a path, or a binary buffer (e.g., io.BytesIO) written as UTF-8 text and left open
+    def __init__(self, file):
+        if isinstance(file, (str, os.PathLike)):
+            self.stream = open(file, 'w', newline='')
+            self.owned = True
+        else:
+            self.stream = io.TextIOWrapper(file, encoding='utf-8', newline='')
+            self.owned = False
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+            self.stream.detach()
+
+
+class XlsxRowWriter:
+    # openpyxl's write-only mode: rows are written to the sheet file as they come,
+    # without the workbook being kept in memory
+    def __init__(self, file, columns):
+        from openpyxl import Workbook
+        self.file = file
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Sheet1')
+        self.sheet.append(list(columns))
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.sheet.append([_cleaned_value(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.file)
+
+
+class CsvRowWriter:
+    def __init__(self, file, columns):
+        self.file = _TextFile(file)
+        self.writer = csv.writer(self.file.stream)
+        self.writer.writerow(list(columns))
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.writer.writerow([
+                '' if value is None else value
+                for value in map(_cleaned_value, row)
+            ])
+
+    def close(self):
+        self.file.close()
+
+
+class JsonRowWriter:
+    # one array of records, written record by record
+    def __init__(self, file, columns):
+        self.file = _TextFile(file)
+        self.columns = list(columns)
+        self.nbrows = 0
+        self.file.stream.write('[')
+
+    def write_rows(self, rows):
+        for row in rows:
+            record = {column: _cleaned_value(value) for column, value in zip(self.columns, row)}
+            self.file.stream.write((',' if self.nbrows > 0 else '') + json.dumps(record, default=str))
+            self.nbrows += 1
+
+    def close(self):
+        self.file.stream.write(']')
+        self.file.close()
+
+
+class ParquetRowWriter:
+    # every chunk of rows is one row group
+    def __init__(self, file, columns):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.file = file
+        self.columns = [str(column) for column in columns]
+        self.writer = None
+
+    def write_rows(self, rows):
+        rows = [[_cleaned_value(value) for value in row] for row in rows]
+        if len(rows) == 0:
+            return
+        table = self.pyarrow.Table.from_pydict({
+            column: [row[j] for row in rows]
+            for j, column in enumerate(self.columns)
+        })
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.file, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(
+                self.file,
+                self.pyarrow.schema([(column, self.pyarrow.null()) for column in self.columns])
+            )
+        self.writer.close()
+
+
+row_writers = {
+    '.xlsx': XlsxRowWriter,
+    '.csv': CsvRowWriter,
+    '.parquet': ParquetRowWriter,
+    '.json': JsonRowWriter
+}
+
+
+def get_row_writer(file, columns, extension=None):
+    # file: a path, or a binary buffer with the extension given
+    if extension is None:
+        extension = os.path.splitext(file)[-1]
+    if extension not in row_writers:
+        raise IOError('Extension {} not recognized.'.format(extension))
+    return row_writers[extension](file, columns)
+
+
+def write_rows(file, columns, rows, chunksize=10000, extension=None):
+    # rows (an iterable, e.g., a generator) written as they are produced; the format
+    # is given by the extension of the file (.xlsx, .csv, .parquet or .json)
+    writer = get_row_writer(file, columns, extension=extension)
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                writer.write_rows(chunk)
+                chunk = []
+        writer.write_rows(chunk)
+    finally:
+        writer.close()
+
+
+def write_records(file, records, columns=None, chunksize=10000, extension=None):
+    # records (dicts) written as rows; the columns are those of the first record if not given
+    records = iter(records)
+    first_record = next(records, None)
+    if columns is None:
+        columns = list(first_record.keys()) if first_record is not None else []
+
+    def iterate_rows():
+        if first_record is None:
+            return
+        yield [first_record.get(column) for column in columns]
+        for record in records:
+            yield [record.get(column) for column in columns]
+
+    write_rows(file, columns, iterate_rows(), chunksize=chunksize, extension=extension)
+
+
+def write_dataframe(file, df, index=False, chunksize=10000, extension=None):
+    # the dataframe written chunk by chunk (without a copy of the whole frame per format)
+    columns = ([df.index.name if df.index.name is not None else ''] if index else []) + list(df.columns)
+    write_rows(
+        file,
+        columns,
+        df.itertuples(index=index, name=None),
+        chunksize=chunksize,
+        extension=extension
+    )
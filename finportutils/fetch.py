@@ -0,0 +1,182 @@
+
+import logging
+import random
+import threading
+from time import sleep, monotonic
+from socket import timeout
+from urllib.error import URLError, HTTPError
+
+from finsim.data import get_yahoofinance_data
+
+from .pricestore import has_trading_days
+
+
+class UpstreamUnavailableError(Exception):
+    pass
+
+
+RETRYABLE_EXCEPTIONS = (ConnectionError, timeout, URLError)
+
+
+class RetryBudget:
+    # token bucket shared by all calls in the process: every retry takes a token,
+    # so that an outage cannot multiply the load by the number of retries per call
+    def __init__(self, capacity=50., refill_per_second=0.5):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.last_refill_time = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill_time) * self.refill_per_second)
+            self.last_refill_time = now
+            if self.tokens >= 1.:
+                self.tokens -= 1.
+                return True
+            return False
+
+
+class CircuitBreaker:
+    # opened after failure_threshold consecutive failures; while open, calls fail fast
+    # until cooldown seconds have passed, after which one trial call is let through
+    def __init__(self, failure_threshold=10, cooldown=60.):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.nbfailures = 0
+        self.opened_time = None
+        self.trial_ongoing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_time is None:
+                return True
+            if monotonic() - self.opened_time >= self.cooldown and not self.trial_ongoing:
+                self.trial_ongoing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.nbfailures = 0
+            self.opened_time = None
+            self.trial_ongoing = False
+
+    def release_trial(self):
+        # the trial call ended without telling whether the upstream is back (e.g., a
+        # non-retryable error): the next call after the cooldown is a trial again
+        with self.lock:
+            self.trial_ongoing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.nbfailures += 1
+            if self.trial_ongoing or self.nbfailures >= self.failure_threshold:
+                if self.opened_time is None or self.trial_ongoing:
+                    logging.warning('Circuit opened after {} consecutive failures.'.format(self.nbfailures))
+                self.opened_time = monotonic()
+                self.trial_ongoing = False
+
+
+def is_empty_result(result):
+    return result is None or (hasattr(result, '__len__') and len(result) == 0)
+
+
+def expects_prices(args):
+    # whether a (symbol, startdate, enddate) download should have given prices; a range of
+    # today, weekends or holidays only is empty as it should be
+    if len(args) < 3:
+        return True
+    try:
+        return has_trading_days(args[1], args[2])
+    except (TypeError, ValueError):
+        return True
+
+
+def is_retryable_error(error):
+    if isinstance(error, HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+default_retry_budget = RetryBudget()
+default_circuit_breaker = CircuitBreaker()
+
+
+class RetryingFetcher:
+    def __init__(
+            self,
+            fetcher=None,
+            maxretries=5,
+            maxemptyretries=2,
+            waittime=1.,
+            maxwaittime=30.,
+            deadline=120.,
+            retry_budget=None,
+            circuit_breaker=None
+    ):
+        self.fetcher = fetcher if fetcher is not None else get_yahoofinance_data
+        self.maxretries = maxretries
+        self.maxemptyretries = maxemptyretries
+        self.waittime = waittime
+        self.maxwaittime = maxwaittime
+        self.deadline = deadline
+        self.retry_budget = retry_budget if retry_budget is not None else default_retry_budget
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else default_circuit_breaker
+
+    def backoff_waittime(self, attempt):
+        # exponential backoff with full jitter
+        return random.uniform(0., min(self.maxwaittime, self.waittime * (2 ** attempt)))
+
+    def __call__(self, *args, **kwargs):
+        starttime = monotonic()
+        attempt = 0
+        nbempty = 0
+        while True:
+            if not self.circuit_breaker.allow():
+                raise UpstreamUnavailableError('Circuit open; upstream considered down.')
+            resolved = False
+            try:
+                result = self.fetcher(*args, **kwargs)
+            except Exception as error:
+                if not is_retryable_error(error):
+                    raise
+                self.circuit_breaker.record_failure()
+                resolved = True
+                logging.warning('Fetching {} failed (attempt {}): {}'.format(args, attempt + 1, error))
+                if attempt >= self.maxretries:
+                    raise UpstreamUnavailableError('Retries exhausted for {}.'.format(args)) from error
+                waittime = self.backoff_waittime(attempt)
+                if monotonic() - starttime + waittime > self.deadline:
+                    raise UpstreamUnavailableError('Deadline exceeded for {}.'.format(args)) from error
+                if not self.retry_budget.acquire():
+                    raise UpstreamUnavailableError('Retry budget exhausted.') from error
+                sleep(waittime)
+                attempt += 1
+            else:
+                # the upstream answered: an empty result (finsim's on some outages, but also a
+                # delisted symbol or a range without trading days) is not held against the circuit
+                self.circuit_breaker.record_success()
+                resolved = True
+                if not is_empty_result(result) or nbempty >= self.maxemptyretries or not expects_prices(args):
+                    return result
+                # retried a few times when prices were expected, then given back as it is
+                nbempty += 1
+                waittime = self.backoff_waittime(attempt)
+                if monotonic() - starttime + waittime > self.deadline or not self.retry_budget.acquire():
+                    return result
+                logging.warning('Empty result for {} (attempt {}); retrying.'.format(args, attempt + 1))
+                sleep(waittime)
+                attempt += 1
+            finally:
+                # a trial ending otherwise (non-retryable error, interruption) must not
+                # leave the circuit waiting for it forever
+                if not resolved:
+                    self.circuit_breaker.release_trial()
+
+
+def get_yahoofinance_data_with_retry(symbol, startdate, enddate, waittime=1, **kwargs):
+    return RetryingFetcher(waittime=waittime, **kwargs)(symbol, startdate, enddate)
@@ -0,0 +1,74 @@
+
+import os
+import threading
+from time import time
+from datetime import datetime, timezone
+
+
+# Crockford's base 32 (no I, L, O, U), in lower case to suit file names
+ENCODING = '0123456789abcdefghjkmnpqrstvwxyz'
+RANDOMBITS = 80
+
+
+def encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(ENCODING[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def decode_base32(string):
+    value = 0
+    for char in string.lower():
+        value = (value << 5) | ENCODING.index(char)
+    return value
+
+
+class ULIDGenerator:
+    # 48-bit timestamp (ms) followed by 80 random bits, so that IDs sort by creation time;
+    # the random bits come from os.urandom, so that processes cannot produce the same ID,
+    # and within a millisecond they are incremented, so that IDs of a process stay ordered
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.last_timestamp = -1
+        self.last_randomness = 0
+
+    def generate(self, timestamp=None):
+        with self.lock:
+            if timestamp is None:
+                timestamp = int(time() * 1000)
+            if timestamp <= self.last_timestamp and self.last_randomness < (1 << RANDOMBITS) - 1:
+                # same millisecond (or clock moved back): keep the order
+                timestamp = self.last_timestamp
+                randomness = self.last_randomness + 1
+            else:
+                randomness = int.from_bytes(os.urandom(RANDOMBITS // 8), 'big')
+            self.last_timestamp = timestamp
+            self.last_randomness = randomness
+        return encode_base32(timestamp, 10) + encode_base32(randomness, 16)
+
+
+default_ulid_generator = ULIDGenerator()
+if hasattr(os, 'register_at_fork'):
+    # a forked child must not continue the parent's sequence
+    os.register_at_fork(after_in_child=default_ulid_generator.reset)
+
+
+def generate_ulid():
+    return default_ulid_generator.generate()
+
+
+def ulid_timestamp(ulid):
+    # creation time (UTC) of the ULID
+    return datetime.fromtimestamp(decode_base32(ulid[:10]) / 1000., tz=timezone.utc)
+
+
+def generate_filename():
+    # UTC time readable in the name (as the generate_filename Lambda did), then the ULID
+    ulid = generate_ulid()
+    timestr = ulid_timestamp(ulid).strftime('%Y%m%d%H%M%SUTC')
+    return '{}_{}'.format(timestr, ulid)
@@ -0,0 +1,205 @@
+
+import os
+import copy
+
+import numpy as np
+
+from .estimate import SECONDS_PER_YEAR, build_price_matrix
+from .pricestore import PriceStore, get_last_complete_date
+from .resultcache import make_cache_key, normalize_float
+from .valuation import compute_effective_prices
+
+
+DEFAULT_MOMENTSTOREDIR = os.path.join('/', 'tmp', 'momentstore')
+
+
+def forward_fill(pricematrix, initialprices=None):
+    # missing prices (NaN) take the last price of the same column
+    if initialprices is not None:
+        pricematrix = np.vstack([initialprices[None, :], pricematrix])
+    rowidx = np.broadcast_to(np.arange(pricematrix.shape[0])[:, None], pricematrix.shape)
+    lastvalididx = np.maximum.accumulate(np.where(np.isnan(pricematrix), 0, rowidx), axis=0)
+    filled = np.take_along_axis(pricematrix, lastvalididx, axis=0)
+    return filled[1:] if initialprices is not None else filled
+
+
+class ExponentialMomentEngine:
+    # sufficient statistics of finsim's exponentially time-weighted estimation, with the weight
+    # exp(-(enddate-date)/(365*yearscale)) (date in days) of each daily increment; appending days
+    # only decays the sums and adds the new increments, and dropping the start of the window
+    # subtracts the increments leaving it, so that no update rescans the history
+    def __init__(self, nbsymbols, yearscale):
+        self.nbsymbols = nbsymbols
+        self.yearscale = yearscale
+        self.lastdate = None
+        self.lastprices = None
+        self.startdates = np.zeros(0, dtype='datetime64[D]')
+        self.enddates = np.zeros(0, dtype='datetime64[D]')
+        self.rates = np.zeros((0, nbsymbols))           # dlogS / dt
+        self.rms_returns = np.zeros((0, nbsymbols))     # dlogS / sqrt(dt)
+        self.sw = 0.
+        self.sw2 = 0.
+        self.swx = np.zeros(nbsymbols)
+        self.swy = np.zeros(nbsymbols)
+        self.sw2yy = np.zeros((nbsymbols, nbsymbols))
+
+    def _weights(self, dates):
+        # relative to the last date
+        return np.exp(-(self.lastdate - dates).astype(np.float64) / 365. / self.yearscale)
+
+    def _accumulate(self, weights, rates, rms_returns, sign=1.):
+        self.sw += sign * np.sum(weights)
+        self.sw2 += sign * np.sum(np.square(weights))
+        self.swx += sign * weights @ rates
+        self.swy += sign * weights @ rms_returns
+        self.sw2yy += sign * (rms_returns.T * np.square(weights)) @ rms_returns
+
+    def add(self, timestamps, pricematrix):
+        # prices (dates x symbols, NaN for missing prices) of the dates after the last date
+        dates = np.array(timestamps, dtype='datetime64[D]')
+        if self.lastdate is not None:
+            keep = dates > self.lastdate
+            dates, pricematrix = dates[keep], pricematrix[keep, :]
+        pricematrix = forward_fill(pricematrix, initialprices=self.lastprices)
+        if self.lastprices is None:
+            # the window starts once every symbol has a price
+            complete = np.all(~np.isnan(pricematrix), axis=1)
+            if not np.any(complete):
+                return
+            firstidx = np.argmax(complete)
+            dates, pricematrix = dates[firstidx:], pricematrix[firstidx:, :]
+            self.lastdate = dates[0]
+            self.lastprices = pricematrix[0, :]
+            dates, pricematrix = dates[1:], pricematrix[1:, :]
+        if len(dates) == 0:
+            return
+
+        allprices = np.vstack([self.lastprices[None, :], pricematrix])
+        alldates = np.concatenate([[self.lastdate], dates])
+        ts = alldates.astype('datetime64[s]').astype(np.float64) / SECONDS_PER_YEAR
+        dlogS = np.diff(np.log(allprices), axis=0)
+        dt = np.diff(ts)[:, None]
+        rates = dlogS / dt
+        rms_returns = dlogS / np.sqrt(dt)
+
+        # decaying the sums to the new last date, then adding the new increments
+        decay = np.exp(-(dates[-1] - self.lastdate).astype(np.float64) / 365. / self.yearscale)
+        self.sw *= decay
+        self.sw2 *= decay * decay
+        self.swx *= decay
+        self.swy *= decay
+        self.sw2yy *= decay * decay
+        self.lastdate = dates[-1]
+        self.lastprices = pricematrix[-1, :]
+        self._accumulate(self._weights(dates), rates, rms_returns)
+
+        self.startdates = np.concatenate([self.startdates, alldates[:-1]])
+        self.enddates = np.concatenate([self.enddates, dates])
+        self.rates = np.vstack([self.rates, rates])
+        self.rms_returns = np.vstack([self.rms_returns, rms_returns])
+
+    def drop_before(self, startdate):
+        # removing the increments starting before startdate
+        leaving = self.startdates < np.datetime64(startdate, 'D')
+        if not np.any(leaving):
+            return
+        self._accumulate(self._weights(self.enddates[leaving]), self.rates[leaving], self.rms_returns[leaving], sign=-1.)
+        self.startdates = self.startdates[~leaving]
+        self.enddates = self.enddates[~leaving]
+        self.rates = self.rates[~leaving]
+        self.rms_returns = self.rms_returns[~leaving]
+
+    @property
+    def firstdate(self):
+        return self.startdates[0] if len(self.startdates) > 0 else self.lastdate
+
+    def estimates(self):
+        r = self.swx / self.sw
+        mean_rms_returns = self.swy / self.sw
+        cov = self.sw2yy / self.sw2 - np.outer(mean_rms_returns, mean_rms_returns)
+        return r, cov
+
+    def save(self, path):
+        tmppath = '{}.{}.tmp.npz'.format(path, os.getpid())
+        np.savez(
+            tmppath,
+            yearscale=self.yearscale,
+            lastdate=np.array([self.lastdate], dtype='datetime64[D]'),
+            lastprices=self.lastprices,
+            startdates=self.startdates,
+            enddates=self.enddates,
+            rates=self.rates,
+            rms_returns=self.rms_returns,
+            sums=np.array([self.sw, self.sw2]),
+            swx=self.swx,
+            swy=self.swy,
+            sw2yy=self.sw2yy
+        )
+        os.replace(tmppath, path)
+
+    @classmethod
+    def load(cls, path):
+        state = np.load(path)
+        engine = cls(len(state['swx']), float(state['yearscale']))
+        engine.lastdate = state['lastdate'][0]
+        engine.lastprices = state['lastprices']
+        engine.startdates = state['startdates']
+        engine.enddates = state['enddates']
+        engine.rates = state['rates']
+        engine.rms_returns = state['rms_returns']
+        engine.sw, engine.sw2 = state['sums']
+        engine.swx = state['swx']
+        engine.swy = state['swy']
+        engine.sw2yy = state['sw2yy']
+        return engine
+
+
+def get_exponential_timeweighted_estimation(
+        symbols,
+        startdate,
+        enddate,
+        yearscale,
+        storedir=None,
+        pricestore=None,
+        dividends=None
+):
+    # statistics of the symbols are kept in the store, and only the dates after those
+    # already ingested are read; the current (incomplete) day is never stored. With the
+    # dividends of the symbols (as given by get_symbols_dividends), the prices include the
+    # dividends cumulated up to every date, as finsim's estimation including dividends
+    storedir = storedir if storedir is not None else os.getenv('MOMENTSTOREDIR', DEFAULT_MOMENTSTOREDIR)
+    pricestore = pricestore if pricestore is not None else PriceStore()
+    os.makedirs(storedir, exist_ok=True)
+    statepath = os.path.join(
+        storedir,
+        make_cache_key({
+            'symbols': list(symbols),
+            'yearscale': normalize_float(yearscale),
+            'include_dividends': dividends is not None
+        }) + '.npz'
+    )
+
+    engine = None
+    if os.path.exists(statepath):
+        engine = ExponentialMomentEngine.load(statepath)
+        if engine.lastdate is None or engine.lastdate > np.datetime64(enddate, 'D') \
+                or engine.firstdate > np.datetime64(startdate, 'D'):
+            engine = None
+    if engine is None:
+        engine = ExponentialMomentEngine(len(symbols), yearscale)
+
+    readstartdate = startdate if engine.lastdate is None else str(engine.lastdate)
+    symdfs = [pricestore.get_symbol_data(symbol, readstartdate, enddate) for symbol in symbols]
+    timestamps, pricematrix = build_price_matrix(symdfs)
+    if dividends is not None:
+        pricematrix = compute_effective_prices(timestamps, pricematrix, symbols, dividends)
+    dates = timestamps.astype('datetime64[D]')
+    stored = dates <= np.datetime64(get_last_complete_date(), 'D')
+    engine.add(dates[stored], pricematrix[stored, :])
+    engine.drop_before(startdate)
+    if engine.lastdate is not None:
+        engine.save(statepath)
+    if not np.all(stored):
+        engine = copy.deepcopy(engine)
+        engine.add(dates[~stored], pricematrix[~stored, :])
+    return engine.estimates()
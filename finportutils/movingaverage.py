@@ -0,0 +1,99 @@
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .pricestore import get_symbol_data
+
+
+MA_KINDS = ['simple', 'exponential', 'weighted']
+
+
+def _window_starts(days, windows):
+    # for every (date, window), the index of the first date within the window (calendar days)
+    return np.searchsorted(days, days[:, None] - windows[None, :], side='right')
+
+
+def _windowed_sums(cumsums, starts):
+    # sums over [start, i] for every row i and window, from the cumulated sums (leading 0)
+    rowidx = np.arange(starts.shape[0])[:, None]
+    return cumsums[rowidx + 1] - cumsums[starts]
+
+
+def moving_averages(timestamps, prices, windows, kind='simple'):
+    # moving averages of the prices over windows of calendar days (dates x windows), in one pass:
+    #   simple: mean of the prices of the last `window` days (finsim's get_movingaverage_price_data),
+    #           from differences of the cumulated sums;
+    #   weighted: weights decreasing linearly with the age of the price, to zero at `window` days;
+    #   exponential: weights exp(-age/window) over the whole history.
+    # missing prices (NaN) are skipped
+    days = np.array(timestamps, dtype='datetime64[D]').astype(np.int64)
+    if len(days) > 0:
+        days = days - days[0]   # smaller cumulated sums, for the weighted averages
+    prices = np.asarray(prices, dtype=np.float64)
+    windows = np.asarray(windows, dtype=np.int64)
+    valid = ~np.isnan(prices)
+    values = np.where(valid, prices, 0.)
+
+    if kind == 'simple' or kind == 'weighted':
+        starts = _window_starts(days, windows)
+        cumvalues = np.concatenate([[0.], np.cumsum(values)])
+        cumcounts = np.concatenate([[0.], np.cumsum(valid)])
+        sumvalues = _windowed_sums(cumvalues, starts)
+        counts = _windowed_sums(cumcounts, starts)
+        if kind == 'simple':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return sumvalues / counts
+        # weight of the price of day s at day t: window - (t - s)
+        cumdayvalues = np.concatenate([[0.], np.cumsum(days * values)])
+        cumdays = np.concatenate([[0.], np.cumsum(days * valid)])
+        numerators = (windows[None, :] - days[:, None]) * sumvalues + _windowed_sums(cumdayvalues, starts)
+        denominators = (windows[None, :] - days[:, None]) * counts + _windowed_sums(cumdays, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return numerators / denominators
+    elif kind == 'exponential':
+        # decayed sums, updated date by date for all windows at once
+        mas = np.full((len(days), len(windows)), np.nan)
+        numerators = np.zeros(len(windows))
+        denominators = np.zeros(len(windows))
+        for i in range(len(days)):
+            if i > 0:
+                decay = np.exp(-(days[i] - days[i-1]) / windows)
+                numerators *= decay
+                denominators *= decay
+            if valid[i]:
+                numerators += values[i]
+                denominators += 1.
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mas[i, :] = numerators / denominators
+        return mas
+    else:
+        raise ValueError('Unknown kind of moving average: {} (options: {})'.format(kind, ', '.join(MA_KINDS)))
+
+
+def get_movingaverage_prices(symbol, startdate, enddate, windows, kind='simple', pricestore=None):
+    # prices and moving averages of all windows from one download; the average of a window is
+    # given from the dates as finsim's get_movingaverage_price_data does (more than `window` days
+    # after the first price on or after startdate - window), NaN before
+    windows = sorted(set(windows))
+    mastartdate = (datetime.strptime(startdate, '%Y-%m-%d') - timedelta(days=max(windows))).strftime('%Y-%m-%d')
+    if pricestore is None:
+        df = get_symbol_data(symbol, mastartdate, enddate)
+    else:
+        df = pricestore.get_symbol_data(symbol, mastartdate, enddate)
+
+    timestamps = np.array(df['TimeStamp'], dtype='datetime64[D]')
+    mas = moving_averages(timestamps, df['Close'], windows, kind=kind)
+    for j, window in enumerate(windows):
+        windowstart = np.datetime64(startdate, 'D') - np.timedelta64(window, 'D')
+        firstidx = np.searchsorted(timestamps, windowstart, side='left')
+        if firstidx < len(timestamps):
+            mas[timestamps - timestamps[firstidx] <= np.timedelta64(window, 'D'), j] = np.nan
+        else:
+            mas[:, j] = np.nan
+
+    madf = pd.DataFrame({'TimeStamp': df['TimeStamp'].to_numpy(), 'Close': df['Close'].to_numpy()})
+    for j, window in enumerate(windows):
+        madf[window] = mas[:, j]
+    return madf.loc[madf['TimeStamp'] >= pd.Timestamp(startdate), :].reset_index(drop=True)
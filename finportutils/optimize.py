@@ -0,0 +1,117 @@
+
+from functools import partial
+
+import numpy as np
+from scipy.optimize import minimize
+from finsim.portfolio.optimize.metrics import mpt_entropy_costfunction
+from finsim.portfolio.optimize.numerics import getarrayelementminusminvalue, checksumarray
+from finsim.portfolio.optimize.policy import OptimizedWeightingPolicyUsingMPTEntropyCostFunction
+
+from .parallel import process_map
+
+
+def get_default_initialguess(nbstocks, V=10.):
+    # finsim's cold start: V shared equally by the stocks and the slack
+    return np.repeat(V / (nbstocks + 1), nbstocks + 1)
+
+
+def make_initialguess(symbols, V=10., init_weights=None, prior_solution=None):
+    # initial unnormalized weights (stocks, then slack) for the optimizer; either from
+    # weights by symbol (normalized to the stocks' share of the cold start), or from the
+    # solution of a prior run ({'symbols': [...], 'x': [...]}, the slack last); symbols
+    # without a given weight take their cold-start value
+    initialguess = get_default_initialguess(len(symbols), V=V)
+    if init_weights is not None:
+        totalweight = sum(init_weights.get(symbol, 0.) for symbol in symbols)
+        if totalweight > 0.:
+            stocks_share = V * len(symbols) / (len(symbols) + 1)
+            for i, symbol in enumerate(symbols):
+                if symbol in init_weights:
+                    initialguess[i] = stocks_share * init_weights[symbol] / totalweight
+    elif prior_solution is not None:
+        prior_x = dict(zip(prior_solution['symbols'], prior_solution['x'][:-1]))
+        for i, symbol in enumerate(symbols):
+            if symbol in prior_x:
+                initialguess[i] = prior_x[symbol]
+        initialguess[-1] = prior_solution['x'][-1]
+    initialguess = np.maximum(initialguess, 0.)
+    if np.sum(initialguess) > V:
+        initialguess *= V / np.sum(initialguess)
+    return initialguess
+
+
+def optimized_portfolio_mpt_entropy_costfunction(r, cov, rf, lamb0, lamb1, V=10., initialguess=None):
+    # same problem as finsim's, but starting from the given initial guess
+    func = partial(mpt_entropy_costfunction, r=r, cov=cov, rf=rf, lamb0=lamb0, lamb1=lamb1, V=V)
+    nbstocks = len(r)
+    constraints = [
+        {'type': 'ineq', 'fun': partial(getarrayelementminusminvalue, minvalue=0., index=i)}
+        for i in range(nbstocks+1)
+    ] + [
+        {'type': 'ineq', 'fun': partial(checksumarray, total=V)}
+    ] + [
+        {'type': 'ineq', 'fun': lambda weights: weights[i]}
+        for i in range(len(r))
+    ]
+    if initialguess is None:
+        initialguess = get_default_initialguess(nbstocks, V=V)
+    return minimize(
+        lambda weights: -func(weights),
+        np.array(initialguess, dtype=np.float64),
+        constraints=constraints
+    )
+
+
+class WarmStartedOptimizedWeightingPolicyUsingMPTEntropyCostFunction(OptimizedWeightingPolicyUsingMPTEntropyCostFunction):
+    def __init__(self, rf, r=None, cov=None, symbols=None, lamb0=0., lamb1=0., V=10., initialguess=None):
+        self.initialguess = initialguess
+        super(WarmStartedOptimizedWeightingPolicyUsingMPTEntropyCostFunction, self).__init__(
+            rf, r=r, cov=cov, symbols=symbols, lamb0=lamb0, lamb1=lamb1, V=V
+        )
+
+    def optimize(self, r, cov, symbols=None):
+        self.optimized_sol = optimized_portfolio_mpt_entropy_costfunction(
+            r, cov, self.rf, self.lamb0, self.lamb1, V=self.V, initialguess=self.initialguess
+        )
+        self.optimized = True
+
+        self.optimized_unnormalized_weights = self.optimized_sol.x
+        self.optimized_weights = self.optimized_unnormalized_weights[:-1] / np.sum(self.optimized_unnormalized_weights[:-1])
+        self.optimized_costfunction = -self.optimized_sol.fun
+        self.optimized_portfolio_yield = np.sum(self.optimized_weights * self.r)
+        sqweights = np.dot(
+            np.expand_dims(self.optimized_weights, axis=1),
+            np.expand_dims(self.optimized_weights, axis=0)
+        )
+        self.optimized_volatility = np.sqrt(np.sum(sqweights * self.cov))
+
+    @property
+    def solution(self):
+        return {'symbols': list(self.symbols), 'x': [float(x) for x in self.optimized_unnormalized_weights]}
+
+
+def solve_mpt_entropy_chain(r, cov, rf, points, V=10., initialguess=None):
+    # points (lamb0, lamb1) solved in order, each starting from its predecessor's solution
+    solutions = []
+    for lamb0, lamb1 in points:
+        sol = optimized_portfolio_mpt_entropy_costfunction(r, cov, rf, lamb0, lamb1, V=V, initialguess=initialguess)
+        initialguess = sol.x
+        solutions.append(sol)
+    return solutions
+
+
+def solve_mpt_entropy_sweep(r, cov, rf, points, V=10., nbprocesses=1, initialguess=None):
+    # the sorted points are cut into contiguous chains, one per process (process_map; serial by
+    # default), so that neighbours warm-start each other within a chain
+    points = sorted(points)
+    nbprocesses = min(nbprocesses if nbprocesses is not None else 1, len(points))
+    if nbprocesses <= 1:
+        return points, solve_mpt_entropy_chain(r, cov, rf, points, V=V, initialguess=initialguess)
+    boundaries = np.linspace(0, len(points), nbprocesses + 1).astype(int)
+    chains = [points[boundaries[k]:boundaries[k+1]] for k in range(nbprocesses)]
+    chain_solutions = process_map(
+        partial(solve_mpt_entropy_chain, r, cov, rf, V=V, initialguess=initialguess),
+        chains,
+        nbprocesses=nbprocesses
+    )
+    return points, [sol for solutions in chain_solutions for sol in solutions]
@@ -0,0 +1,40 @@
+
+import multiprocessing
+
+
+def _run_and_send(function, item, connection):
+    try:
+        connection.send((True, function(item)))
+    except Exception as error:
+        connection.send((False, error))
+    finally:
+        connection.close()
+
+
+def process_map(function, items, nbprocesses=1):
+    # function applied to every item, in at most nbprocesses processes at once, the results being
+    # sent back through pipes; only multiprocessing.Process and Pipe are used, as AWS Lambda has no
+    # /dev/shm for the semaphores of multiprocessing.Pool or ProcessPoolExecutor.
+    # Serial (in this process) when nbprocesses is None or at most 1.
+    items = list(items)
+    if nbprocesses is None or nbprocesses <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    results = []
+    for start in range(0, len(items), nbprocesses):
+        running = []
+        for item in items[start:start+nbprocesses]:
+            receiving_connection, sending_connection = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_and_send, args=(function, item, sending_connection))
+            process.start()
+            sending_connection.close()
+            running.append((process, receiving_connection))
+        # received before joining, so that a large result does not block the child on a full pipe
+        for process, receiving_connection in running:
+            success, result = receiving_connection.recv()
+            receiving_connection.close()
+            process.join()
+            if not success:
+                raise result
+            results.append(result)
+    return results
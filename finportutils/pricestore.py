@@ -0,0 +1,340 @@
+
+import os
+import json
+import fcntl
+import logging
+import threading
+from time import monotonic
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, \
+    USPresidentsDay, USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday
+from finsim.data import get_yahoofinance_data
+
+
+# one array per field (columnar), memory-mapped from its own file and sorted by date, so
+# that a field over a date range is read as a contiguous zero-copy view
+PRICE_FIELD_DTYPES = {
+    'TimeStamp': np.dtype('<M8[D]'),
+    'Open': np.dtype('<f8'),
+    'High': np.dtype('<f8'),
+    'Low': np.dtype('<f8'),
+    'Close': np.dtype('<f8'),
+    'Adj Close': np.dtype('<f8'),
+    'Volume': np.dtype('<f8')
+}
+PRICE_COLUMNS = list(PRICE_FIELD_DTYPES.keys())[1:]
+
+DEFAULT_PRICESTOREDIR = os.path.join('/', 'tmp', 'pricestore')
+
+# ranges downloaded lately whose bars are not stored (empty downloads, bars of today), kept by the
+# process for a while so that the requests in between do not download them again
+_recent_fetches = {}
+_recent_fetches_lock = threading.Lock()
+
+
+def get_last_complete_date():
+    # today's bar may still be moving, so only dates before today (UTC) are stored
+    return datetime.strftime(datetime.utcnow() - timedelta(days=1), '%Y-%m-%d')
+
+
+def shift_datestr(datestr, days):
+    return datetime.strftime(datetime.strptime(datestr, '%Y-%m-%d') + timedelta(days=days), '%Y-%m-%d')
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    # full-day closures of the New York Stock Exchange (special closures left out)
+    rules = [
+        Holiday('New Year\'s Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday)
+    ]
+
+
+_trading_holidays = None
+
+
+def get_trading_holidays():
+    global _trading_holidays
+    if _trading_holidays is None:
+        _trading_holidays = NYSEHolidayCalendar().holidays('1970-01-01', '2099-12-31').to_numpy().astype('datetime64[D]')
+    return _trading_holidays
+
+
+def has_trading_days(startdate, enddate):
+    # whether the range has complete trading days: weekends and holidays have no bars, and
+    # today's is not complete yet
+    enddate = min(enddate, get_last_complete_date())
+    if startdate > enddate:
+        return False
+    return np.busday_count(
+        np.datetime64(startdate, 'D'), np.datetime64(enddate, 'D') + 1, holidays=get_trading_holidays()
+    ) > 0
+
+
+def plan_missing_ranges(covered, startdate, enddate):
+    # date ranges (inclusive) to be downloaded so that the covered range extends over
+    # startdate to enddate; a gap between the request and the covered range is filled
+    # as well, so that the covered range stays contiguous; ranges without complete trading
+    # days (today's bar still moving, weekends, holidays) have nothing to download
+    if covered is None:
+        missing_ranges = [(startdate, enddate)]
+    else:
+        covered_startdate, covered_enddate = covered
+        missing_ranges = []
+        if startdate < covered_startdate:
+            missing_ranges.append((startdate, shift_datestr(covered_startdate, -1)))
+        if enddate > covered_enddate:
+            missing_ranges.append((shift_datestr(covered_enddate, 1), enddate))
+    return [
+        (missing_startdate, missing_enddate)
+        for missing_startdate, missing_enddate in missing_ranges
+        if has_trading_days(missing_startdate, missing_enddate)
+    ]
+
+
+def empty_columns():
+    return {field: np.zeros(0, dtype=dtype) for field, dtype in PRICE_FIELD_DTYPES.items()}
+
+
+def slice_columns(columns, selection):
+    return {field: values[selection] for field, values in columns.items()}
+
+
+def concatenate_columns(columns_list):
+    return {field: np.concatenate([columns[field] for columns in columns_list]) for field in PRICE_FIELD_DTYPES}
+
+
+def convert_yahoofinance_df_to_columns(df):
+    if len(df) == 0:
+        return empty_columns()
+    timestamps = pd.to_datetime(df['TimeStamp'])
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    columns = {'TimeStamp': timestamps.to_numpy().astype('datetime64[D]')}
+    for column in PRICE_COLUMNS:
+        columns[column] = df[column].to_numpy(dtype=np.float64) if column in df.columns else np.full(len(df), np.nan)
+    columns = slice_columns(columns, ~np.isnan(columns['Close']))
+    _, uniqueidx = np.unique(columns['TimeStamp'], return_index=True)
+    return slice_columns(columns, uniqueidx)
+
+
+def convert_columns_to_yahoofinance_df(columns):
+    df = pd.DataFrame({'TimeStamp': columns['TimeStamp'].astype('datetime64[ns]')})
+    for column in PRICE_COLUMNS:
+        df[column] = columns[column]
+    return df
+
+
+class PriceStore:
+    def __init__(self, storedir=None, fetcher=None, recent_ttl=None):
+        self.storedir = storedir if storedir is not None else os.getenv('PRICESTOREDIR', DEFAULT_PRICESTOREDIR)
+        self.fetcher = fetcher if fetcher is not None else get_yahoofinance_data
+        self.recent_ttl = recent_ttl if recent_ttl is not None else float(os.getenv('PRICESTORE_RECENT_TTL', 300.))
+        os.makedirs(self.storedir, exist_ok=True)
+
+    def _symbol_basepath(self, symbol):
+        return os.path.join(self.storedir, symbol.replace(os.sep, '_'))
+
+    def _fieldpath(self, symbol, generation, field):
+        return '{}.{}.{}'.format(self._symbol_basepath(symbol), generation, field.replace(' ', '_'))
+
+    def _metapath(self, symbol):
+        return self._symbol_basepath(symbol) + '.meta.json'
+
+    def _lockpath(self, symbol):
+        return self._symbol_basepath(symbol) + '.lock'
+
+    def _read_meta(self, symbol):
+        # the meta file commits the field files: their generation and number of rows
+        try:
+            meta = json.load(open(self._metapath(symbol), 'r'))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return meta if 'generation' in meta else None   # former layout: downloaded again
+
+    def covered_range(self, symbol):
+        meta = self._read_meta(symbol)
+        if meta is None:
+            return None
+        return meta['query_startdate'], meta['query_enddate']
+
+    def load_columns(self, symbol, meta=None):
+        # only the rows committed in the meta file are mapped, so that a write in progress is not
+        # seen; a generation replaced meanwhile (its files removed) is read again from the meta file
+        for _ in range(3):
+            meta = meta if meta is not None else self._read_meta(symbol)
+            if meta is None or meta['nbrows'] == 0:
+                return empty_columns()
+            try:
+                return {
+                    field: np.memmap(
+                        self._fieldpath(symbol, meta['generation'], field), dtype=dtype, mode='r', shape=(meta['nbrows'],)
+                    )
+                    for field, dtype in PRICE_FIELD_DTYPES.items()
+                }
+            except FileNotFoundError:
+                meta = None
+        raise IOError('Price store of {} changing too fast to be read.'.format(symbol))
+
+    def read_columns(self, symbol, startdate, enddate):
+        columns = self.load_columns(symbol)
+        startidx = np.searchsorted(columns['TimeStamp'], np.datetime64(startdate, 'D'), side='left')
+        endidx = np.searchsorted(columns['TimeStamp'], np.datetime64(enddate, 'D'), side='right')
+        return slice_columns(columns, slice(startidx, endidx))
+
+    def read(self, symbol, startdate, enddate):
+        return convert_columns_to_yahoofinance_df(self.read_columns(symbol, startdate, enddate))
+
+    def _write_meta(self, symbol, query_startdate, query_enddate, generation, nbrows):
+        metapath = self._metapath(symbol)
+        tmppath = '{}.{}.tmp'.format(metapath, os.getpid())
+        json.dump(
+            {
+                'query_startdate': query_startdate,
+                'query_enddate': query_enddate,
+                'generation': generation,
+                'nbrows': nbrows
+            },
+            open(tmppath, 'w')
+        )
+        os.replace(tmppath, metapath)
+
+    def _rewrite_columns(self, symbol, meta, columns, query_startdate, query_enddate):
+        # written as a new generation, committed by the meta file; the former one is removed after
+        generation = 0 if meta is None else meta['generation'] + 1
+        for field, dtype in PRICE_FIELD_DTYPES.items():
+            np.asarray(columns[field], dtype=dtype).tofile(self._fieldpath(symbol, generation, field))
+        self._write_meta(symbol, query_startdate, query_enddate, generation, len(columns['TimeStamp']))
+        if meta is not None:
+            for field in PRICE_FIELD_DTYPES:
+                try:
+                    os.remove(self._fieldpath(symbol, meta['generation'], field))
+                except FileNotFoundError:
+                    pass
+
+    def _append_columns(self, symbol, meta, columns, query_startdate, query_enddate):
+        # rows beyond those committed (an append interrupted before) are cut off first
+        for field, dtype in PRICE_FIELD_DTYPES.items():
+            fieldpath = self._fieldpath(symbol, meta['generation'], field)
+            with open(fieldpath, 'ab') as f:
+                f.truncate(meta['nbrows'] * dtype.itemsize)
+                f.write(np.asarray(columns[field], dtype=dtype).tobytes())
+        self._write_meta(
+            symbol, query_startdate, query_enddate, meta['generation'], meta['nbrows'] + len(columns['TimeStamp'])
+        )
+
+    def store(self, symbol, df, startdate, enddate):
+        enddate = min(enddate, get_last_complete_date())
+        if startdate > enddate:
+            return
+        newcolumns = convert_yahoofinance_df_to_columns(df)
+        if len(newcolumns['TimeStamp']) == 0:
+            # an empty download may be an outage as well as a range without trading days:
+            # the range is not recorded as covered, so that it is downloaded again later
+            logging.warning('No prices downloaded for {} ({} to {}); range not stored'.format(symbol, startdate, enddate))
+            return
+        newcolumns = slice_columns(newcolumns, newcolumns['TimeStamp'] <= np.datetime64(enddate, 'D'))
+
+        with open(self._lockpath(symbol), 'w') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            meta = self._read_meta(symbol)
+            covered = None if meta is None else (meta['query_startdate'], meta['query_enddate'])
+            oldcolumns = self.load_columns(symbol, meta=meta)
+            adjacent_startdate = None if covered is None else shift_datestr(covered[0], -1)
+            adjacent_enddate = None if covered is None else shift_datestr(covered[1], 1)
+
+            if covered is None or enddate < adjacent_startdate or startdate > adjacent_enddate:
+                # nothing stored, or disjoint from what is stored: start afresh
+                self._rewrite_columns(symbol, meta, newcolumns, startdate, enddate)
+            elif len(oldcolumns['TimeStamp']) == 0 or len(newcolumns['TimeStamp']) == 0 \
+                    or newcolumns['TimeStamp'][0] > oldcolumns['TimeStamp'][-1]:
+                self._append_columns(symbol, meta, newcolumns, min(startdate, covered[0]), max(enddate, covered[1]))
+            else:
+                keep = ~np.isin(oldcolumns['TimeStamp'], newcolumns['TimeStamp'])
+                mergedcolumns = concatenate_columns([slice_columns(oldcolumns, keep), newcolumns])
+                mergedcolumns = slice_columns(mergedcolumns, np.argsort(mergedcolumns['TimeStamp'], kind='stable'))
+                self._rewrite_columns(symbol, meta, mergedcolumns, min(startdate, covered[0]), max(enddate, covered[1]))
+
+    def _recent_columns(self, symbol, startdate, enddate):
+        # unstored bars of the range, if within one downloaded less than recent_ttl seconds ago
+        now = monotonic()
+        with _recent_fetches_lock:
+            recent_fetches = list(_recent_fetches.get((self.storedir, symbol), []))
+        for fetchtime, recent_startdate, recent_enddate, columns in recent_fetches:
+            if now - fetchtime <= self.recent_ttl and recent_startdate <= startdate and enddate <= recent_enddate:
+                return slice_columns(
+                    columns,
+                    (columns['TimeStamp'] >= np.datetime64(startdate, 'D')) & (columns['TimeStamp'] <= np.datetime64(enddate, 'D'))
+                )
+        return None
+
+    def _remember_fetch(self, symbol, startdate, enddate, columns):
+        now = monotonic()
+        with _recent_fetches_lock:
+            if len(_recent_fetches) > 1024:
+                for key in list(_recent_fetches.keys()):
+                    if all(now - fetch[0] > self.recent_ttl for fetch in _recent_fetches[key]):
+                        del _recent_fetches[key]
+            key = (self.storedir, symbol)
+            _recent_fetches[key] = [
+                fetch for fetch in _recent_fetches.get(key, []) if now - fetch[0] <= self.recent_ttl
+            ] + [(now, startdate, enddate, columns)]
+
+    def get_symbol_data(self, symbol, startdate, enddate):
+        last_complete_date = get_last_complete_date()
+        missing_ranges = plan_missing_ranges(self.covered_range(symbol), startdate, enddate)
+        if len(missing_ranges) == 0 and enddate <= last_complete_date:
+            logging.debug('Price store hit: {} ({} to {})'.format(symbol, startdate, enddate))
+            return self.read(symbol, startdate, enddate)
+
+        # only download the date ranges not stored yet, nor downloaded lately
+        unstored_columns = []
+        for missing_startdate, missing_enddate in missing_ranges:
+            columns = self._recent_columns(symbol, missing_startdate, missing_enddate)
+            if columns is None:
+                logging.debug('Price store miss: {} ({} to {})'.format(symbol, missing_startdate, missing_enddate))
+                df = self.fetcher(symbol, missing_startdate, missing_enddate)
+                self.store(symbol, df, missing_startdate, missing_enddate)
+                columns = convert_yahoofinance_df_to_columns(df)
+                unstored = len(columns['TimeStamp']) == 0 or missing_enddate > last_complete_date
+                columns = slice_columns(columns, columns['TimeStamp'] > np.datetime64(last_complete_date, 'D'))
+                if unstored:
+                    self._remember_fetch(symbol, missing_startdate, missing_enddate, columns)
+            unstored_columns.append(columns)
+        # today's bars alone are not downloaded, only given when downloaded lately
+        if enddate > last_complete_date and all(missing_enddate <= last_complete_date for _, missing_enddate in missing_ranges):
+            columns = self._recent_columns(symbol, max(startdate, shift_datestr(last_complete_date, 1)), enddate)
+            if columns is not None:
+                unstored_columns.append(columns)
+
+        # bars of today are returned but not stored
+        columns = concatenate_columns(
+            [self.read_columns(symbol, startdate, min(enddate, last_complete_date))] + unstored_columns
+        )
+        columns = slice_columns(
+            columns,
+            (columns['TimeStamp'] >= np.datetime64(startdate, 'D')) & (columns['TimeStamp'] <= np.datetime64(enddate, 'D'))
+        )
+        return convert_columns_to_yahoofinance_df(columns)
+
+    def refresh(self, symbol, enddate=None):
+        covered = self.covered_range(symbol)
+        if covered is None:
+            return
+        enddate = enddate if enddate is not None else get_last_complete_date()
+        for missing_startdate, missing_enddate in plan_missing_ranges(covered, covered[0], enddate):
+            self.store(symbol, self.fetcher(symbol, missing_startdate, missing_enddate), missing_startdate, missing_enddate)
+
+
+def get_symbol_data(symbol, startdate, enddate, storedir=None, fetcher=None):
+    return PriceStore(storedir=storedir, fetcher=fetcher).get_symbol_data(symbol, startdate, enddate)
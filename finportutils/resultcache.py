@@ -0,0 +1,90 @@
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+
+import numpy as np
+
+
+DEFAULT_RESULTCACHEDIR = os.path.join('/', 'tmp', 'resultcache')
+
+
+def normalize_date(datestr):
+    return str(np.datetime64(datestr, 'D'))
+
+
+def normalize_float(value, significant_digits=10):
+    # near-equal floats (e.g., 0.3 and 0.30000000000000004) give the same key
+    return float('{:.{}g}'.format(float(value), significant_digits))
+
+
+def make_cache_key(canonical_query):
+    return hashlib.sha256(json.dumps(canonical_query, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    # content-addressed results on local disk: one JSON file per key, expired after
+    # ttl seconds, and the least recently used ones evicted beyond maxentries
+    def __init__(self, cachedir=None, ttl=86400., maxentries=1000):
+        self.cachedir = cachedir if cachedir is not None else os.getenv('RESULTCACHEDIR', DEFAULT_RESULTCACHEDIR)
+        self.ttl = ttl
+        self.maxentries = maxentries
+        os.makedirs(self.cachedir, exist_ok=True)
+
+    def _entrypath(self, key):
+        return os.path.join(self.cachedir, key + '.json')
+
+    def _lockpath(self):
+        return os.path.join(self.cachedir, '.lock')
+
+    def get(self, key):
+        entrypath = self._entrypath(key)
+        try:
+            entry = json.load(open(entrypath, 'r'))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry['storedtime'] > self.ttl:
+            logging.debug('Result cache expired: {}'.format(key))
+            self._remove(entrypath)
+            return None
+        # the modification time is the last use, for the LRU eviction
+        try:
+            os.utime(entrypath)
+        except FileNotFoundError:
+            pass
+        return entry['result']
+
+    def put(self, key, result):
+        entrypath = self._entrypath(key)
+        tmppath = '{}.{}.tmp'.format(entrypath, os.getpid())
+        json.dump({'storedtime': time.time(), 'result': result}, open(tmppath, 'w'))
+        os.replace(tmppath, entrypath)
+        self.evict()
+
+    def evict(self):
+        with open(self._lockpath(), 'w') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            entries = []
+            for filename in os.listdir(self.cachedir):
+                if not filename.endswith('.json'):
+                    continue
+                entrypath = os.path.join(self.cachedir, filename)
+                try:
+                    entries.append((os.path.getmtime(entrypath), entrypath))
+                except FileNotFoundError:
+                    continue
+            entries = sorted(entries, reverse=True)
+            now = time.time()
+            for rank, (mtime, entrypath) in enumerate(entries):
+                # mtime >= storedtime, so an entry untouched for ttl seconds is expired
+                if rank >= self.maxentries or now - mtime > self.ttl:
+                    self._remove(entrypath)
+
+    def _remove(self, entrypath):
+        try:
+            os.remove(entrypath)
+        except FileNotFoundError:
+            pass
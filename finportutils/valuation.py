@@ -0,0 +1,58 @@
+
+import numpy as np
+import pandas as pd
+from finsim.data.preader import get_dividends_df
+
+
+def get_symbols_dividends(symbols):
+    # dividends per share of every symbol: (dates, amounts), sorted by date
+    dividends = {}
+    for symbol in symbols:
+        dividend_df = get_dividends_df(symbol)
+        dates = np.array(dividend_df['TimeStamp'], dtype='datetime64[D]')
+        amounts = np.array(dividend_df['Dividends'], dtype=np.float64)
+        order = np.argsort(dates, kind='stable')
+        dividends[symbol] = (dates[order], amounts[order])
+    return dividends
+
+
+def cumulate_dividends(timestamps, dividend_dates, dividend_amounts, startdate=None):
+    # dividends paid up to (and including) every date, counted from startdate if given
+    cumamounts = np.concatenate([[0.], np.cumsum(dividend_amounts)])
+    dates = np.array(timestamps, dtype='datetime64[D]')
+    cash = cumamounts[np.searchsorted(dividend_dates, dates, side='right')]
+    if startdate is not None:
+        cash -= cumamounts[np.searchsorted(dividend_dates, np.datetime64(startdate, 'D'), side='left')]
+    return cash
+
+
+def compute_effective_prices(timestamps, pricematrix, symbols, dividends):
+    # prices plus the cumulated dividends per share, as finsim's estimation including dividends
+    effprices = np.array(pricematrix, dtype=np.float64)
+    for j, symbol in enumerate(symbols):
+        dividend_dates, dividend_amounts = dividends[symbol]
+        effprices[:, j] += cumulate_dividends(timestamps, dividend_dates, dividend_amounts)
+    return effprices
+
+
+def compute_portfolio_values_overtime(timestamps, pricematrix, symbols, nbshares, dividends, startdate):
+    # value of the holdings (prices aligned and forward-filled, one column per symbol) on every
+    # date, plus the cash from the dividends paid since startdate; same columns as finsim's
+    # DynamicPortfolioWithDividends.get_portfolio_values_overtime
+    nbshares = np.array([nbshares[symbol] for symbol in symbols], dtype=np.float64)
+    stock_value = np.nan_to_num(pricematrix, nan=0.) @ nbshares
+    dates = np.array(timestamps, dtype='datetime64[D]')
+    cash = np.zeros(len(dates))
+    dividend = np.zeros(len(dates))
+    for j, symbol in enumerate(symbols):
+        dividend_dates, dividend_amounts = dividends[symbol]
+        cash += nbshares[j] * cumulate_dividends(dates, dividend_dates, dividend_amounts, startdate=startdate)
+        paid = np.isin(dividend_dates, dates)
+        dividend[np.searchsorted(dates, dividend_dates[paid])] += nbshares[j] * dividend_amounts[paid]
+    return pd.DataFrame({
+        'TimeStamp': [str(date) for date in dates],
+        'stock_value': stock_value,
+        'dividend': dividend,
+        'cash': cash,
+        'value': stock_value + cash
+    })
@@ -3,11 +3,16 @@ import logging
 import json
 from datetime import datetime, timedelta
 
-import numpy as np
 import pandas as pd
-from finsim.data import get_yahoofinance_data
+from finportutils import get_symbol_data
 from lppl.fit import LPPLModel
 
+from multistartlppl import multistart_fit_lppl, tc_distribution
+
+
+def tc_to_date(tc):
+    return pd.Timestamp.fromtimestamp(tc).strftime('%Y-%m-%d')
+
 
 def lambda_handler(event, context):
     # getting info
@@ -19,27 +24,59 @@ def lambda_handler(event, context):
     symbol = query.get('symbol', '^GSPC')
     startdate = query.get('startdate', (datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d'))
     enddate = query.get('enddate', datetime.today().strftime('%Y-%m-%d'))
+    multistart = query.get('multistart', False)
 
     # getting data
     logging.info('Getting symbol {} data'.format(symbol))
-    symdf = get_yahoofinance_data(symbol, startdate, enddate)
+    symdf = get_symbol_data(symbol, startdate, enddate)
 
     # fitting
-    logging.info('Model fitting')
+    ts = symdf['TimeStamp'].map(lambda ts: ts.timestamp()).to_numpy()
     fitted_lppl_model = LPPLModel()
     fitted_lppl_model.tcgap = 60 * 60 * 24
-    fitted_lppl_model.fit(symdf['TimeStamp'].map(lambda ts: ts.timestamp()), symdf['Close'])
+    if multistart:
+        # grid of critical times x random (m, omega), in parallel, instead of one fit
+        nbtc = query.get('nbtc', 20)
+        nbstarts = query.get('nbstarts', 4)
+        tc_horizon = query.get('tc_horizon', None)     # in days after enddate
+        logging.info('Model fitting ({} critical times x {} starts)'.format(nbtc, nbstarts))
+        best_fit, fits = multistart_fit_lppl(
+            ts,
+            symdf['Close'].to_numpy(),
+            nbtc=nbtc,
+            nbstarts=nbstarts,
+            tcgap=fitted_lppl_model.tcgap,
+            horizon=tc_horizon * 60 * 60 * 24 if tc_horizon is not None else None,
+            mbounds=(fitted_lppl_model.m_lo, fitted_lppl_model.m_hi),
+            omegabounds=(fitted_lppl_model.omega_lo, fitted_lppl_model.omega_hi),
+            nbprocesses=query.get('nbprocesses', 1),
+            seed=query.get('seed', None)
+        )
+        model_parameters = {name: best_fit[name] for name in ['tc', 'm', 'omega', 'A', 'B', 'C', 'phi']}
+        tcs, tc_quantiles = tc_distribution(fits, best_fit['sse'], tolerance=query.get('sse_tolerance', 0.1))
+    else:
+        logging.info('Model fitting')
+        fitted_lppl_model.fit(ts, symdf['Close'])
+        model_parameters = fitted_lppl_model.dump_model_parameters()
 
     # gathering output info
-    model_parameters = fitted_lppl_model.dump_model_parameters()
     output_dict = {
         'symbol': symbol,
         'startdate': startdate,
         'enddate': enddate,
-        'estimated_crash_date': pd.Timestamp.fromtimestamp(model_parameters['tc']).strftime('%Y-%m-%d'),
+        'estimated_crash_date': tc_to_date(model_parameters['tc']),
         'estimated_crash_time': str(pd.Timestamp.fromtimestamp(model_parameters['tc'])),
         'model_param': model_parameters
     }
+    if multistart:
+        # critical times of the fits nearly as good as the best one
+        output_dict['sum_squared_residuals'] = best_fit['sse']
+        output_dict['tc_distribution'] = {
+            'nbfits': len(fits),
+            'nbretained': len(tcs),
+            'quantiles': {'{:g}%'.format(q * 100): tc_to_date(tc) for q, tc in tc_quantiles.items()},
+            'crash_dates': [tc_to_date(tc) for tc in tcs]
+        }
 
     req_res = {
         'isBase64Encoded': False,
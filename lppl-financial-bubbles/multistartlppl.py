@@ -0,0 +1,117 @@
+
+from functools import partial
+
+import numpy as np
+from scipy.optimize import minimize, Bounds
+from finportutils import process_map
+
+
+def lppl_design_matrix(ts, tc, m, omega):
+    # log p(t) = A + B f + C1 f cos(omega log(tc-t)) + C2 f sin(omega log(tc-t)), f = (tc-t)^m
+    dt = tc - ts
+    f = dt ** m
+    logdt = np.log(dt)
+    return np.stack([np.ones(len(ts)), f, f * np.cos(omega * logdt), f * np.sin(omega * logdt)], axis=1)
+
+
+def solve_linear_parameters(ts, logprices, tc, m, omega):
+    # A, B, C1 = C cos(phi) and C2 = C sin(phi) are slaved to (tc, m, omega): one least-squares
+    # solve, which gives the sum of squared residuals too
+    X = lppl_design_matrix(ts, tc, m, omega)
+    coefs = np.linalg.lstsq(X, logprices, rcond=None)[0]
+    return coefs, float(np.sum(np.square(logprices - X @ coefs)))
+
+
+def fit_lppl_from_start(ts, logprices, start, tcbounds, mbounds, omegabounds):
+    # local search of (tc, m, omega) from the start, the linear parameters being solved at every
+    # step; the variables are scaled to be of order one (tc: from the last date, in units of the
+    # length of the series; omega: in units of its upper bound)
+    tmax = np.max(ts)
+    scale = np.array([np.max(ts) - np.min(ts), 1., omegabounds[1]])
+    offset = np.array([tmax, 0., 0.])
+
+    def costfunction(x):
+        tc, m, omega = offset + x * scale
+        return solve_linear_parameters(ts, logprices, tc, m, omega)[1]
+
+    lowerbounds = (np.array([tcbounds[0], mbounds[0], omegabounds[0]]) - offset) / scale
+    upperbounds = (np.array([tcbounds[1], mbounds[1], omegabounds[1]]) - offset) / scale
+    x0 = np.clip((np.array(start) - offset) / scale, lowerbounds, upperbounds)
+    sol = minimize(costfunction, x0=x0, bounds=Bounds(lowerbounds, upperbounds), method='Nelder-Mead')
+
+    tc, m, omega = offset + sol.x * scale
+    (A, B, C1, C2), sse = solve_linear_parameters(ts, logprices, tc, m, omega)
+    return {
+        'tc': float(tc),
+        'm': float(m),
+        'omega': float(omega),
+        'A': float(A),
+        'B': float(B),
+        'C': float(np.hypot(C1, C2)),
+        'phi': float(np.arctan2(C2, C1)),
+        'sse': sse
+    }
+
+
+def fit_lppl_starts(ts, logprices, starts, tcbounds, mbounds, omegabounds):
+    return [
+        fit_lppl_from_start(ts, logprices, start, tcbounds, mbounds, omegabounds)
+        for start in starts
+    ]
+
+
+def multistart_fit_lppl(
+        ts,
+        prices,
+        nbtc=20,
+        nbstarts=4,
+        tcgap=86400.,
+        horizon=None,
+        mbounds=(0.1, 0.9),
+        omegabounds=(6. / (24. * 3600), 13. / (24. * 3600)),
+        nbprocesses=1,
+        seed=None
+):
+    # fits from a grid of nbtc critical times between the last date (plus tcgap) and the last date
+    # plus horizon (default: a third of the length of the series), each with nbstarts random (m, omega),
+    # serially, or shared among nbprocesses processes; returns the best fit (least squared residuals)
+    # and all the fits
+    ts = np.asarray(ts, dtype=np.float64)
+    logprices = np.log(np.asarray(prices, dtype=np.float64))
+    tmax = np.max(ts)
+    if horizon is None:
+        horizon = (tmax - np.min(ts)) / 3.
+    tcbounds = (tmax + tcgap, tmax + max(horizon, 2 * tcgap))
+
+    rng = np.random.default_rng(seed)
+    starts = [
+        (tc, rng.uniform(*mbounds), rng.uniform(*omegabounds))
+        for tc in np.linspace(tcbounds[0], tcbounds[1], nbtc)
+        for _ in range(nbstarts)
+    ]
+
+    fitfunction = partial(fit_lppl_starts, ts, logprices, tcbounds=tcbounds, mbounds=mbounds, omegabounds=omegabounds)
+    nbprocesses = min(nbprocesses if nbprocesses is not None else 1, len(starts))
+    if nbprocesses <= 1:
+        fits = fitfunction(starts)
+    else:
+        # one batch of starts per process (multiprocessing.Process and Pipe, which work on Lambda)
+        boundaries = np.linspace(0, len(starts), nbprocesses + 1).astype(int)
+        fits = [
+            fit
+            for batch_fits in process_map(
+                fitfunction,
+                [starts[boundaries[k]:boundaries[k+1]] for k in range(nbprocesses)],
+                nbprocesses=nbprocesses
+            )
+            for fit in batch_fits
+        ]
+
+    best_fit = min(fits, key=lambda fit: fit['sse'])
+    return best_fit, fits
+
+
+def tc_distribution(fits, best_sse, tolerance=0.1, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    # critical times of the fits whose squared residuals are within (1 + tolerance) of the best
+    tcs = np.sort([fit['tc'] for fit in fits if fit['sse'] <= (1. + tolerance) * best_sse])
+    return tcs, {q: float(np.quantile(tcs, q)) for q in quantiles}
@@ -1,28 +1,74 @@
 
 import logging
 import json
-from time import sleep
-from socket import timeout
-from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
-from finsim.estimate.fit import fit_BlackScholesMerton_model
-from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk, estimate_beta
-from finsim.data import get_yahoofinance_data
+import numpy as np
+from finportutils import PriceStore, RetryingFetcher, UpstreamUnavailableError, build_price_matrix, \
+    estimate_symbols_statistics, asof_align
 
 
-def waiting_get_yahoofinance_data(symbol, startdate, enddate, waittime=1):
-    done = False
-    while not done:
+def estimate_symbols_info(symbols, startdate, enddate, index='^GSPC', waittime=1, maxworkers=10):
+    pricestore = PriceStore(fetcher=RetryingFetcher(waittime=waittime))
+
+    # getting index (once for all symbols)
+    indexdf = pricestore.get_symbol_data(index, startdate, enddate)
+
+    # getting stock data concurrently
+    with ThreadPoolExecutor(max_workers=maxworkers) as executor:
+        futures = {
+            symbol: executor.submit(pricestore.get_symbol_data, symbol, startdate, enddate)
+            for symbol in symbols
+        }
+    symdfs = {}
+    failed_symbols = {}
+    for symbol, future in futures.items():
         try:
-            symdf = get_yahoofinance_data(symbol, startdate, enddate)
-            done = True
-        except ConnectionError:
-            sleep(10)
-        except URLError as error:
-            if isinstance(error, timeout):
-                sleep(waittime)
-    return symdf
+            symdf = future.result()
+        except UpstreamUnavailableError as error:
+            logging.error(error)
+            failed_symbols[symbol] = 'Data source unavailable: {}'.format(error)
+            continue
+        print("{}: number of lines: {}".format(symbol, len(symdf)))
+        if len(symdf) == 0:
+            failed_symbols[symbol] = 'No data between {} and {}.'.format(startdate, enddate)
+        else:
+            symdfs[symbol] = symdf
+    if len(symdfs) == 0:
+        # all symbols failed: nothing to estimate
+        return {}, failed_symbols
+
+    # estimation (all symbols aligned in one matrix; the index on the same dates, the beta
+    # being estimated on the dates both the symbol and the index have prices)
+    estimated_symbols = list(symdfs.keys())
+    timestamps, pricematrix = build_price_matrix([symdfs[symbol] for symbol in estimated_symbols])
+    index_prices = asof_align(
+        timestamps,
+        indexdf['TimeStamp'].to_numpy(),
+        indexdf['Close'].to_numpy(),
+        maxlag=np.timedelta64(0, 's')
+    )
+    statistics = estimate_symbols_statistics(timestamps, pricematrix, index_prices=index_prices)
+
+    symbols_estimations = {}
+    for j, symbol in enumerate(estimated_symbols):
+        beta = statistics['beta'][j]
+        if not np.isfinite(beta):
+            logging.warning('Index {} failed to be integrated for {}.'.format(index, symbol))
+            beta = None
+        symbols_estimations[symbol] = {
+            'symbol': symbol,
+            'r': float(statistics['r'][j]),
+            'vol': float(statistics['vol'][j]),
+            'downside_risk': float(statistics['downside_risk'][j]),
+            'upside_risk': float(statistics['upside_risk'][j]),
+            'beta': float(beta) if beta is not None else None,
+            'data_startdate': str(timestamps[statistics['startidx'][j]].astype('datetime64[D]')),
+            'data_enddate': str(timestamps[statistics['endidx'][j]].astype('datetime64[D]')),
+            'nbrecs': int(statistics['nbrecs'][j]),
+        }
+
+    return symbols_estimations, failed_symbols
 
 
 def symbol_handler(event, context):
@@ -31,59 +77,46 @@ def symbol_handler(event, context):
     logging.info(context)
     query = json.loads(event['body'])
 
-    # getting user inputs
-    symbol = query['symbol']
+    # getting user inputs (either one symbol, or a list of symbols)
+    batch = 'symbols' in query
+    symbols = query['symbols'] if batch else [query['symbol']]
     startdate = query['startdate']
     enddate = query['enddate']
     waittime = query.get('waittime', 1)
     index = query.get('index', '^GSPC')   # S&P 500 index as the base.
+    maxworkers = query.get('maxworkers', 10)
 
-    # getting stock data
-    symdf = waiting_get_yahoofinance_data(symbol, startdate, enddate, waittime=waittime)
-    print("Number of lines: {}".format(len(symdf)))
-
-    # getting index
-    indexdf = waiting_get_yahoofinance_data(index, startdate, enddate, waittime=waittime)
-
-    # estimation
-    isrownull = symdf['Close'].isnull()
-    r, sigma = fit_BlackScholesMerton_model(
-        symdf.loc[~isrownull, 'TimeStamp'].to_numpy(),
-        symdf.loc[~isrownull, 'Close'].to_numpy()
-    )
-    downside_risk = estimate_downside_risk(
-        symdf.loc[~isrownull, 'TimeStamp'].to_numpy(),
-        symdf.loc[~isrownull, 'Close'].to_numpy(),
-        0.0
-    )
-    upside_risk = estimate_upside_risk(
-        symdf.loc[~isrownull, 'TimeStamp'].to_numpy(),
-        symdf.loc[~isrownull, 'Close'].to_numpy(),
-        0.0
-    )
     try:
-        mgdf = indexdf[['TimeStamp', 'Close']].merge(symdf[['TimeStamp', 'Close']], on='TimeStamp', how='left')
-        mgdf = mgdf.loc[~pd.isna(mgdf['Close_x']) & ~pd.isna(mgdf['Close_y']), :]
-        beta = estimate_beta(
-            mgdf['TimeStamp'].to_numpy(),
-            mgdf['Close_y'].to_numpy(),
-            mgdf['Close_x'].to_numpy()
+        symbols_estimations, failed_symbols = estimate_symbols_info(
+            symbols,
+            startdate,
+            enddate,
+            index=index,
+            waittime=waittime,
+            maxworkers=maxworkers
         )
-    except:
-        logging.warning('Index {} failed to be integrated.'.format(index))
-        beta = None
-
-    estimations = {
-        'symbol': symbol,
-        'r': float(r),
-        'vol': float(sigma),
-        'downside_risk': float(downside_risk),
-        'upside_risk': float(upside_risk),
-        'beta': float(beta) if beta is not None else None,
-        'data_startdate': symdf['TimeStamp'][0].date().strftime('%Y-%m-%d'),
-        'data_enddate': symdf['TimeStamp'][len(symdf)-1].date().strftime('%Y-%m-%d'),
-        'nbrecs': len(symdf.loc[~isrownull, :]),
-    }
+    except UpstreamUnavailableError as error:
+        logging.error(error)
+        return {
+            'isBase64Encoded': False,
+            'statusCode': 503,
+            'body': 'Data source unavailable: {}'.format(error)
+        }
+
+    if batch:
+        estimations = {
+            'index': index,
+            'estimations': symbols_estimations,
+            'failed': failed_symbols
+        }
+    elif symbols[0] in failed_symbols:
+        return {
+            'isBase64Encoded': False,
+            'statusCode': 503,
+            'body': failed_symbols[symbols[0]]
+        }
+    else:
+        estimations = symbols_estimations[symbols[0]]
 
     req_res = {
         'isBase64Encoded': False,
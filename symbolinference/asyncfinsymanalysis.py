@@ -1,20 +1,27 @@
 
 import argparse
-from socket import timeout
+import json
 import sys
 import os
-from urllib.error import URLError
 import logging
 import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from tqdm import tqdm
 import numpy as np
 import pandas as pd
-from finsim.estimate.fit import fit_BlackScholesMerton_model
-from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk
-from finsim.data import get_yahoofinance_data
+from finportutils import PriceStore, RetryingFetcher, UpstreamUnavailableError, build_price_matrix, \
+    estimate_symbols_statistics, write_records
 
 
+ESTIMATION_COLUMNS = ['symbol', 'r', 'vol', 'downside_risk', 'upside_risk', 'startdate', 'enddate', 'nbrecs',
+                      'description', 'type']
+
+# errors of a symbol's own data (parsing, missing columns...), the same in every run; any other
+# error (network, timeout, upstream down, crashed worker) may pass in the next run
+DETERMINISTIC_ERRORS = (KeyError, ValueError, TypeError, IndexError)
+
 logginglevel_dict = {
     'debug': logging.DEBUG,
     'info': logging.INFO,
@@ -28,95 +35,240 @@ def get_argparser():
     argparser = argparse.ArgumentParser(description='Extract and calculate interest rate and volatility of symbols.')
     argparser.add_argument('startdate', help='start date')
     argparser.add_argument('enddate', help='end date')
-    argparser.add_argument('outputfile', help='path of output Excel file')
+    argparser.add_argument('outputfile', help='path of output file (extensions: ".xlsx", ".parquet", ".csv", ".json")')
     argparser.add_argument('--localsymdf', default=os.path.dirname(__file__), help='location of allsymdf.h5')
-    argparser.add_argument('--cacheddir', default=None, help='Cached directory (Default: None, meaning no caching)')
+    argparser.add_argument('--cacheddir', default=None,
+                           help='Cached directory of the price store (Default: None, meaning no caching)')
     argparser.add_argument('--logginglevel', default='info', help='Logging level (default: info, options: {})'.format(
         ', '.join(logginglevel_dict.keys())))
-    argparser.add_argument('--waittime', default=1, type=int, help='waiting time (sec) for time-out error (default: 1)')
+    argparser.add_argument('--waittime', default=1, type=int, help='base waiting time (sec) of the backoff between retries (default: 1)')
     argparser.add_argument('--batchslice', default=50, type=int,
-                           help='number of symbols to be queried in parallel at the same time (default: 50)')
+                           help='maximum number of symbols being processed concurrently (default: 50)')
+    argparser.add_argument('--nbprocesses', default=None, type=int,
+                           help='number of processes for the estimation (default: None, meaning number of CPUs)')
+    argparser.add_argument('--estimationbatch', default=256, type=int,
+                           help='number of symbols estimated together in one matrix computation (default: 256)')
+    argparser.add_argument('--checkpoint', default=None,
+                           help='path of the checkpoint (JSON lines) of the symbols done; rerunning with it resumes the run '
+                                '(default: outputfile + ".checkpoint.jsonl")')
     return argparser
 
 
-async def waiting_get_yahoofinance_data(symbol, startdate, enddate, cacheddir=None, waittime=1):
-    done = False
-    while not done:
-        try:
-            symdf = get_yahoofinance_data(symbol, startdate, enddate, cacheddir=cacheddir)
-            done = True
-        except ConnectionError:
-            await asyncio.sleep(10)
-        except URLError as error:
-            if isinstance(error, timeout):
-                await asyncio.sleep(waittime)
-    return symdf
-
-
-async def async_compute_symbol_info(symbol, startdate, enddate, cacheddir=None, waittime=1):
-    symdf = await waiting_get_yahoofinance_data(symbol, startdate, enddate, cacheddir=cacheddir, waittime=waittime)
-    if len(symdf) > 0:
-        try:
-            isrownull = symdf['Close'].isnull()
-            r, sigma = fit_BlackScholesMerton_model(
-                np.array(symdf.loc[~isrownull, 'TimeStamp']),
-                np.array(symdf.loc[~isrownull, 'Close'])
-            )
-            downside_risk = estimate_downside_risk(
-                np.array(symdf.loc[~isrownull, 'TimeStamp']),
-                np.array(symdf.loc[~isrownull, 'Close']),
-                0.0
-            )
-            upside_risk = estimate_upside_risk(
-                np.array(symdf.loc[~isrownull, 'TimeStamp']),
-                np.array(symdf.loc[~isrownull, 'Close']),
-                0.0
-            )
-            estimations = {
-                'symbol': symbol,
-                'r': r,
-                'vol': sigma,
-                'downside_risk': downside_risk,
-                'upside_risk': upside_risk,
-                'startdate': symdf['TimeStamp'][0].date().strftime('%Y-%m-%d'),
-                'enddate': symdf['TimeStamp'][-1].date().strftime('%Y-%m-%d'),
-                'nbrecs': len(symdf.loc[~isrownull, :]),
-                'description': list(concernedsymdf['description'][concernedsymdf['symbol'] == symbol])[0],
-                'type': list(concernedsymdf['type'][concernedsymdf['symbol'] == symbol])[0]
-            }
-        except ZeroDivisionError:
-            logging.warning('Division by zero error for symbol {}; skipping.'.format(symbol))
-            estimations = {}
-        except TypeError:
-            logging.error('TypeError: symbol: {}; df: {}'.format(symbol, len(symdf)))
-            estimations = {}
+def fetch_symbol_data(symbol, startdate, enddate, cacheddir=None, waittime=1):
+    fetcher = RetryingFetcher(waittime=waittime)
+    if cacheddir is None:
+        return fetcher(symbol, startdate, enddate)
     else:
-        estimations = {}
+        # only the dates not cached yet are downloaded
+        return PriceStore(cacheddir, fetcher=fetcher).get_symbol_data(symbol, startdate, enddate)
+
+
+def compute_batch_estimations(symbols, symdfs):
+    # CPU-bound; run in the process pool, as one matrix computation for the whole batch
+    timestamps, pricematrix = build_price_matrix(symdfs)
+    statistics = estimate_symbols_statistics(timestamps, pricematrix)
+    batch_estimations = []
+    for j, symbol in enumerate(symbols):
+        if not (np.isfinite(statistics['r'][j]) and np.isfinite(statistics['vol'][j])):
+            logging.warning('Estimation failed for symbol {}; skipping.'.format(symbol))
+            batch_estimations.append({})
+            continue
+        batch_estimations.append({
+            'symbol': symbol,
+            'r': float(statistics['r'][j]),
+            'vol': float(statistics['vol'][j]),
+            'downside_risk': float(statistics['downside_risk'][j]),
+            'upside_risk': float(statistics['upside_risk'][j]),
+            'startdate': str(timestamps[statistics['startidx'][j]].astype('datetime64[D]')),
+            'enddate': str(timestamps[statistics['endidx'][j]].astype('datetime64[D]')),
+            'nbrecs': int(statistics['nbrecs'][j])
+        })
+    return batch_estimations
+
+
+async def async_fetch_symbol_data(symbol, startdate, enddate, io_executor, cacheddir=None, waittime=1):
+    loop = asyncio.get_running_loop()
+    try:
+        symdf = await loop.run_in_executor(
+            io_executor,
+            partial(fetch_symbol_data, symbol, startdate, enddate, cacheddir=cacheddir, waittime=waittime)
+        )
+    except UpstreamUnavailableError as error:
+        # not checkpointed, so that it is retried in the next run
+        logging.error('Symbol {} not retrieved: {}'.format(symbol, error))
+        return None
+    return symdf.loc[~symdf['Close'].isnull(), ['TimeStamp', 'Close']]
 
-    return estimations
 
+def is_deterministic_failure(error):
+    return isinstance(error, DETERMINISTIC_ERRORS)
 
-def sliced_estimate_all_symbols_from_yahoo(symbols, startdate, enddate, cacheddir=None, waittime=1, slicesize=50):
+
+def read_checkpoint(checkpointpath):
+    # one JSON line per symbol done; lines without estimates are symbols without data,
+    # or symbols that failed (with the error under 'failed')
+    symbols_done = set()
+    all_estimations = {}
+    if not os.path.exists(checkpointpath):
+        return symbols_done, all_estimations
+    for line in open(checkpointpath, 'r'):
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            # last line truncated by an interrupted run
+            continue
+        symbols_done.add(item['symbol'])
+        if len(item) > 1 and 'failed' not in item:
+            all_estimations[item['symbol']] = item
+    return symbols_done, all_estimations
+
+
+def export_estimations(all_estimations, outputfile):
+    # streamed row by row, without a dataframe of the whole universe
+    # (extensions: .xlsx, .parquet, .csv, .json)
+    write_records(outputfile, all_estimations.values(), columns=ESTIMATION_COLUMNS)
+
+
+async def async_estimate_all_symbols_from_yahoo(
+        symbols,
+        startdate,
+        enddate,
+        symbols_info=None,
+        cacheddir=None,
+        waittime=1,
+        concurrency=50,
+        nbprocesses=None,
+        estimation_batchsize=256,
+        checkpointpath=None
+):
     all_estimations = {}
-    nbsymbols = len(symbols)
-
-    for startidx in tqdm(range(0, nbsymbols, slicesize)):
-        loop = asyncio.get_event_loop()
-        async_this_estimations = asyncio.gather(*[
-            async_compute_symbol_info(symbol, startdate, enddate, cacheddir=cacheddir, waittime=waittime)
-            for symbol in symbols[startidx:min(startidx + slicesize, nbsymbols)]
-        ])
-        completed_this_estimations = loop.run_until_complete(async_this_estimations)
-        this_estimations = {
-            item['symbol']: item
-            for item in completed_this_estimations
-            if len(item) > 0
-        }
-        all_estimations.update(this_estimations)
+    checkpointfile = None
+    if checkpointpath is not None:
+        symbols_done, all_estimations = read_checkpoint(checkpointpath)
+        if len(symbols_done) > 0:
+            logging.info('Resuming from {}: {} symbols done.'.format(checkpointpath, len(symbols_done)))
+        symbols = [symbol for symbol in symbols if symbol not in symbols_done]
+        checkpointfile = open(checkpointpath, 'a')
+
+    def record_estimations(symbol, estimations):
+        if len(estimations) > 0:
+            symbol_info = symbols_info.get(symbol, {}) if symbols_info is not None else {}
+            estimations['description'] = symbol_info.get('description')
+            estimations['type'] = symbol_info.get('type')
+            all_estimations[symbol] = estimations
+        if checkpointfile is not None:
+            checkpointfile.write(json.dumps(estimations if len(estimations) > 0 else {'symbol': symbol}) + '\n')
+            checkpointfile.flush()
+
+    def record_failure(symbol, error):
+        # a failure on the symbol's own data is checkpointed as done, so that a resumed run does
+        # not stop at the same symbol again; any other is left out, to be retried by the next run
+        if not is_deterministic_failure(error):
+            logging.error('Symbol {} not estimated, left to the next run: {}'.format(symbol, error))
+            return
+        logging.error('Symbol {} failed: {}'.format(symbol, error))
+        if checkpointfile is not None:
+            checkpointfile.write(json.dumps({'symbol': symbol, 'failed': str(error)}) + '\n')
+            checkpointfile.flush()
+
+    # sliding window: a new symbol starts as soon as any symbol in flight is done
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
 
+    with ThreadPoolExecutor(max_workers=concurrency) as io_executor, \
+            ProcessPoolExecutor(max_workers=nbprocesses) as cpu_executor:
+        async def bounded_fetch_symbol_data(symbol):
+            async with semaphore:
+                try:
+                    return symbol, await async_fetch_symbol_data(
+                        symbol,
+                        startdate,
+                        enddate,
+                        io_executor,
+                        cacheddir=cacheddir,
+                        waittime=waittime
+                    )
+                except Exception as error:
+                    # any other error fails this symbol only
+                    return symbol, error
+
+        async def estimate_batch(batch_symbols, batch_symdfs):
+            try:
+                batch_estimations = await loop.run_in_executor(
+                    cpu_executor,
+                    compute_batch_estimations,
+                    batch_symbols,
+                    batch_symdfs
+                )
+            except Exception as error:
+                # estimated one by one, so that only the symbols failing on their own data are failed
+                logging.error('Estimation of a batch of {} symbols failed ({}); estimating them one by one.'.format(
+                    len(batch_symbols), error))
+                for symbol, symdf in zip(batch_symbols, batch_symdfs):
+                    try:
+                        estimations = await loop.run_in_executor(cpu_executor, compute_batch_estimations, [symbol], [symdf])
+                    except Exception as symbol_error:
+                        record_failure(symbol, symbol_error)
+                        continue
+                    record_estimations(symbol, estimations[0])
+                return
+            for symbol, estimations in zip(batch_symbols, batch_estimations):
+                record_estimations(symbol, estimations)
+
+        # downloaded symbols are estimated in batches, while the downloads go on
+        batch_tasks = []
+        batch_symbols, batch_symdfs = [], []
+        tasks = [bounded_fetch_symbol_data(symbol) for symbol in symbols]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            symbol, symdf = await task
+            if symdf is None:
+                continue
+            if isinstance(symdf, Exception):
+                record_failure(symbol, symdf)
+                continue
+            if len(symdf) == 0:
+                record_estimations(symbol, {})
+                continue
+            batch_symbols.append(symbol)
+            batch_symdfs.append(symdf)
+            if len(batch_symbols) >= estimation_batchsize:
+                batch_tasks.append(asyncio.ensure_future(estimate_batch(batch_symbols, batch_symdfs)))
+                batch_symbols, batch_symdfs = [], []
+        if len(batch_symbols) > 0:
+            batch_tasks.append(asyncio.ensure_future(estimate_batch(batch_symbols, batch_symdfs)))
+        await asyncio.gather(*batch_tasks)
+
+    if checkpointfile is not None:
+        checkpointfile.close()
     return all_estimations
 
 
+def sliced_estimate_all_symbols_from_yahoo(
+        symbols,
+        startdate,
+        enddate,
+        symbols_info=None,
+        cacheddir=None,
+        waittime=1,
+        slicesize=50,
+        nbprocesses=None,
+        estimation_batchsize=256,
+        checkpointpath=None
+):
+    return asyncio.run(async_estimate_all_symbols_from_yahoo(
+        symbols,
+        startdate,
+        enddate,
+        symbols_info=symbols_info,
+        cacheddir=cacheddir,
+        waittime=waittime,
+        concurrency=slicesize,
+        nbprocesses=nbprocesses,
+        estimation_batchsize=estimation_batchsize,
+        checkpointpath=checkpointpath
+    ))
+
+
 if __name__ == '__main__':
     argparser = get_argparser()
     args = argparser.parse_args()
@@ -129,6 +281,9 @@ if __name__ == '__main__':
     logginglevel = args.logginglevel
     waittime = args.waittime
     slicesize = args.batchslice
+    nbprocesses = args.nbprocesses
+    estimation_batchsize = args.estimationbatch
+    checkpointpath = args.checkpoint if args.checkpoint is not None else outputfile + '.checkpoint.jsonl'
 
     # logging level
     logging.basicConfig(level=logginglevel_dict[logginglevel])
@@ -143,18 +298,25 @@ if __name__ == '__main__':
     concernedsymdf = allsymdf
     # concernedsymdf = allsymdf[allsymdf['type']!='']
 
+    symbols_info = {
+        row['symbol']: {'description': row['description'], 'type': row['type']}
+        for row in concernedsymdf[['symbol', 'description', 'type']].to_dict(orient='records')
+    }
+
     # extracting Yahoo Finance Data
     all_estimations = sliced_estimate_all_symbols_from_yahoo(
         list(concernedsymdf['symbol']),
         startdate,
         enddate,
+        symbols_info=symbols_info,
         cacheddir=cacheddir,
         waittime=waittime,
-        slicesize=slicesize
+        slicesize=slicesize,
+        nbprocesses=nbprocesses,
+        estimation_batchsize=estimation_batchsize,
+        checkpointpath=checkpointpath
     )
 
     # Writing out
     print('Writing to {}'.format(outputfile))
-    pd.DataFrame([
-        {'symbol': key, **values} for key, values in all_estimations.items()
-    ]).to_excel(outputfile)
+    export_estimations(all_estimations, outputfile)
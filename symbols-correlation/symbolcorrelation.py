@@ -1,28 +1,109 @@
 
 import logging
 import json
-from time import sleep
-from socket import timeout
-from urllib.error import URLError
 from math import sqrt
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-from finsim.data import get_yahoofinance_data
 from finsim.estimate.fit import fit_multivariate_BlackScholesMerton_model
+from finportutils import PriceStore, RetryingFetcher, UpstreamUnavailableError, build_price_matrix, \
+    ledoit_wolf_shrinkage, shrink_covariance, rolling_correlations, SECONDS_PER_YEAR, make_response
 
 
-def waiting_get_yahoofinance_data(symbol, startdate, enddate, waittime=1):
-    done = False
-    while not done:
-        try:
-            symdf = get_yahoofinance_data(symbol, startdate, enddate)
-            done = True
-        except ConnectionError:
-            sleep(10)
-        except URLError as error:
-            if isinstance(error, timeout):
-                sleep(waittime)
-    return symdf
+def get_symbols_aligned_prices(symbols, startdate, enddate, maxworkers=10):
+    pricestore = PriceStore(fetcher=RetryingFetcher())
+    with ThreadPoolExecutor(max_workers=maxworkers) as executor:
+        symdfs = list(executor.map(
+            lambda symbol: pricestore.get_symbol_data(symbol, startdate, enddate),
+            symbols
+        ))
+
+    # one multi-way join: dates on which all symbols have a price
+    timestamps, pricematrix = build_price_matrix(symdfs)
+    allpresent = np.all(~np.isnan(pricematrix), axis=1)
+    return timestamps[allpresent], pricematrix[allpresent, :]
+
+
+def estimate_symbols_covariance(symbols, startdate, enddate, shrinkage=None, maxworkers=10):
+    timestamps, pricematrix = get_symbols_aligned_prices(symbols, startdate, enddate, maxworkers=maxworkers)
+    rarray, covmat = fit_multivariate_BlackScholesMerton_model(timestamps, pricematrix.T)
+
+    # shrinkage: None (sample covariance), 'ledoit-wolf', or an intensity between 0 and 1
+    if shrinkage == 'ledoit-wolf':
+        ts = timestamps.astype(np.float64) / SECONDS_PER_YEAR
+        increments = np.diff(np.log(pricematrix), axis=0) / np.sqrt(np.diff(ts))[:, None]
+        shrinkage = ledoit_wolf_shrinkage(increments)
+    if shrinkage is not None:
+        covmat = shrink_covariance(covmat, shrinkage)
+
+    std = np.sqrt(np.diag(covmat))
+    return {
+        'symbols': symbols,
+        'r': rarray.tolist(),
+        'std': std.tolist(),
+        'covariance': covmat.tolist(),
+        'correlation': (covmat / np.outer(std, std)).tolist(),
+        'shrinkage': float(shrinkage) if shrinkage is not None else None,
+        'nbrecs': len(timestamps),
+        'data_startdate': str(timestamps[0].astype('datetime64[D]')) if len(timestamps) > 0 else None,
+        'data_enddate': str(timestamps[-1].astype('datetime64[D]')) if len(timestamps) > 0 else None
+    }
+
+
+def estimate_rolling_correlations(symbols, startdate, enddate, window, pairs=None, maxworkers=10):
+    timestamps, pricematrix = get_symbols_aligned_prices(symbols, startdate, enddate, maxworkers=maxworkers)
+    if pairs is None:
+        pairs = [[symbols[i], symbols[j]] for i in range(len(symbols)) for j in range(i+1, len(symbols))]
+    symbolidx = {symbol: i for i, symbol in enumerate(symbols)}
+    dates, covariances, correlations = rolling_correlations(
+        timestamps,
+        pricematrix,
+        window,
+        pairs=[(symbolidx[symbol1], symbolidx[symbol2]) for symbol1, symbol2 in pairs]
+    )
+    return {
+        'symbols': symbols,
+        'window': window,
+        'dates': [str(date) for date in dates.astype('datetime64[D]')],
+        'pairs': [
+            {
+                'symbol1': symbol1,
+                'symbol2': symbol2,
+                'cov': covariances[:, k].tolist(),
+                'correlation': correlations[:, k].tolist()
+            }
+            for k, (symbol1, symbol2) in enumerate(pairs)
+        ]
+    }
+
+
+def validate_symbols_query(query):
+    # message of the first problem of the query (matrix or rolling mode), None if none
+    symbols = query['symbols']
+    if not isinstance(symbols, list) or len(symbols) == 0 or not all(isinstance(symbol, str) for symbol in symbols):
+        return 'symbols must be a non-empty list of symbols.'
+    for field in ['startdate', 'enddate']:
+        if field not in query:
+            return 'Missing field: {}'.format(field)
+    shrinkage = query.get('shrinkage')
+    if shrinkage is not None and shrinkage != 'ledoit-wolf' and \
+            (isinstance(shrinkage, bool) or not isinstance(shrinkage, (int, float)) or not 0 <= shrinkage <= 1):
+        return 'Unknown shrinkage: {} (options: "ledoit-wolf", or a number between 0 and 1)'.format(shrinkage)
+    if 'window' in query:
+        window = query['window']
+        if isinstance(window, bool) or not isinstance(window, int) or window < 2:
+            return 'window must be an integer of at least 2 (number of increments).'
+        pairs = query.get('pairs')
+        if pairs is not None:
+            if not isinstance(pairs, list):
+                return 'pairs must be a list of [symbol1, symbol2].'
+            for pair in pairs:
+                if not isinstance(pair, list) or len(pair) != 2:
+                    return 'Invalid pair: {} (must be [symbol1, symbol2])'.format(pair)
+                for symbol in pair:
+                    if symbol not in symbols:
+                        return 'Symbol {} of pair {} not in symbols.'.format(symbol, pair)
+    return None
 
 
 def symbolcorr_handler(event, context):
@@ -32,6 +113,44 @@ def symbolcorr_handler(event, context):
     logging.info(context)
     query = json.loads(event['body'])
 
+    # matrix mode: covariance and correlation matrices of a list of symbols;
+    # rolling mode (with a window): rolling correlations of pairs of the symbols
+    if 'symbols' in query:
+        message = validate_symbols_query(query)
+        if message is not None:
+            return {
+                'isBase64Encoded': False,
+                'statusCode': 400,
+                'body': message
+            }
+        try:
+            if 'window' in query:
+                results = estimate_rolling_correlations(
+                    query['symbols'],
+                    query['startdate'],
+                    query['enddate'],
+                    query['window'],
+                    pairs=query.get('pairs'),
+                    maxworkers=query.get('maxworkers', 10)
+                )
+            else:
+                results = estimate_symbols_covariance(
+                    query['symbols'],
+                    query['startdate'],
+                    query['enddate'],
+                    shrinkage=query.get('shrinkage'),
+                    maxworkers=query.get('maxworkers', 10)
+                )
+        except UpstreamUnavailableError as error:
+            logging.error(error)
+            return {
+                'isBase64Encoded': False,
+                'statusCode': 503,
+                'body': 'Data source unavailable: {}'.format(error)
+            }
+        # long series: the body may be gzipped (response_format: columnar-gzip)
+        return make_response(results, query.get('response_format', 'json'))
+
     # getting user inputs
     symbol1 = query['symbol1']
     symbol2 = query['symbol2']
@@ -40,8 +159,17 @@ def symbolcorr_handler(event, context):
 
     # get symbols' prices
     print('grabbing stiuff')
-    sym1df = waiting_get_yahoofinance_data(symbol1, startdate, enddate)
-    sym2df = waiting_get_yahoofinance_data(symbol2, startdate, enddate)
+    pricestore = PriceStore(fetcher=RetryingFetcher())
+    try:
+        sym1df = pricestore.get_symbol_data(symbol1, startdate, enddate)
+        sym2df = pricestore.get_symbol_data(symbol2, startdate, enddate)
+    except UpstreamUnavailableError as error:
+        logging.error(error)
+        return {
+            'isBase64Encoded': False,
+            'statusCode': 503,
+            'body': 'Data source unavailable: {}'.format(error)
+        }
     combined_df = sym1df[['TimeStamp', 'Close']].rename(columns={'Close': 'Close1'}).\
         merge(
             sym2df[['TimeStamp', 'Close']].rename(columns={'Close': 'Close2'}),
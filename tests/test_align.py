@@ -0,0 +1,33 @@
+
+import numpy as np
+import pandas as pd
+
+from finportutils.align import asof_indices, asof_align, asof_align_dataframes
+
+
+def test_asof_align():
+    target = np.array(['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-06', '2020-01-10'], dtype='datetime64[D]')
+    source = np.array(['2020-01-02', '2020-01-03', '2020-01-07'], dtype='datetime64[D]')
+    np.testing.assert_array_equal(asof_indices(target, source), [-1, 0, 1, 1, 2])
+
+    # forward-filled, NaN before the first source date
+    aligned = asof_align(target, source, [1., 2., 3.])
+    np.testing.assert_array_equal(aligned, [np.nan, 1., 2., 2., 3.])
+
+    # not older than the given lag
+    aligned = asof_align(target, source, [1., 2., 3.], maxlag=np.timedelta64(2, 'D'))
+    np.testing.assert_array_equal(aligned, [np.nan, 1., 2., np.nan, np.nan])
+
+    # many series at once
+    aligned = asof_align(target, source, np.array([[1., 10.], [2., 20.], [3., 30.]]))
+    np.testing.assert_array_equal(aligned[:, 1], [np.nan, 10., 20., 20., 30.])
+
+    # as pandas' as-of merge
+    dfs = [
+        pd.DataFrame({'TimeStamp': pd.to_datetime(source), 'Close': [1., 2., 3.]}),
+        pd.DataFrame({'TimeStamp': pd.to_datetime(['2020-01-01']), 'Close': [5.]})
+    ]
+    merged = pd.merge_asof(pd.DataFrame({'TimeStamp': pd.to_datetime(target)}), dfs[0], on='TimeStamp')
+    aligned = asof_align_dataframes(target, dfs)
+    np.testing.assert_array_equal(aligned[:, 0], merged['Close'].to_numpy())
+    np.testing.assert_array_equal(aligned[:, 1], [5.] * 5)
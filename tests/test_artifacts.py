@@ -0,0 +1,38 @@
+
+import io
+import os
+
+import pytest
+
+from finportutils.artifacts import FileSystemArtifactSink, get_artifact_sink
+
+
+def test_filesystem_sink(tmp_path, monkeypatch):
+    monkeypatch.setenv('ARTIFACTDIR', str(tmp_path))
+    with get_artifact_sink('finport-bucket') as sink:
+        assert isinstance(sink, FileSystemArtifactSink)
+        buffer = io.BytesIO()
+        buffer.write(b'\x89PNG')
+        sink.put('plot.png', buffer)      # read from the start of the buffer
+        sink.put('report.json', '{"a": 1}')
+        responses = sink.wait()
+    assert set(responses) == {'plot.png', 'report.json'}
+
+    path = os.path.join(str(tmp_path), 'finport-bucket', 'plot.png')
+    assert open(path, 'rb').read() == b'\x89PNG'
+    assert sink.url('plot.png') == 'file://' + path
+    assert open(os.path.join(str(tmp_path), 'finport-bucket', 'report.json'), 'r').read() == '{"a": 1}'
+
+
+def test_sink_closed_on_error(tmp_path):
+    class FailingSink(FileSystemArtifactSink):
+        def store(self, key, buffer):
+            raise IOError('disk full')
+
+    with pytest.raises(IOError):
+        with FailingSink(str(tmp_path)) as sink:
+            sink.put('plot.png', b'')
+            sink.wait()
+    # no upload thread left running
+    with pytest.raises(RuntimeError):
+        sink.put('other.png', b'')
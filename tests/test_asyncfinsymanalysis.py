@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from finsim.estimate.fit import fit_BlackScholesMerton_model
+
+from finportutils.fetch import UpstreamUnavailableError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'symbolinference'))
+import asyncfinsymanalysis
+
+
+def make_symdf(seed):
+    timestamps = pd.date_range('2020-01-01', '2020-06-30', freq='B')
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'TimeStamp': timestamps, 'Close': 100. * np.exp(np.cumsum(rng.normal(0., 0.01, len(timestamps))))})
+
+
+class SlowFetcher:
+    # counts the downloads in flight; the symbols unavailable fail as when the retries are exhausted
+    def __init__(self, unavailable=('DOWN',)):
+        self.unavailable = unavailable
+        self.calls = []
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.maxinflight = 0
+
+    def __call__(self, symbol, startdate, enddate, cacheddir=None, waittime=1):
+        with self.lock:
+            self.calls.append(symbol)
+            self.inflight += 1
+            self.maxinflight = max(self.maxinflight, self.inflight)
+        time.sleep(0.05)
+        with self.lock:
+            self.inflight -= 1
+        if symbol in self.unavailable:
+            raise UpstreamUnavailableError('Retries exhausted.')
+        if symbol == 'EMPTY':
+            return pd.DataFrame({'TimeStamp': [], 'Close': []})
+        return make_symdf(int(symbol[-1]) if symbol[-1].isdigit() else 0)
+
+
+def test_scan_in_sliding_window(monkeypatch):
+    monkeypatch.setattr(asyncfinsymanalysis, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    fetcher = SlowFetcher()
+    monkeypatch.setattr(asyncfinsymanalysis, 'fetch_symbol_data', fetcher)
+
+    symbols = ['SYM1', 'SYM2', 'DOWN', 'SYM3', 'EMPTY', 'SYM4']
+    symbols_info = {'SYM1': {'description': 'Symbol One', 'type': 'EQUITY'}}
+    estimations = asyncfinsymanalysis.sliced_estimate_all_symbols_from_yahoo(
+        symbols, '2020-01-01', '2020-06-30', symbols_info=symbols_info, slicesize=2
+    )
+
+    # never more downloads in flight than the slice size
+    assert fetcher.maxinflight == 2
+    # symbols without data, or not retrieved, left out
+    assert sorted(estimations.keys()) == ['SYM1', 'SYM2', 'SYM3', 'SYM4']
+    for symbol, symbol_estimations in estimations.items():
+        symdf = make_symdf(int(symbol[-1]))
+        r, sigma = fit_BlackScholesMerton_model(symdf['TimeStamp'].to_numpy(), symdf['Close'].to_numpy())
+        np.testing.assert_allclose([symbol_estimations['r'], symbol_estimations['vol']], [r, sigma])
+        assert symbol_estimations['nbrecs'] == len(symdf)
+        assert symbol_estimations['startdate'] == '2020-01-01'
+    assert estimations['SYM1']['description'] == 'Symbol One'
+    assert estimations['SYM2']['type'] is None
+
+
+def test_resume_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(asyncfinsymanalysis, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    symbols = ['SYM1', 'SYM2', 'DOWN', 'EMPTY']
+    checkpointpath = str(tmp_path / 'scan.checkpoint.jsonl')
+
+    fetcher = SlowFetcher()
+    monkeypatch.setattr(asyncfinsymanalysis, 'fetch_symbol_data', fetcher)
+    asyncfinsymanalysis.sliced_estimate_all_symbols_from_yahoo(
+        symbols, '2020-01-01', '2020-06-30', slicesize=2, checkpointpath=checkpointpath
+    )
+    # symbols without data are done; the symbol not retrieved is not
+    symbols_done, estimations = asyncfinsymanalysis.read_checkpoint(checkpointpath)
+    assert symbols_done == {'SYM1', 'SYM2', 'EMPTY'}
+    assert sorted(estimations.keys()) == ['SYM1', 'SYM2']
+
+    # interrupted while writing a line: the truncated line is ignored
+    with open(checkpointpath, 'a') as f:
+        f.write('{"symbol": "SY')
+
+    fetcher = SlowFetcher(unavailable=())
+    monkeypatch.setattr(asyncfinsymanalysis, 'fetch_symbol_data', fetcher)
+    estimations = asyncfinsymanalysis.sliced_estimate_all_symbols_from_yahoo(
+        symbols, '2020-01-01', '2020-06-30', slicesize=2, checkpointpath=checkpointpath
+    )
+    assert fetcher.calls == ['DOWN']
+    assert sorted(estimations.keys()) == ['DOWN', 'SYM1', 'SYM2']
+
+    outputfile = str(tmp_path / 'estimations.json')
+    asyncfinsymanalysis.export_estimations(estimations, outputfile)
+    assert sorted(record['symbol'] for record in json.load(open(outputfile, 'r'))) == ['DOWN', 'SYM1', 'SYM2']
+
+
+class ScanFetcher:
+    # failures of the first run given by symbol; every symbol has prices afterwards
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, symbol, startdate, enddate, cacheddir=None, waittime=1):
+        self.calls.append(symbol)
+        error = self.failures.get(symbol)
+        if error is not None:
+            raise error
+        if symbol == 'NOCLOSE':
+            return make_symdf(0).rename(columns={'Close': 'Price'})
+        return make_symdf(len(self.calls))
+
+
+def test_resume_retries_transient_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr(asyncfinsymanalysis, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    compute_batch_estimations = asyncfinsymanalysis.compute_batch_estimations
+
+    def crashing_batch_estimations(symbols, symdfs):
+        if 'CRASH' in symbols:
+            raise MemoryError('worker crashed')
+        return compute_batch_estimations(symbols, symdfs)
+
+    symbols = ['GOOD1', 'GOOD2', 'NOCLOSE', 'DOWN', 'FLAKY', 'CRASH']
+    checkpointpath = str(tmp_path / 'scan.checkpoint.jsonl')
+
+    # first run: upstream down for one symbol, a connection error for another, a crashing batch
+    fetcher = ScanFetcher({'DOWN': UpstreamUnavailableError('Circuit open'), 'FLAKY': ConnectionError('reset')})
+    monkeypatch.setattr(asyncfinsymanalysis, 'fetch_symbol_data', fetcher)
+    monkeypatch.setattr(asyncfinsymanalysis, 'compute_batch_estimations', crashing_batch_estimations)
+    estimations = asyncfinsymanalysis.sliced_estimate_all_symbols_from_yahoo(
+        symbols, '2020-01-01', '2020-06-30', slicesize=2, estimation_batchsize=3, checkpointpath=checkpointpath
+    )
+    assert sorted(estimations.keys()) == ['GOOD1', 'GOOD2']
+    # only the symbol failing on its own data (no Close column) is checkpointed as failed
+    symbols_done, _ = asyncfinsymanalysis.read_checkpoint(checkpointpath)
+    assert symbols_done == {'GOOD1', 'GOOD2', 'NOCLOSE'}
+
+    # resumed run: only the symbols left are fetched again
+    fetcher = ScanFetcher({})
+    monkeypatch.setattr(asyncfinsymanalysis, 'fetch_symbol_data', fetcher)
+    monkeypatch.setattr(asyncfinsymanalysis, 'compute_batch_estimations', compute_batch_estimations)
+    estimations = asyncfinsymanalysis.sliced_estimate_all_symbols_from_yahoo(
+        symbols, '2020-01-01', '2020-06-30', slicesize=2, estimation_batchsize=3, checkpointpath=checkpointpath
+    )
+    assert sorted(fetcher.calls) == ['CRASH', 'DOWN', 'FLAKY']
+    assert sorted(estimations.keys()) == ['CRASH', 'DOWN', 'FLAKY', 'GOOD1', 'GOOD2']
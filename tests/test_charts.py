@@ -0,0 +1,27 @@
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from finportutils.charts import render_line_chart
+
+
+def test_render_line_chart():
+    timestamps = pd.date_range('2020-01-01', '2021-12-31', freq='B')
+    series = [
+        ('stock price', timestamps, np.linspace(100., 200., len(timestamps))),
+        ('stock price+dividend', timestamps.to_numpy(), np.linspace(100., 210., len(timestamps)))
+    ]
+
+    buffer = io.BytesIO()
+    render_line_chart(buffer, series, '3 months', title='Portfolio')
+    assert buffer.getvalue().startswith(b'\x89PNG')
+
+    # SVG, the labels as text; the figure reused, without the lines of the previous chart
+    buffer = io.BytesIO()
+    render_line_chart(buffer, series[:1], '1 year', renderer='svg')
+    svg = buffer.getvalue().decode('utf-8')
+    assert '<svg' in svg
+    assert 'stock price' in svg
+    assert 'stock price+dividend' not in svg
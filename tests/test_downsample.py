@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from finportutils.downsample import downsample_records
+
+
+def test_downsample_records():
+    nbdays = 2000
+    timestamps = pd.date_range('2015-01-01', periods=nbdays, freq='D').strftime('%Y-%m-%d')
+    rng = np.random.default_rng(0)
+    stock_value = 100 + np.cumsum(rng.normal(size=nbdays))
+    value = stock_value + np.linspace(0, 10, nbdays)
+    value[5] = np.nan
+    df = pd.DataFrame({'TimeStamp': timestamps, 'stock_value': stock_value, 'value': value})
+
+    sampled = downsample_records(df, ['stock_value', 'value'], 100)
+    assert 100 <= len(sampled) <= 200
+    assert list(sampled.columns) == list(df.columns)
+    # whole rows kept, in order, with the ends
+    assert sampled['TimeStamp'].is_monotonic_increasing
+    assert sampled['TimeStamp'].iloc[0] == timestamps[0] and sampled['TimeStamp'].iloc[-1] == timestamps[-1]
+    assert df.set_index('TimeStamp').loc[sampled['TimeStamp'], 'stock_value'].tolist() == sampled['stock_value'].tolist()
+
+    # extremes of every column kept by minmax
+    sampled = downsample_records(df, ['stock_value', 'value'], 100, method='minmax')
+    assert stock_value.max() in sampled['stock_value'].tolist()
+    assert np.nanmin(value) in sampled['value'].tolist()
+
+    # short tables are kept as they are
+    assert len(downsample_records(df.iloc[:50], ['stock_value', 'value'], 100)) == 50
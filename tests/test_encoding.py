@@ -0,0 +1,42 @@
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from finportutils.encoding import to_columns, encode_table, make_response, decode_response_body
+
+
+def make_values_df():
+    return pd.DataFrame({
+        'TimeStamp': pd.to_datetime(['2020-01-02', '2020-01-03']),
+        'value': [1.5, np.nan]
+    })
+
+
+def test_to_columns():
+    columns = to_columns(make_values_df())
+    assert columns == {'TimeStamp': ['2020-01-02T00:00:00', '2020-01-03T00:00:00'], 'value': [1.5, None]}
+
+
+def test_response_formats():
+    df = make_values_df()
+    body = {'data': encode_table(df, 'columnar'), 'r': np.float64(0.1)}
+
+    response = make_response(body, 'columnar')
+    assert not response['isBase64Encoded']
+    assert json.loads(response['body'])['data']['value'] == [1.5, None]
+
+    # gzipped, base64-encoded, decoded back to the same body
+    response = make_response(body, 'columnar-gzip')
+    assert response['isBase64Encoded']
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert decode_response_body(response) == json.loads(make_response(body, 'columnar')['body'])
+
+    # records, as before
+    records = encode_table(df.iloc[:1], 'json')
+    assert records[0]['value'] == 1.5
+
+    with pytest.raises(ValueError):
+        encode_table(df, 'xml')
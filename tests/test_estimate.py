@@ -0,0 +1,111 @@
+
+import os
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+from finsim.estimate.fit import fit_BlackScholesMerton_model
+from finsim.estimate.risk import estimate_downside_risk, estimate_upside_risk, estimate_beta
+
+from finportutils.estimate import build_price_matrix, estimate_symbols_statistics, RollingCovariance, \
+    rolling_correlations
+from finportutils.fetch import UpstreamUnavailableError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'symbol-info-estimation'))
+import symbolinfo
+
+
+def make_symdfs():
+    # a symbol with prices on all the dates, another with a later start and a gap, and the index
+    rng = np.random.default_rng(1)
+    dates = pd.date_range('2020-01-01', '2020-12-31', freq='B')
+    symdfs = []
+    for startidx in [0, 30, 0]:
+        closes = 100. * np.exp(np.cumsum(rng.normal(0.0005, 0.01, len(dates))))
+        symdf = pd.DataFrame({'TimeStamp': dates, 'Close': closes}).iloc[startidx:, :]
+        symdfs.append(symdf.drop(symdf.index[50:55]) if startidx > 0 else symdf)
+    return symdfs
+
+
+def test_statistics_as_finsim():
+    symdfs = make_symdfs()
+    timestamps, pricematrix = build_price_matrix(symdfs[:2])
+    statistics = estimate_symbols_statistics(timestamps, pricematrix, index_prices=symdfs[2]['Close'].to_numpy())
+
+    # every symbol as finsim's estimations on its own rows
+    for j, symdf in enumerate(symdfs[:2]):
+        symts = symdf['TimeStamp'].to_numpy()
+        symprices = symdf['Close'].to_numpy()
+        r, sigma = fit_BlackScholesMerton_model(symts, symprices)
+        np.testing.assert_allclose(statistics['r'][j], r)
+        np.testing.assert_allclose(statistics['vol'][j], sigma)
+        np.testing.assert_allclose(statistics['downside_risk'][j], estimate_downside_risk(symts, symprices, 0.))
+        np.testing.assert_allclose(statistics['upside_risk'][j], estimate_upside_risk(symts, symprices, 0.))
+        assert statistics['nbrecs'][j] == len(symdf)
+        assert timestamps[statistics['startidx'][j]] == symts[0]
+        assert timestamps[statistics['endidx'][j]] == symts[-1]
+
+    indexprices = symdfs[2].set_index('TimeStamp').loc[symdfs[1]['TimeStamp'], 'Close'].to_numpy()
+    beta = estimate_beta(symdfs[1]['TimeStamp'].to_numpy(), symdfs[1]['Close'].to_numpy(), indexprices)
+    np.testing.assert_allclose(statistics['beta'][1], beta)
+
+
+def test_rolling_correlations():
+    symdfs = make_symdfs()
+    timestamps, pricematrix = build_price_matrix([symdfs[0], symdfs[2]])
+    window = 20
+    dates, covariances, correlations = rolling_correlations(timestamps, pricematrix, window)
+    assert len(dates) == len(timestamps) - window
+
+    # each window as the (population) covariance of its increments
+    ts = timestamps.astype('datetime64[s]').astype(np.float64) / (60.*60.*24.*365.)
+    increments = np.diff(np.log(pricematrix), axis=0) / np.sqrt(np.diff(ts))[:, None]
+    for i in [0, 100, len(dates) - 1]:
+        windowincrements = increments[i:i+window, :]
+        np.testing.assert_allclose(covariances[i, 0], np.cov(windowincrements.T, bias=True)[0, 1], atol=1e-12)
+        np.testing.assert_allclose(correlations[i, 0], np.corrcoef(windowincrements.T)[0, 1])
+
+    # only the pairs asked
+    engine = RollingCovariance(3, window, pairs=[(0, 2)])
+    for row in np.random.default_rng(2).normal(size=(window, 3)):
+        engine.update(row)
+    assert engine.ready
+    assert engine.covariances().shape == (1,)
+
+
+def test_statistics_of_no_symbol():
+    timestamps, pricematrix = build_price_matrix([])
+    statistics = estimate_symbols_statistics(timestamps, pricematrix, index_prices=np.zeros(0))
+    assert pricematrix.shape == (0, 0)
+    assert len(statistics['r']) == 0
+    assert len(statistics['startidx']) == 0
+    assert len(statistics['beta']) == 0
+
+
+class FailingPriceStore:
+    # the index is available; every symbol fails
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_symbol_data(self, symbol, startdate, enddate):
+        if symbol == '^GSPC':
+            return pd.DataFrame({'TimeStamp': pd.date_range(startdate, enddate, freq='B'), 'Close': 1.})
+        if symbol == 'EMPTY':
+            return pd.DataFrame({'TimeStamp': [], 'Close': []})
+        raise UpstreamUnavailableError('Retries exhausted.')
+
+
+def test_all_symbols_failed(monkeypatch):
+    monkeypatch.setattr(symbolinfo, 'PriceStore', FailingPriceStore)
+
+    query = {'symbols': ['AAPL', 'EMPTY'], 'startdate': '2020-01-01', 'enddate': '2020-03-31'}
+    response = symbolinfo.symbol_handler({'body': json.dumps(query)}, None)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['estimations'] == {}
+    assert sorted(body['failed'].keys()) == ['AAPL', 'EMPTY']
+
+    query = {'symbol': 'AAPL', 'startdate': '2020-01-01', 'enddate': '2020-03-31'}
+    response = symbolinfo.symbol_handler({'body': json.dumps(query)}, None)
+    assert response['statusCode'] == 503
@@ -0,0 +1,58 @@
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from finportutils.export import export_extension, write_records, write_dataframe
+
+
+def make_values_df():
+    return pd.DataFrame({
+        'TimeStamp': pd.to_datetime(['2020-01-02', '2020-01-03', '2020-01-06']),
+        'value': [1., np.nan, 3.],
+        'nbshares': np.array([1, 2, 3], dtype=np.int64)
+    })
+
+
+def test_export_extension():
+    assert export_extension('xlsx') == '.xlsx'
+    assert export_extension('.csv') == '.csv'
+    with pytest.raises(IOError):
+        export_extension('pdf')
+
+
+def test_write_dataframe_csv_and_json(tmp_path):
+    df = make_values_df()
+
+    # rows written in chunks smaller than the frame; missing values as empty cells
+    path = str(tmp_path / 'values.csv')
+    write_dataframe(path, df, chunksize=2)
+    lines = open(path, 'r').read().splitlines()
+    assert lines == ['TimeStamp,value,nbshares', '2020-01-02 00:00:00,1.0,1', '2020-01-03 00:00:00,,2',
+                     '2020-01-06 00:00:00,3.0,3']
+
+    path = str(tmp_path / 'values.json')
+    write_dataframe(path, df, chunksize=2)
+    records = json.load(open(path, 'r'))
+    assert [record['value'] for record in records] == [1., None, 3.]
+    assert [record['nbshares'] for record in records] == [1, 2, 3]
+
+
+def test_write_records_xlsx(tmp_path):
+    path = str(tmp_path / 'values.xlsx')
+    records = (
+        {'TimeStamp': timestamp, 'value': value}
+        for timestamp, value in zip(['2020-01-02', '2020-01-03'], [1., 2.])
+    )
+    write_records(path, records)
+    rows = list(load_workbook(path).active.iter_rows(values_only=True))
+    assert rows == [('TimeStamp', 'value'), ('2020-01-02', 1.), ('2020-01-03', 2.)]
+
+    # no record: only the header, if the columns are given
+    path = str(tmp_path / 'empty.xlsx')
+    write_records(path, [], columns=['TimeStamp', 'value'])
+    rows = list(load_workbook(path).active.iter_rows(values_only=True))
+    assert rows == [('TimeStamp', 'value')]
@@ -0,0 +1,124 @@
+
+from datetime import datetime
+from urllib.error import URLError
+
+import pandas as pd
+import pytest
+
+from finportutils.fetch import RetryingFetcher, RetryBudget, CircuitBreaker, UpstreamUnavailableError
+
+
+def make_fetcher(fetchfunction, circuit_breaker=None, **kwargs):
+    return RetryingFetcher(
+        fetchfunction,
+        waittime=0.,
+        retry_budget=RetryBudget(),
+        circuit_breaker=circuit_breaker if circuit_breaker is not None else CircuitBreaker(),
+        **kwargs
+    )
+
+
+def test_connection_errors_retried():
+    results = [ConnectionError('reset'), URLError('timed out'), pd.DataFrame({'Close': [1.]})]
+
+    def flaky(*args):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    breaker = CircuitBreaker()
+    assert len(make_fetcher(flaky, circuit_breaker=breaker)('AAPL', '2020-01-01', '2020-01-31')) == 1
+    assert len(results) == 0
+    assert breaker.nbfailures == 0
+
+
+def test_retries_bounded():
+    calls = []
+
+    def down(*args):
+        calls.append(args)
+        raise ConnectionError('refused')
+
+    with pytest.raises(UpstreamUnavailableError):
+        make_fetcher(down, maxretries=2)('AAPL', '2020-01-01', '2020-01-31')
+    assert len(calls) == 3
+
+    # no retry once the budget shared by the calls is spent
+    calls.clear()
+    fetcher = RetryingFetcher(
+        down, waittime=0., retry_budget=RetryBudget(capacity=0.), circuit_breaker=CircuitBreaker()
+    )
+    with pytest.raises(UpstreamUnavailableError):
+        fetcher('AAPL', '2020-01-01', '2020-01-31')
+    assert len(calls) == 1
+
+    # nor once the circuit is open
+    calls.clear()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60.)
+    with pytest.raises(UpstreamUnavailableError):
+        make_fetcher(down, circuit_breaker=breaker)('AAPL', '2020-01-01', '2020-01-31')
+    assert len(calls) == 3
+
+
+def test_empty_frame_retried():
+    results = [pd.DataFrame(), pd.DataFrame({'Close': [1.]})]
+    fetcher = make_fetcher(lambda *args: results.pop(0))
+    assert len(fetcher('AAPL', '2020-01-01', '2020-01-31')) == 1
+    assert len(results) == 0
+
+
+def test_empty_frame_given_back_after_retries():
+    calls = []
+    fetcher = make_fetcher(lambda *args: calls.append(args) or pd.DataFrame(), maxemptyretries=2)
+    assert len(fetcher('AAPL', '2020-01-01', '2020-01-31')) == 0
+    assert len(calls) == 3
+
+
+def test_empty_frames_keep_circuit_closed():
+    # delisted symbols (or an empty day) one after the other: the upstream answers, the circuit stays closed
+    breaker = CircuitBreaker(failure_threshold=10, cooldown=60.)
+    calls = []
+    fetcher = make_fetcher(lambda *args: calls.append(args) or pd.DataFrame(), circuit_breaker=breaker)
+    for symbol in ['A', 'B', 'C', 'D', 'E', 'F']:
+        assert len(fetcher(symbol, '2020-01-01', '2020-01-31')) == 0
+    assert len(calls) == 18
+    assert breaker.nbfailures == 0
+    assert breaker.opened_time is None
+
+    # the next symbol with prices goes through
+    assert len(make_fetcher(lambda *args: pd.DataFrame({'Close': [1.]}), circuit_breaker=breaker)('G', '2020-01-01', '2020-01-31')) == 1
+
+
+def test_empty_range_without_trading_days_not_retried():
+    calls = []
+    fetcher = make_fetcher(lambda *args: calls.append(args) or pd.DataFrame())
+    # a weekend, a holiday (Independence Day, observed on Friday), and today
+    fetcher('AAPL', '2020-01-04', '2020-01-05')
+    fetcher('AAPL', '2020-07-03', '2020-07-05')
+    fetcher('AAPL', datetime.utcnow().strftime('%Y-%m-%d'), datetime.utcnow().strftime('%Y-%m-%d'))
+    assert len(calls) == 3
+
+
+def test_nonretryable_error_during_trial_releases_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.)
+    breaker.record_failure()
+
+    def failing(*args):
+        raise KeyError('Close')
+
+    with pytest.raises(KeyError):
+        make_fetcher(failing, circuit_breaker=breaker)('AAPL', '2020-01-01', '2020-01-31')
+    assert not breaker.trial_ongoing
+
+    # the next call is a trial again, and closes the circuit on success
+    fetcher = make_fetcher(lambda *args: pd.DataFrame({'Close': [1.]}), circuit_breaker=breaker)
+    assert len(fetcher('AAPL', '2020-01-01', '2020-01-31')) == 1
+    assert breaker.opened_time is None
+
+
+def test_circuit_open_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60.)
+    breaker.record_failure()
+    with pytest.raises(UpstreamUnavailableError):
+        make_fetcher(lambda *args: pd.DataFrame({'Close': [1.]}), circuit_breaker=breaker)('AAPL', '2020-01-01', '2020-01-31')
@@ -0,0 +1,24 @@
+
+import re
+from datetime import datetime, timezone
+
+from finportutils.filenames import ULIDGenerator, ulid_timestamp, generate_filename
+
+
+def test_ulids_ordered():
+    generator = ULIDGenerator()
+    # within the same millisecond, and with the clock moving back, still in the order generated
+    ulids = [generator.generate(timestamp=1600000000000) for _ in range(100)]
+    ulids.append(generator.generate(timestamp=1599999999999))
+    ulids.append(generator.generate(timestamp=1600000000001))
+    assert len(set(ulids)) == len(ulids)
+    assert ulids == sorted(ulids)
+    assert all(len(ulid) == 26 for ulid in ulids)
+    assert ulid_timestamp(ulids[0]) == datetime.fromtimestamp(1600000000., tz=timezone.utc)
+
+
+def test_generate_filename():
+    filename = generate_filename()
+    match = re.fullmatch(r'(\d{14})UTC_([0-9a-z]{26})', filename)
+    assert match is not None
+    assert ulid_timestamp(match.group(2)).strftime('%Y%m%d%H%M%S') == match.group(1)
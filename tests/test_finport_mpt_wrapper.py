@@ -0,0 +1,69 @@
+
+import io
+import os
+import sys
+import json
+import time
+import types
+import threading
+import importlib.util
+
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+wrapperdir = os.path.join(repodir, 'financial-portfolio-mpt-wrapper')
+
+
+class FakeLambdaClient:
+    # fininfoestimate answering chunk by chunk; a chunk with BAD fails as a whole
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.inflight = 0
+        self.maxinflight = 0
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        symbols = json.loads(json.loads(Payload)['body'])['symbols']
+        with self.lock:
+            self.chunks.append(symbols)
+            self.inflight += 1
+            self.maxinflight = max(self.maxinflight, self.inflight)
+        time.sleep(0.05)
+        with self.lock:
+            self.inflight -= 1
+        if 'BAD' in symbols:
+            payload = {'statusCode': 500, 'body': 'Internal error'}
+        else:
+            payload = {'statusCode': 200, 'body': json.dumps({
+                'estimations': {symbol: {'r': 0.1} for symbol in symbols if symbol != 'NODATA'},
+                'failed': {symbol: 'No data.' for symbol in symbols if symbol == 'NODATA'}
+            })}
+        return {'Payload': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+
+def load_wrapper(monkeypatch, client):
+    # boto3 (not needed for the test) replaced by a module handing out the fake client
+    boto3 = types.ModuleType('boto3')
+    boto3.client = lambda service, config=None: client
+    botocore = types.ModuleType('botocore')
+    botocore.config = types.ModuleType('botocore.config')
+    botocore.config.Config = lambda **kwargs: kwargs
+    monkeypatch.setitem(sys.modules, 'boto3', boto3)
+    monkeypatch.setitem(sys.modules, 'botocore', botocore)
+    monkeypatch.setitem(sys.modules, 'botocore.config', botocore.config)
+    spec = importlib.util.spec_from_file_location('test_wrapper', os.path.join(wrapperdir, 'finport_mpt_wrapper.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_extract_symbols_info_in_concurrent_chunks(monkeypatch):
+    client = FakeLambdaClient()
+    wrapper = load_wrapper(monkeypatch, client)
+
+    symbols = ['S{}'.format(i) for i in range(7)] + ['NODATA', 'BAD']
+    symbols_info_dict = wrapper.extract_symbols_info(symbols, '2020-01-01', '2020-12-31', chunksize=3, concurrency=2)
+
+    assert sorted(client.chunks) == [['S0', 'S1', 'S2'], ['S3', 'S4', 'S5'], ['S6', 'NODATA', 'BAD']]
+    assert client.maxinflight == 2
+    # a failing chunk only leaves its own symbols out
+    assert sorted(symbols_info_dict.keys()) == ['S0', 'S1', 'S2', 'S3', 'S4', 'S5']
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+import finsim.data.preader
+import finportutils.pricestore
+import finportutils.fetch
+import finportutils.valuation
+
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repodir, 'financial-portfolio-pipeline'))
+
+from finport_pipeline import run_pipeline    # noqa: E402
+
+
+class StubFetcher:
+    # daily prices of every symbol, a random walk seeded by the symbol; no network
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, startdate, enddate, **kwargs):
+        self.calls.append((symbol, startdate, enddate))
+        timestamps = pd.date_range(startdate, enddate, freq='B')
+        rng = np.random.default_rng(sum(ord(char) for char in symbol))
+        fullrange = pd.date_range('2000-01-01', enddate, freq='B')
+        closes = 100. * np.exp(np.cumsum(rng.normal(0.0005, 0.01, len(fullrange))))[-len(timestamps):] \
+            if len(timestamps) > 0 else np.zeros(0)
+        return pd.DataFrame({
+            'TimeStamp': timestamps,
+            'Open': closes, 'High': closes, 'Low': closes, 'Close': closes, 'Adj Close': closes,
+            'Volume': np.full(len(timestamps), 1000.)
+        })
+
+
+def get_no_dividends_df(symbol):
+    return pd.DataFrame({'TimeStamp': pd.Series(dtype='datetime64[ns]'), 'Dividends': pd.Series(dtype=np.float64)})
+
+
+def test_run_pipeline_sends_report(tmp_path, monkeypatch):
+    fetcher = StubFetcher()
+    monkeypatch.setattr(finsim.data.preader, 'get_yahoofinance_data', fetcher)
+    monkeypatch.setattr(finportutils.pricestore, 'get_yahoofinance_data', fetcher)
+    monkeypatch.setattr(finportutils.fetch, 'get_yahoofinance_data', fetcher)
+    monkeypatch.setattr(finportutils.valuation, 'get_dividends_df', get_no_dividends_df)
+    for envvar in ['PRICESTOREDIR', 'RESULTCACHEDIR', 'MOMENTSTOREDIR']:
+        monkeypatch.setenv(envvar, str(tmp_path / envvar.lower()))
+    monkeypatch.setenv('PLOTRENDERER', 'matplotlib')
+    monkeypatch.setenv('S3BUCKET', 'local')
+    outputdir = str(tmp_path / 'output')
+    monkeypatch.setenv('ARTIFACTDIR', outputdir)    # (set by run_pipeline; restored after the test)
+
+    query = {
+        'symbols': ['AAPL', 'MSFT', 'NVDA'],
+        'totalworth': 10000.,
+        'presetdate': '2023-06-30',
+        'startdate': '2022-01-03',
+        'enddate': '2023-06-30',
+        'rf': 0.05,
+        'email': 'investor@example.com',
+        'filebasename': 'pipelinetest'
+    }
+    output = run_pipeline(query, outputdir)
+
+    # one e-mail, reporting the optimized portfolio of the symbols, with the links to the artifacts
+    emaildir = os.path.join(outputdir, 'emails')
+    emailfiles = os.listdir(emaildir)
+    assert len(emailfiles) == 1
+    email = json.load(open(os.path.join(emaildir, emailfiles[0]), 'r'))
+    assert email['recipient'] == 'investor@example.com'
+    assert email['subject'] == 'Portfolio Optimization - Computation Result'
+    assert email['html'] == output['report']['email_body']
+    for symbol in query['symbols']:
+        assert symbol in email['html']
+    # (the chart and the spreadsheet written locally, in place of S3, as the report)
+    artifacts = sorted(os.listdir(os.path.join(outputdir, 'local')))
+    assert 'pipelinetest.xlsx' in artifacts
+    for extension in ['.png', '.xlsx']:
+        filenames = [filename for filename in artifacts if filename.endswith(extension)]
+        assert len(filenames) == 1
+        assert 'file://' + os.path.join(outputdir, 'local', filenames[0]) in email['html']
+    report = json.load(open(os.path.join(outputdir, 'finport-cache', 'pipelinetest.json'), 'r'))
+    assert report['email_body'] == email['html']
+    assert set(output['symbols_nbshares']) <= set(query['symbols'])
+
+    # prices of the symbols and the index only from the stub
+    assert {symbol for symbol, _, _ in fetcher.calls} <= set(query['symbols']) | {'^GSPC'}
@@ -0,0 +1,62 @@
+
+import numpy as np
+import pandas as pd
+
+from finportutils.estimate import build_price_matrix
+from finportutils.moments import ExponentialMomentEngine, get_exponential_timeweighted_estimation
+from finportutils.valuation import compute_effective_prices
+
+
+class SyntheticPriceStore:
+    def __init__(self, symbols, dates):
+        rng = np.random.default_rng(0)
+        self.dfs = {
+            symbol: pd.DataFrame({
+                'TimeStamp': dates,
+                'Close': 100. * np.exp(np.cumsum(rng.normal(0., 0.01, len(dates))))
+            })
+            for symbol in symbols
+        }
+
+    def get_symbol_data(self, symbol, startdate, enddate):
+        df = self.dfs[symbol]
+        return df.loc[(df['TimeStamp'] >= pd.Timestamp(startdate)) & (df['TimeStamp'] <= pd.Timestamp(enddate)), :]
+
+
+def test_exponential_estimation_with_dividends(tmp_path):
+    symbols = ['AAA', 'BBB']
+    dates = pd.date_range('2020-01-01', '2020-12-31', freq='B')
+    pricestore = SyntheticPriceStore(symbols, dates)
+    dividends = {
+        'AAA': (np.array(['2020-03-16', '2020-06-15', '2020-09-15'], dtype='datetime64[D]'), np.array([2., 2., 2.])),
+        'BBB': (np.zeros(0, dtype='datetime64[D]'), np.zeros(0))
+    }
+
+    r, cov = get_exponential_timeweighted_estimation(
+        symbols, '2020-01-01', '2020-12-31', 10., storedir=str(tmp_path), pricestore=pricestore
+    )
+    r_div, cov_div = get_exponential_timeweighted_estimation(
+        symbols, '2020-01-01', '2020-12-31', 10., storedir=str(tmp_path), pricestore=pricestore, dividends=dividends
+    )
+    assert r_div[0] > r[0]
+    assert r_div[1] == r[1]
+
+    # same as the engine on the prices including the dividends
+    timestamps, pricematrix = build_price_matrix([pricestore.dfs[symbol] for symbol in symbols])
+    engine = ExponentialMomentEngine(2, 10.)
+    engine.add(timestamps, compute_effective_prices(timestamps, pricematrix, symbols, dividends))
+    expected_r, expected_cov = engine.estimates()
+    np.testing.assert_allclose(r_div, expected_r)
+    np.testing.assert_allclose(cov_div, expected_cov)
+
+    # incremental update from the stored state (with dividends) gives the same as from scratch
+    get_exponential_timeweighted_estimation(
+        symbols, '2020-01-01', '2020-06-30', 10., storedir=str(tmp_path / 'incremental'), pricestore=pricestore,
+        dividends=dividends
+    )
+    r_inc, cov_inc = get_exponential_timeweighted_estimation(
+        symbols, '2020-01-01', '2020-12-31', 10., storedir=str(tmp_path / 'incremental'), pricestore=pricestore,
+        dividends=dividends
+    )
+    np.testing.assert_allclose(r_inc, expected_r)
+    np.testing.assert_allclose(cov_inc, expected_cov, rtol=1e-10, atol=1e-14)
@@ -0,0 +1,67 @@
+
+import numpy as np
+import pandas as pd
+
+from finportutils.movingaverage import moving_averages, get_movingaverage_prices
+from finportutils.pricestore import PriceStore
+
+
+def make_closes(seed=0):
+    timestamps = pd.date_range('2020-01-01', '2020-06-30', freq='B')
+    closes = 100. + np.cumsum(np.random.default_rng(seed).normal(size=len(timestamps)))
+    closes[[5, 40, 41]] = np.nan
+    return timestamps, closes
+
+
+def test_moving_averages():
+    timestamps, closes = make_closes()
+    windows = [5, 20, 50]
+    days = np.array(timestamps, dtype='datetime64[D]').astype(np.int64)
+
+    # simple: as pandas' rolling mean over calendar days
+    mas = moving_averages(timestamps, closes, windows, kind='simple')
+    series = pd.Series(closes, index=timestamps)
+    for j, window in enumerate(windows):
+        expected = series.rolling('{}D'.format(window), min_periods=1).mean().to_numpy()
+        np.testing.assert_allclose(mas[:, j], expected)
+
+    # weighted and exponential: as their weights applied date by date
+    valid = ~np.isnan(closes)
+    for kind in ['weighted', 'exponential']:
+        mas = moving_averages(timestamps, closes, windows, kind=kind)
+        for j, window in enumerate(windows):
+            for i in [10, 60, len(days) - 1]:
+                ages = days[i] - days[:i+1]
+                weights = np.where(ages < window, window - ages, 0.) if kind == 'weighted' else np.exp(-ages / window)
+                weights = weights * valid[:i+1]
+                expected = np.sum(weights * np.where(valid[:i+1], closes[:i+1], 0.)) / np.sum(weights)
+                np.testing.assert_allclose(mas[i, j], expected)
+
+
+def test_get_movingaverage_prices(tmp_path):
+    timestamps, closes = make_closes()
+    pricedf = pd.DataFrame({
+        'TimeStamp': timestamps,
+        'Open': closes, 'High': closes, 'Low': closes, 'Close': closes, 'Adj Close': closes, 'Volume': 1.
+    })
+    calls = []
+
+    def fetcher(symbol, startdate, enddate):
+        calls.append((symbol, startdate, enddate))
+        return pricedf.loc[(pricedf['TimeStamp'] >= startdate) & (pricedf['TimeStamp'] <= enddate), :]
+
+    pricestore = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+    madf = get_movingaverage_prices('AAPL', '2020-03-02', '2020-06-30', [50, 10], pricestore=pricestore)
+
+    # one download for all the windows, from the start of the longest
+    assert len(calls) == 1
+    assert calls[0][1] == '2020-01-12'
+    assert list(madf.columns) == ['TimeStamp', 'Close', 10, 50]
+    assert madf['TimeStamp'].iloc[0] == pd.Timestamp('2020-03-02')
+    # each average available more than its window after the first price of its window (as finsim's)
+    for window in [10, 50]:
+        windowstart = pd.Timestamp('2020-03-02') - pd.Timedelta(days=window)
+        firstdate = pricedf.loc[pricedf['TimeStamp'] >= windowstart, 'TimeStamp'].iloc[0]
+        np.testing.assert_array_equal(madf[window].isna(), madf['TimeStamp'] - firstdate <= pd.Timedelta(days=window))
+    assert madf[50].isna().sum() > 0
+    np.testing.assert_allclose(madf[50].iloc[-1], moving_averages(timestamps, closes, [50])[-1, 0])
@@ -0,0 +1,32 @@
+
+import numpy as np
+
+from finportutils.optimize import make_initialguess, optimized_portfolio_mpt_entropy_costfunction
+
+
+def test_make_initialguess():
+    symbols = ['AAA', 'BBB', 'CCC']
+    # cold start: V shared equally by the stocks and the slack
+    np.testing.assert_allclose(make_initialguess(symbols, V=8.), [2., 2., 2., 2.])
+
+    # weights by symbol, scaled to the stocks' share of the cold start
+    initialguess = make_initialguess(symbols, V=8., init_weights={'AAA': 3., 'BBB': 1., 'CCC': 2.})
+    np.testing.assert_allclose(initialguess, [3., 1., 2., 2.])
+
+    # a prior solution on other symbols; never above V in total
+    prior_solution = {'symbols': ['BBB', 'DDD'], 'x': [5., 1., 4.]}
+    initialguess = make_initialguess(symbols, V=8., prior_solution=prior_solution)
+    np.testing.assert_allclose(initialguess, np.array([2., 5., 2., 4.]) * 8. / 13.)
+
+
+def test_warm_start_reaches_same_optimum():
+    symbols = ['AAA', 'BBB', 'CCC']
+    r = np.array([0.1, 0.05, 0.08])
+    cov = np.array([[0.04, 0.01, 0.], [0.01, 0.02, 0.], [0., 0., 0.03]])
+    coldsol = optimized_portfolio_mpt_entropy_costfunction(r, cov, 0.02, 0.3, 0.1)
+    warmsol = optimized_portfolio_mpt_entropy_costfunction(
+        r, cov, 0.02, 0.3, 0.1,
+        initialguess=make_initialguess(symbols, prior_solution={'symbols': symbols, 'x': list(coldsol.x)})
+    )
+    np.testing.assert_allclose(warmsol.fun, coldsol.fun, rtol=1e-6)
+    assert warmsol.nit <= coldsol.nit
@@ -0,0 +1,44 @@
+
+import os
+
+import numpy as np
+import pytest
+
+from finportutils.parallel import process_map
+from finportutils.optimize import solve_mpt_entropy_sweep
+
+
+def square_in_child(x):
+    return x * x, os.getpid()
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError('three')
+    return x
+
+
+def test_process_map():
+    results = process_map(square_in_child, range(7), nbprocesses=3)
+    assert [result[0] for result in results] == [x * x for x in range(7)]
+    assert all(result[1] != os.getpid() for result in results)
+
+    # serial by default
+    assert all(result[1] == os.getpid() for result in process_map(square_in_child, range(3)))
+
+
+def test_process_map_error():
+    with pytest.raises(ValueError):
+        process_map(fail_on_three, range(5), nbprocesses=2)
+
+
+def test_sweep_parallel_as_serial():
+    r = np.array([0.1, 0.05, 0.08])
+    cov = np.array([[0.04, 0.01, 0.], [0.01, 0.02, 0.005], [0., 0.005, 0.03]])
+    points = [(riskcoef, 0.01) for riskcoef in [0.1, 0.3, 0.5, 0.7]]
+    serial_points, serial_solutions = solve_mpt_entropy_sweep(r, cov, 0.02, points)
+    parallel_points, parallel_solutions = solve_mpt_entropy_sweep(r, cov, 0.02, points, nbprocesses=2)
+    assert serial_points == parallel_points
+    # chains start from different points: same optima up to the optimizer's tolerance
+    for serial_sol, parallel_sol in zip(serial_solutions, parallel_solutions):
+        np.testing.assert_allclose(serial_sol.fun, parallel_sol.fun, rtol=1e-4)
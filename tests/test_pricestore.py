@@ -0,0 +1,177 @@
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from finportutils.pricestore import PriceStore, plan_missing_ranges, get_last_complete_date, shift_datestr, \
+    PRICE_COLUMNS
+
+
+def make_prices(startdate, enddate, start=1.):
+    timestamps = pd.date_range(startdate, enddate, freq='B')
+    values = start + np.arange(len(timestamps), dtype=np.float64)
+    return pd.DataFrame({
+        'TimeStamp': timestamps,
+        'Open': values, 'High': values + .5, 'Low': values - .5, 'Close': values, 'Adj Close': values,
+        'Volume': 100. * values
+    })
+
+
+class RangeFetcher:
+    # prices of the business days of any range asked
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, startdate, enddate):
+        self.calls.append((symbol, startdate, enddate))
+        return make_prices(startdate, enddate)
+
+
+def test_symbol_data_read_from_store(tmp_path):
+    fetcher = RangeFetcher()
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+    df = store.get_symbol_data('AAPL', '2020-01-01', '2020-03-31')
+    pd.testing.assert_frame_equal(df, make_prices('2020-01-01', '2020-03-31'), check_dtype=False)
+    assert store.covered_range('AAPL') == ('2020-01-01', '2020-03-31')
+
+    # within the stored range: read from the store (as another process would), not downloaded
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+    df = store.get_symbol_data('AAPL', '2020-02-03', '2020-02-07')
+    assert len(fetcher.calls) == 1
+    assert list(df['TimeStamp']) == list(pd.date_range('2020-02-03', '2020-02-07'))
+    np.testing.assert_array_equal(df['Close'], [24., 25., 26., 27., 28.])
+
+
+def test_only_missing_ranges_downloaded(tmp_path):
+    assert plan_missing_ranges(None, '2020-01-01', '2020-03-31') == [('2020-01-01', '2020-03-31')]
+    assert plan_missing_ranges(('2020-02-01', '2020-02-29'), '2020-02-03', '2020-02-28') == []
+
+    fetcher = RangeFetcher()
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+    store.get_symbol_data('AAPL', '2020-02-01', '2020-02-29')
+    # the head and the tail around what is stored
+    df = store.get_symbol_data('AAPL', '2020-01-01', '2020-03-31')
+    assert fetcher.calls[1:] == [('AAPL', '2020-01-01', '2020-01-31'), ('AAPL', '2020-03-01', '2020-03-31')]
+    assert list(df['TimeStamp']) == list(pd.date_range('2020-01-01', '2020-03-31', freq='B'))
+    assert store.covered_range('AAPL') == ('2020-01-01', '2020-03-31')
+
+
+def test_store_and_read_columns(tmp_path):
+    store = PriceStore(storedir=str(tmp_path), fetcher=None)
+    store.store('AAPL', make_prices('2020-01-01', '2020-01-31'), '2020-01-01', '2020-01-31')
+    # appended after the stored dates, then merged into them
+    store.store('AAPL', make_prices('2020-02-01', '2020-02-29', start=100.), '2020-02-01', '2020-02-29')
+    store.store('AAPL', make_prices('2020-01-15', '2020-02-05', start=1000.), '2020-01-15', '2020-02-05')
+    assert store.covered_range('AAPL') == ('2020-01-01', '2020-02-29')
+
+    # one file per field, holding only that field
+    nbrows = len(pd.date_range('2020-01-01', '2020-02-29', freq='B'))
+    fieldfiles = sorted(filename for filename in os.listdir(str(tmp_path)) if filename.startswith('AAPL.') and
+                        not filename.endswith(('.json', '.lock')))
+    assert len(fieldfiles) == len(PRICE_COLUMNS) + 1
+    assert all(os.path.getsize(os.path.join(str(tmp_path), filename)) == 8 * nbrows for filename in fieldfiles)
+
+    closes = store.read_columns('AAPL', '2020-01-13', '2020-01-17')['Close']
+    assert isinstance(closes, np.memmap)
+    np.testing.assert_array_equal(closes, [9., 10., 1000., 1001., 1002.])
+
+    df = store.read('AAPL', '2020-01-01', '2020-02-29')
+    assert len(df) == nbrows
+    assert df['TimeStamp'].is_monotonic_increasing
+    assert list(df.columns) == ['TimeStamp'] + PRICE_COLUMNS
+    assert df.loc[df['TimeStamp'] == '2020-02-28', 'Volume'].item() == 100. * 119.
+
+
+class OutageThenDataFetcher:
+    # empty frame on the first call (as finsim gives on an outage), prices afterwards
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, startdate, enddate):
+        self.calls.append((symbol, startdate, enddate))
+        if len(self.calls) == 1:
+            return pd.DataFrame()
+        timestamps = pd.date_range(startdate, enddate, freq='B')
+        return pd.DataFrame({
+            'TimeStamp': timestamps,
+            'Open': 1., 'High': 1., 'Low': 1., 'Close': 1., 'Adj Close': 1., 'Volume': 100.
+        })
+
+
+def test_empty_fetch_not_stored(tmp_path):
+    fetcher = OutageThenDataFetcher()
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher, recent_ttl=0.)
+
+    df = store.get_symbol_data('AAPL', '2020-01-01', '2020-01-31')
+    assert len(df) == 0
+    assert store.covered_range('AAPL') is None
+
+    df = store.get_symbol_data('AAPL', '2020-01-01', '2020-01-31')
+    assert len(fetcher.calls) == 2
+    assert len(df) == len(pd.date_range('2020-01-01', '2020-01-31', freq='B'))
+    assert store.covered_range('AAPL') == ('2020-01-01', '2020-01-31')
+
+    # covered now: served from disk
+    store.get_symbol_data('AAPL', '2020-01-06', '2020-01-20')
+    assert len(fetcher.calls) == 2
+
+
+def test_weekend_range_not_downloaded():
+    # 2020-01-04 and 2020-01-05: Saturday and Sunday
+    assert plan_missing_ranges(('2019-12-01', '2020-01-03'), '2019-12-01', '2020-01-05') == []
+    assert plan_missing_ranges(('2019-12-01', '2020-01-03'), '2019-12-01', '2020-01-06') == [('2020-01-04', '2020-01-06')]
+
+
+class DailyFetcher:
+    # bars of every calendar day (today's included), or nothing
+    def __init__(self, empty=False):
+        self.empty = empty
+        self.calls = []
+
+    def __call__(self, symbol, startdate, enddate):
+        self.calls.append((symbol, startdate, enddate))
+        if self.empty:
+            return pd.DataFrame()
+        return make_prices_of_days(pd.date_range(startdate, enddate, freq='D'))
+
+
+def make_prices_of_days(timestamps):
+    values = np.arange(1., len(timestamps) + 1.)
+    return pd.DataFrame({
+        'TimeStamp': timestamps,
+        'Open': values, 'High': values, 'Low': values, 'Close': values, 'Adj Close': values, 'Volume': values
+    })
+
+
+def test_range_ending_today_downloaded_once(tmp_path):
+    today = shift_datestr(get_last_complete_date(), 1)
+    startdate = shift_datestr(today, -30)
+    fetcher = DailyFetcher()
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+
+    df = store.get_symbol_data('AAPL', startdate, today)
+    assert len(df) == 31
+    # stored up to yesterday; today's bar only given from the recent download
+    assert store.covered_range('AAPL') == (startdate, get_last_complete_date())
+    for _ in range(3):
+        df = store.get_symbol_data('AAPL', startdate, today)
+        assert len(df) == 31
+        assert df['TimeStamp'].iloc[-1] == pd.Timestamp(today)
+    assert len(fetcher.calls) == 1
+
+    # today alone is never downloaded
+    store = PriceStore(storedir=str(tmp_path / 'other'), fetcher=fetcher)
+    assert len(store.get_symbol_data('MSFT', today, today)) == 0
+    assert len(fetcher.calls) == 1
+
+
+def test_empty_fetch_remembered(tmp_path):
+    fetcher = DailyFetcher(empty=True)
+    store = PriceStore(storedir=str(tmp_path), fetcher=fetcher)
+    for _ in range(3):
+        assert len(store.get_symbol_data('DLSTD', '2020-01-01', '2020-01-31')) == 0
+    # within the range downloaded lately as well
+    assert len(store.get_symbol_data('DLSTD', '2020-01-06', '2020-01-10')) == 0
+    assert len(fetcher.calls) == 1
+    assert store.covered_range('DLSTD') is None
@@ -0,0 +1,34 @@
+
+import os
+import time
+
+from finportutils.resultcache import ResultCache, make_cache_key, normalize_date, normalize_float
+
+
+def test_cache_key_of_equivalent_queries():
+    query = {'rf': normalize_float(0.1 + 0.2), 'presetdate': normalize_date('2020-01-02'), 'symbols': ['AAPL']}
+    same_query = {'symbols': ['AAPL'], 'presetdate': normalize_date('2020-01-02T00:00'), 'rf': normalize_float(0.3)}
+    assert make_cache_key(query) == make_cache_key(same_query)
+    assert make_cache_key(query) != make_cache_key(dict(query, symbols=['MSFT']))
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(cachedir=str(tmp_path), ttl=3600., maxentries=2)
+    assert cache.get('a') is None
+    cache.put('a', {'x': [1., 2.]})
+    assert cache.get('a') == {'x': [1., 2.]}
+
+    # beyond maxentries, the least recently used evicted
+    past = time.time() - 10.
+    os.utime(os.path.join(str(tmp_path), 'a.json'), (past, past))
+    cache.put('b', 2)
+    assert cache.get('a') is not None    # used: now the most recent
+    os.utime(os.path.join(str(tmp_path), 'b.json'), (past, past))
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') == 3
+
+    # expired after ttl
+    cache = ResultCache(cachedir=str(tmp_path), ttl=0., maxentries=2)
+    assert cache.get('c') is None
@@ -0,0 +1,32 @@
+
+import numpy as np
+import pandas as pd
+
+from finportutils.valuation import cumulate_dividends, compute_effective_prices, compute_portfolio_values_overtime
+
+
+def test_portfolio_values_overtime():
+    timestamps = np.array(['2020-01-02', '2020-01-03', '2020-01-06', '2020-01-07'], dtype='datetime64[D]')
+    pricematrix = np.array([[10., 20.], [11., 20.], [12., np.nan], [13., 22.]])
+    dividends = {
+        # one paid before the start date, one on a trading date, one on a weekend
+        'AAA': (np.array(['2019-12-31', '2020-01-03', '2020-01-05'], dtype='datetime64[D]'), np.array([5., 1., 2.])),
+        'BBB': (np.zeros(0, dtype='datetime64[D]'), np.zeros(0))
+    }
+
+    np.testing.assert_array_equal(cumulate_dividends(timestamps, *dividends['AAA']), [5., 6., 8., 8.])
+    cash = cumulate_dividends(timestamps, *dividends['AAA'], startdate='2020-01-02')
+    np.testing.assert_array_equal(cash, [0., 1., 3., 3.])
+    effprices = compute_effective_prices(timestamps, pricematrix, ['AAA', 'BBB'], dividends)
+    np.testing.assert_array_equal(effprices[:, 0], [15., 17., 20., 21.])
+
+    worthdf = compute_portfolio_values_overtime(
+        timestamps, pricematrix, ['AAA', 'BBB'], {'AAA': 2., 'BBB': 1.}, dividends, '2020-01-02'
+    )
+    assert list(worthdf.columns) == ['TimeStamp', 'stock_value', 'dividend', 'cash', 'value']
+    assert list(worthdf['TimeStamp']) == ['2020-01-02', '2020-01-03', '2020-01-06', '2020-01-07']
+    np.testing.assert_array_equal(worthdf['stock_value'], [40., 42., 24., 48.])
+    np.testing.assert_array_equal(worthdf['dividend'], [0., 2., 0., 0.])
+    np.testing.assert_array_equal(worthdf['cash'], [0., 2., 6., 6.])
+    np.testing.assert_array_equal(worthdf['value'], worthdf['stock_value'] + worthdf['cash'])
+    assert isinstance(worthdf, pd.DataFrame)